@@ -0,0 +1,220 @@
+import os, time, math, asyncio, threading, logging
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional
+from backend.agents import pending_store
+
+logger = logging.getLogger("backend.agents.admission")
+
+# Max concurrent graph runs per model backend (ADMISSION_MAX_CONCURRENCY overrides all).
+BACKEND_CONCURRENCY = {
+    "transformers": int(os.getenv("GEN_MAX_BATCH", "8")),
+    "hf-router": int(os.getenv("LLM_MAX_IN_FLIGHT", "16")),
+    "hf-inference-api": int(os.getenv("LLM_MAX_IN_FLIGHT", "16")),
+}
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "4"))
+PENDING_TTL_S = float(os.getenv("PENDING_TTL_S", "60"))
+
+
+class Saturated(Exception):
+    """Raised at admission time; the API maps it to 429 + Retry-After."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, user_id: str, on_position: Optional[Callable[[int, int], None]]):
+        self.user_id = user_id
+        self.on_position = on_position
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.position = 0
+
+
+class AdmissionController:
+    """Bounded, per-user fair admission in front of the graph runs of one backend.
+
+    ``admit`` is called when a stream is requested: it rejects with Saturated
+    once the pending + queued backlog (overall or for one user) is full.
+    ``slot`` is held for the duration of a graph run: at most
+    ``max_concurrency`` runs proceed, the rest wait in per-user FIFOs served
+    round-robin, and waiters are told their queue position as it changes.
+    Pending (admitted but not yet streamed) tokens live in a pending store,
+    shared between worker processes by default, and expire after
+    ``pending_ttl_s``. ``admit`` and ``claim`` only touch the store and the
+    counters, so they may run in worker threads; the slot methods run on the
+    event loop thread. ``admit`` checks the limits and inserts the token in
+    one atomic store step. Counters and queues are read and updated under
+    ``_lock``, which is only ever taken inside a store step, never around
+    one, and never across an await.
+    """
+
+    def __init__(
+        self, max_concurrency: int, max_queue: int = ADMISSION_MAX_QUEUE,
+        max_per_user: int = ADMISSION_MAX_PER_USER, pending_ttl_s: float = PENDING_TTL_S,
+        store=None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.pending_ttl_s = pending_ttl_s
+        self.active = 0
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._n_queued = 0
+        self.store = store if store is not None else pending_store.make_store()
+        self._run_s = 5.0   # EWMA of one run's duration, for Retry-After
+        self.admitted = self.rejected = self.expired = 0
+        self._lock = threading.RLock()
+
+    # -- admission ----------------------------------------------------------
+
+    def queued(self) -> int:
+        return self._n_queued
+
+    def retry_after(self, pending: int = 0) -> int:
+        backlog = self.queued() + pending + 1
+        return max(1, math.ceil(self._run_s * backlog / self.max_concurrency))
+
+    def sweep(self) -> int:
+        """Drop expired pending tokens and count them."""
+        expired = self.store.evict_expired()
+        with self._lock:
+            self.expired += expired
+        return expired
+
+    def admit(self, token: str, user_id: str, payload: dict):
+        self.sweep()
+
+        def room(pending: int, mine: int) -> Optional[str]:
+            # runs inside the store's atomic count-and-insert
+            with self._lock:
+                if self._n_queued + pending >= self.max_queue:
+                    return "queue_full"
+                if mine + len(self._queues.get(user_id, ())) >= self.max_per_user:
+                    return "user_limit"
+            return None
+
+        reason, pending = self.store.put_if_room(token, user_id, payload, self.pending_ttl_s, room)
+        with self._lock:
+            if reason is not None:
+                self.rejected += 1
+                raise Saturated(reason, self.retry_after(pending))
+            self.admitted += 1
+
+    def claim(self, token: str) -> Optional[dict]:
+        """Take the payload of an admitted token; None if unknown, claimed or expired."""
+        return self.store.claim(token)
+
+    # -- concurrency slots --------------------------------------------------
+
+    def _order(self):
+        """Waiters in the order they will be granted (round-robin over users)."""
+        queues = [list(q) for q in self._queues.values()]
+        out = []
+        for i in range(max((len(q) for q in queues), default=0)):
+            out.extend(q[i] for q in queues if i < len(q))
+        return out
+
+    def _notify(self):
+        order = self._order()
+        for pos, w in enumerate(order, start=1):
+            if w.position != pos:
+                w.position = pos
+                if w.on_position:
+                    w.on_position(pos, len(order))
+
+    def _dispatch(self):
+        # caller holds _lock
+        while self.active < self.max_concurrency and self._queues:
+            user_id, q = next(iter(self._queues.items()))
+            w = q.popleft()
+            self._n_queued -= 1
+            if q:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if w.future.done():  # cancelled while queued
+                continue
+            self.active += 1
+            w.future.set_result(None)
+        self._notify()
+
+    async def acquire(self, user_id: str, on_position: Optional[Callable[[int, int], None]] = None):
+        with self._lock:
+            if self.active < self.max_concurrency and not self._queues:
+                self.active += 1
+                return
+            w = _Waiter(user_id, on_position)
+            self._queues.setdefault(user_id, deque()).append(w)
+            self._n_queued += 1
+            self._notify()
+        try:
+            await w.future
+        except asyncio.CancelledError:
+            if w.future.done() and not w.future.cancelled():
+                self.release()  # granted and cancelled in the same tick
+            else:
+                with self._lock:
+                    q = self._queues.get(user_id)
+                    if q and w in q:
+                        q.remove(w)
+                        self._n_queued -= 1
+                        if not q:
+                            del self._queues[user_id]
+                    self._notify()
+            raise
+
+    def release(self, run_s: Optional[float] = None):
+        with self._lock:
+            if run_s is not None:
+                self._run_s = 0.8 * self._run_s + 0.2 * run_s
+            self.active -= 1
+            self._dispatch()
+
+    def slot(self, user_id: str, on_position: Optional[Callable[[int, int], None]] = None):
+        return _Slot(self, user_id, on_position)
+
+    def stats(self) -> Dict:
+        self.sweep()
+        pending, _ = self.store.counts("")
+        with self._lock:
+            return {
+                "active": self.active,
+                "max_concurrency": self.max_concurrency,
+                "queued": self.queued(),
+                "pending": pending,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "avg_run_s": round(self._run_s, 3),
+            }
+
+
+class _Slot:
+    def __init__(self, ctrl: AdmissionController, user_id: str, on_position):
+        self.ctrl, self.user_id, self.on_position = ctrl, user_id, on_position
+
+    async def __aenter__(self):
+        await self.ctrl.acquire(self.user_id, self.on_position)
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.ctrl.release(time.monotonic() - self.start)
+
+
+_controllers: Dict[str, AdmissionController] = {}
+
+
+def get_controller(backend: str) -> AdmissionController:
+    """One controller per model backend per process."""
+    ctrl = _controllers.get(backend)
+    if ctrl is None:
+        limit = ADMISSION_MAX_CONCURRENCY or BACKEND_CONCURRENCY.get(backend, 4)
+        ctrl = _controllers[backend] = AdmissionController(limit)
+        logger.info("Admission controller for %s: max_concurrency=%d max_queue=%d", backend, limit, ctrl.max_queue)
+    return ctrl
@@ -0,0 +1,169 @@
+import os, time, hashlib, threading, logging
+from typing import Dict, Iterable, List, Optional
+from backend.agents import db
+from backend.models.embedding_cache import normalize_query
+
+logger = logging.getLogger("backend.answer_cache")
+
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "true").lower() == "true"
+ANSWER_CACHE_TTL_S = int(os.getenv("ANSWER_CACHE_TTL_S", "86400"))
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "5000"))
+# TTL/LRU sweep every N puts, or sooner once the estimated row count passes ANSWER_CACHE_MAX
+ANSWER_CACHE_EVICT_EVERY = int(os.getenv("ANSWER_CACHE_EVICT_EVERY", "100"))
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS answer_cache (
+      cache_key TEXT PRIMARY KEY,
+      agent TEXT NOT NULL,
+      answer TEXT NOT NULL,
+      gen_seconds REAL,
+      created_at REAL NOT NULL,
+      last_used_at REAL NOT NULL,
+      hits INTEGER DEFAULT 0
+    )""",
+    "CREATE TABLE IF NOT EXISTS answer_cache_docs (cache_key TEXT NOT NULL, doc_id TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_answer_cache_docs_doc ON answer_cache_docs(doc_id)",
+    "CREATE INDEX IF NOT EXISTS idx_answer_cache_docs_key ON answer_cache_docs(cache_key)",
+    "CREATE INDEX IF NOT EXISTS idx_answer_cache_created ON answer_cache(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_answer_cache_last_used ON answer_cache(last_used_at)",
+)
+SELECT_SQL = "SELECT answer,gen_seconds,created_at FROM answer_cache WHERE cache_key=?"
+TOUCH_SQL = "UPDATE answer_cache SET last_used_at=?, hits=hits+1 WHERE cache_key=?"
+UPSERT_SQL = "INSERT OR REPLACE INTO answer_cache(cache_key,agent,answer,gen_seconds,created_at,last_used_at,hits) VALUES (?,?,?,?,?,?,0)"
+DOCS_DELETE_SQL = "DELETE FROM answer_cache_docs WHERE cache_key=?"
+DOCS_INSERT_SQL = "INSERT INTO answer_cache_docs(cache_key,doc_id) VALUES (?,?)"
+DELETE_SQL = "DELETE FROM answer_cache WHERE cache_key=?"
+
+_schema_ready = set()
+_lock = threading.Lock()
+_rows: Dict[str, int] = {}          # DB_PATH -> estimated row count (upper bound between sweeps)
+_puts_since_evict: Dict[str, int] = {}
+_stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0, "invalidated": 0, "evicted": 0}
+
+
+def _ensure_schema():
+    path = db.DB_PATH
+    if path in _schema_ready:
+        return
+    with _lock:
+        if path not in _schema_ready:
+            for stmt in SCHEMA:
+                db.execute(stmt)
+            _schema_ready.add(path)
+
+
+def model_identity(llm) -> str:
+    """Backend and model id of an LLM, so a model change never serves older answers."""
+    return f"{getattr(llm, 'backend', '')}:{getattr(llm, 'model_id', type(llm).__name__)}"
+
+
+def make_key(agent: str, question: str, doc_ids: Iterable[str], model: str = "") -> str:
+    """Hash of (agent, model identity, normalized question, ordered retrieved doc_ids)."""
+    payload = "\x1f".join([agent, model, normalize_query(question), *doc_ids])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[str]:
+    if not ANSWER_CACHE:
+        return None
+    _ensure_schema()
+    row = db.query_one(SELECT_SQL, (key,))
+    now = time.time()
+    if row is None or now - row[2] > ANSWER_CACHE_TTL_S:
+        if row is not None:
+            _delete(key)
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    db.execute(TOUCH_SQL, (now, key))
+    with _lock:
+        _stats["hits"] += 1
+        _stats["saved_seconds"] += row[1] or 0.0
+    return row[0]
+
+
+def put(key: str, agent: str, answer: str, doc_ids: List[str], gen_seconds: float):
+    if not ANSWER_CACHE or not answer.strip():
+        return
+    _ensure_schema()
+    now = time.time()
+    with db.transaction() as con:
+        con.execute(UPSERT_SQL, (key, agent, answer, gen_seconds, now, now))
+        con.execute(DOCS_DELETE_SQL, (key,))
+        con.executemany(DOCS_INSERT_SQL, [(key, d) for d in doc_ids])
+    if _due_for_eviction():
+        _evict()
+
+
+def _due_for_eviction() -> bool:
+    path = db.DB_PATH
+    with _lock:
+        n = _puts_since_evict[path] = _puts_since_evict.get(path, 0) + 1
+        if path in _rows:
+            _rows[path] += 1  # replaces overcount, which only brings the sweep forward
+        if path not in _rows or _rows[path] > ANSWER_CACHE_MAX or n >= ANSWER_CACHE_EVICT_EVERY:
+            _puts_since_evict[path] = 0
+            return True
+    return False
+
+
+def _delete(key: str):
+    with db.transaction() as con:
+        con.execute(DELETE_SQL, (key,))
+        con.execute(DOCS_DELETE_SQL, (key,))
+
+
+def _evict():
+    """Expire by TTL, then drop least recently used rows beyond ANSWER_CACHE_MAX."""
+    cutoff = time.time() - ANSWER_CACHE_TTL_S
+    with db.transaction() as con:
+        expired = [r[0] for r in con.execute("SELECT cache_key FROM answer_cache WHERE created_at < ?", (cutoff,))]
+        total = con.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0]
+        excess = total - len(expired) - ANSWER_CACHE_MAX
+        if excess > 0:
+            expired += [r[0] for r in con.execute(
+                "SELECT cache_key FROM answer_cache WHERE created_at >= ? ORDER BY last_used_at ASC LIMIT ?",
+                (cutoff, excess),
+            )]
+        for key in expired:
+            con.execute(DELETE_SQL, (key,))
+            con.execute(DOCS_DELETE_SQL, (key,))
+    with _lock:
+        _rows[db.DB_PATH] = total - len(expired)
+        _stats["evicted"] += len(expired)
+
+
+def invalidate_docs(doc_ids: Iterable[str]) -> int:
+    """Drop every cached answer built from any of doc_ids (called after re-ingest)."""
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return 0
+    _ensure_schema()
+    removed = 0
+    with db.transaction() as con:
+        for i in range(0, len(doc_ids), 500):
+            chunk = doc_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            keys = [r[0] for r in con.execute(
+                f"SELECT DISTINCT cache_key FROM answer_cache_docs WHERE doc_id IN ({marks})", chunk
+            )]
+            for key in keys:
+                removed += con.execute(DELETE_SQL, (key,)).rowcount
+                con.execute(DOCS_DELETE_SQL, (key,))
+    if removed and db.DB_PATH in _rows:
+        with _lock:
+            _rows[db.DB_PATH] = max(0, _rows[db.DB_PATH] - removed)
+    if removed:
+        logger.info("Invalidated %d cached answer(s) for %d re-ingested doc(s)", removed, len(doc_ids))
+        with _lock:
+            _stats["invalidated"] += removed
+    return removed
+
+
+def stats() -> dict:
+    with _lock:
+        out = dict(_stats)
+    total = out["hits"] + out["misses"]
+    out["hit_rate"] = round(out["hits"] / total, 4) if total else 0.0
+    out["saved_seconds"] = round(out["saved_seconds"], 3)
+    return out
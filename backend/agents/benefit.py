@@ -2,6 +2,7 @@ import time
 from langchain.prompts import PromptTemplate
 from .retrieval import BenefitRetriever
 from backend.logging_setup import setup_logging
+from backend.agents import answer_cache
 
 
 logger = setup_logging("BenefitAgent")
@@ -21,14 +22,33 @@ class BenefitAgent:
         self.ret = BenefitRetriever()
         self.model_name = getattr(getattr(llm, '__class__', object), '__name__', 'LLM')
         self.quant = None
+        self.cache_model = answer_cache.model_identity(llm)
+        if hasattr(llm, "register_prefix"):
+            llm.register_prefix(BENEFIT_PROMPT.template)  # reuse the fixed header's KV cache
         logger.info("BenefitAgent initialized")
 
 
-    def run(self, q: str, session_id: str, user_id: str):
+    def run(self, q: str, session_id: str, user_id: str, on_token=None, retrieved=None):
         start_ts = time.time()
         logger.info("BenefitAgent.run start session=%s user=%s", session_id, user_id)
-        ctx, prov = self.ret.search(q, k=20, final_k=5)
+        # retrieved: (context, provenance) precomputed by a multi-collection search
+        ctx, prov = retrieved if retrieved is not None else self.ret.search(q, k=20, final_k=5, user_id=user_id)
+        doc_ids = [p["doc_id"] for p in prov]
+        cache_key = answer_cache.make_key("benefit", q, doc_ids, self.cache_model)
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            logger.info("BenefitAgent.run answer cache hit in %.2fs", time.time()-start_ts)
+            return {"answer": cached, "provenance":[{"agent":"benefit","model":self.model_name,"quant":self.quant,"sources":prov,"cache":"hit"}]}
         prompt = BENEFIT_PROMPT.format(question=q, context=ctx)
-        out = "".join(self.llm.stream(prompt))
+        gen_ts = time.time()
+        parts = []
+        for ch in self.llm.stream(prompt):
+            parts.append(ch)
+            if on_token is not None:
+                on_token(ch)
+        out = "".join(parts)
+        answer_cache.put(cache_key, "benefit", out, doc_ids, time.time()-gen_ts)
         logger.info("BenefitAgent.run completed in %.2fs", time.time()-start_ts)
         return {"answer": out, "provenance":[{"agent":"benefit","model":self.model_name,"quant":self.quant,"sources":prov}]}
\ No newline at end of file
@@ -1,34 +1,275 @@
-import sqlite3, os, uuid, json, logging
-DB_PATH = os.getenv("DB_PATH","backend/db/app.db")
+import os, uuid, json, time, queue, threading, atexit, logging
+from collections import OrderedDict
+from typing import Dict, Optional
+from backend.agents import db
+from backend.metrics import CHECKPOINT_WRITE_SECONDS
 logger = logging.getLogger("backend.ckpt_store")
 
+INSERT_SQL = "INSERT INTO checkpoints(checkpoint_id,user_id,session_id,pending_agent,pending_question,context_snapshot) VALUES (?,?,?,?,?,?)"
+SELECT_SQL = "SELECT checkpoint_id,user_id,session_id,pending_agent,pending_question,context_snapshot FROM checkpoints WHERE checkpoint_id=?"
+DELETE_SQL = "DELETE FROM checkpoints WHERE checkpoint_id=?"
+CHILDREN_SQL = "SELECT checkpoint_id,context_snapshot FROM checkpoints WHERE session_id=? AND context_snapshot LIKE ?"
+UPDATE_SNAPSHOT_SQL = "UPDATE checkpoints SET context_snapshot=? WHERE checkpoint_id=?"
+LATEST_FULL_SQL = (
+    "SELECT context_snapshot FROM checkpoints WHERE session_id=? AND context_snapshot NOT LIKE ? "
+    "ORDER BY created_at DESC, rowid DESC LIMIT 1"
+)
+KEYS = ["checkpoint_id","user_id","session_id","pending_agent","pending_question","context_snapshot"]
+
+WRITE_BEHIND = os.getenv("CKPT_WRITE_BEHIND", "true").lower() == "true"
+BATCH_SIZE = int(os.getenv("CKPT_BATCH_SIZE", "64"))
+FLUSH_MS = int(os.getenv("CKPT_FLUSH_MS", "50"))
+FULL_EVERY = int(os.getenv("CKPT_FULL_EVERY", "8"))  # max delta chain length before a full snapshot
+SESSION_CACHE = int(os.getenv("CKPT_SESSION_CACHE", "1024"))
+RETRIES = int(os.getenv("CKPT_RETRIES", "3"))  # extra attempts for a failed batch
+RETRY_BACKOFF_S = float(os.getenv("CKPT_RETRY_BACKOFF_MS", "50")) / 1000
+
+DELTA_KEY = "__delta__"
+
+# ---------------------------
+# Write-behind queue
+# ---------------------------
+_queue: "queue.Queue[tuple]" = queue.Queue()
+_pending: Dict[str, tuple] = {}          # ckpt_id -> row not yet flushed, so get() sees it
+_pending_lock = threading.Lock()
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+# session_id -> (ckpt_id, full state dict, chain depth) of the session's newest snapshot
+# confirmed on disk; deltas are only ever taken against it, never against a queued row.
+_last: "OrderedDict[str, tuple]" = OrderedDict()
+_last_lock = threading.Lock()
+# ckpt_id -> (session_id, full state dict, chain depth) of snapshots queued but not yet written
+_unconfirmed: Dict[str, tuple] = {}
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name="ckpt-writer", daemon=True)
+            _writer.start()
+
+
+def _write_loop():
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + FLUSH_MS / 1000
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            for attempt in range(RETRIES + 1):
+                try:
+                    _apply(batch)
+                    break
+                except Exception as e:
+                    if attempt == RETRIES:
+                        raise
+                    logger.warning("Checkpoint batch flush failed (attempt %d), retrying: %s", attempt + 1, e)
+                    time.sleep(RETRY_BACKOFF_S * 2 ** attempt)
+        except Exception as e:
+            logger.exception("Checkpoint batch flush failed (%d ops), dropping it: %s", len(batch), e)
+            _drop(batch)
+        finally:
+            for op in batch:
+                if op[0] == "flush":
+                    op[1].set()
+
+
+def _apply(ops):
+    """Write a batch of queued inserts in one transaction."""
+    written = [op[1][0] for op in ops if op[0] == "insert"]
+    if not written:
+        return  # a bare flush marker never opens the database
+    with CHECKPOINT_WRITE_SECONDS.time(), db.transaction() as con:
+        for op in ops:
+            if op[0] == "insert":
+                con.execute(INSERT_SQL, op[1])
+    with _pending_lock:
+        for ckpt_id in written:
+            _pending.pop(ckpt_id, None)
+    _confirm(written)
+    if written:
+        logger.debug("Flushed %d checkpoint(s) in one transaction", len(written))
+
+
+def _confirm(written):
+    """Written rows become the delta base of their session (batches are applied in order)."""
+    with _last_lock:
+        for ckpt_id in written:
+            cand = _unconfirmed.pop(ckpt_id, None)
+            if cand is None:
+                continue
+            session_id, state, depth = cand
+            _last[session_id] = (ckpt_id, state, depth)
+            _last.move_to_end(session_id)
+        while len(_last) > SESSION_CACHE:
+            _last.popitem(last=False)
+
+
+def _drop(ops):
+    """Forget rows of a batch that could not be written; no delta refers to them."""
+    dropped = [op[1][0] for op in ops if op[0] == "insert"]
+    with _pending_lock:
+        for ckpt_id in dropped:
+            _pending.pop(ckpt_id, None)
+    with _last_lock:
+        for ckpt_id in dropped:
+            _unconfirmed.pop(ckpt_id, None)
+
+
+def _submit(op):
+    if WRITE_BEHIND:
+        _ensure_writer()
+        _queue.put(op)
+    else:
+        try:
+            _apply([op])
+        except Exception:
+            _drop([op])
+            raise
+
+
+def flush(timeout: float = 5.0):
+    """Block until everything queued so far is written."""
+    if not WRITE_BEHIND:
+        return
+    _ensure_writer()
+    done = threading.Event()
+    _queue.put(("flush", done))
+    done.wait(timeout)
+
+
+atexit.register(flush)
+
+
+# ---------------------------
+# Snapshots
+# ---------------------------
+
+def _delta(prev: dict, cur: dict) -> dict:
+    """Fields changed since prev; provenance is stored as the appended tail only."""
+    changed = {k: v for k, v in cur.items() if k != "provenance" and prev.get(k) != v}
+    out = {"set": changed}
+    old_p, new_p = prev.get("provenance") or [], cur.get("provenance") or []
+    if len(new_p) >= len(old_p) and new_p[:len(old_p)] == old_p:
+        out["prov_append"] = new_p[len(old_p):]
+    else:
+        out["set"]["provenance"] = new_p
+    return out
+
+
+def _materialize(con, snapshot: str, depth: int = 0) -> str:
+    """Rebuild the full JSON snapshot from a (possibly delta) stored one."""
+    obj = json.loads(snapshot)
+    if not isinstance(obj, dict) or DELTA_KEY not in obj:
+        return snapshot
+    d = obj[DELTA_KEY]
+    base_row = _row(con, d["base"])
+    if base_row is None or depth > FULL_EVERY + 1:
+        raise LookupError(f"checkpoint base {d['base']} missing")
+    full = json.loads(_materialize(con, base_row[5], depth + 1))
+    full.update(d.get("set", {}))
+    full["provenance"] = (full.get("provenance") or []) + d.get("prov_append", [])
+    return json.dumps(full)
+
+
+def _row(con, ckpt_id):
+    with _pending_lock:
+        row = _pending.get(ckpt_id)
+    if row is not None:
+        return row
+    return con.execute(SELECT_SQL, (ckpt_id,)).fetchone()
+
+
+def _delete_now(con, ckpt_id):
+    row = con.execute(SELECT_SQL, (ckpt_id,)).fetchone()
+    if row is None:
+        return
+    # Children that store a delta against this row become full snapshots first.
+    pattern = f'%"base": "{ckpt_id}"%'
+    for child_id, child_snap in con.execute(CHILDREN_SQL, (row[2], pattern)).fetchall():
+        con.execute(UPDATE_SNAPSHOT_SQL, (_materialize(con, child_snap), child_id))
+    con.execute(DELETE_SQL, (ckpt_id,))
+
+
+def _latest_full(con, session_id) -> Optional[str]:
+    row = con.execute(LATEST_FULL_SQL, (session_id, f'{{"{DELTA_KEY}"%')).fetchone()
+    return row[0] if row else None
+
+
+def save_state(user_id, session_id, pending_agent, pending_question, state: dict):
+    """Checkpoint a GraphState dict, storing only what changed since the session's
+    newest checkpoint that is already on disk (a full snapshot when there is none)."""
+    ckpt_id = uuid.uuid4().hex
+    with _last_lock:
+        prev = _last.get(session_id)
+        if prev is not None and prev[2] < FULL_EVERY:
+            snapshot = json.dumps({DELTA_KEY: dict(base=prev[0], **_delta(prev[1], state))})
+            depth = prev[2] + 1
+        else:
+            snapshot, depth = json.dumps(state), 0
+        _unconfirmed[ckpt_id] = (session_id, state, depth)
+    logger.info("Creating checkpoint session=%s user=%s pending_agent=%s delta=%s", session_id, user_id, pending_agent, depth > 0)
+    _insert((ckpt_id, user_id, session_id, pending_agent, pending_question, snapshot))
+    return {"checkpoint_id": ckpt_id}
+
+
+def _insert(row):
+    with _pending_lock:
+        _pending[row[0]] = row
+    _submit(("insert", row))
+
+
+# ---------------------------
+# Public API
+# ---------------------------
+
 def create(user_id, session_id, pending_agent, pending_question, context_snapshot):
     logger.info("Creating checkpoint session=%s user=%s pending_agent=%s", session_id, user_id, pending_agent)
-    con = sqlite3.connect(DB_PATH)
     ckpt_id = uuid.uuid4().hex
-    con.execute("INSERT INTO checkpoints(checkpoint_id,user_id,session_id,pending_agent,pending_question,context_snapshot) VALUES (?,?,?,?,?,?)",
-                (ckpt_id, user_id, session_id, pending_agent, pending_question, context_snapshot))
-    con.commit(); con.close()
+    _insert((ckpt_id, user_id, session_id, pending_agent, pending_question, context_snapshot))
     return {"checkpoint_id": ckpt_id}
 
 def get(ckpt_id):
     logger.info("Retrieving checkpoint %s", ckpt_id)
-    con = sqlite3.connect(DB_PATH)
-    row = con.execute("SELECT checkpoint_id,user_id,session_id,pending_agent,pending_question,context_snapshot FROM checkpoints WHERE checkpoint_id=?",(ckpt_id,)).fetchone()
-    con.close()
+    con = db.connect()
+    row = _row(con, ckpt_id)
     if not row: return None
-    keys = ["checkpoint_id","user_id","session_id","pending_agent","pending_question","context_snapshot"]
-    return dict(zip(keys,row))
+    out = dict(zip(KEYS,row))
+    try:
+        out["context_snapshot"] = _materialize(con, out["context_snapshot"])
+    except LookupError as e:
+        # A broken delta chain (e.g. a base lost in a failed flush): resume from the
+        # session's newest full snapshot rather than failing the request.
+        full = _latest_full(con, out["session_id"])
+        if full is None:
+            logger.error("Checkpoint %s unreadable and session has no full snapshot: %s", ckpt_id, e)
+            return None
+        logger.warning("Checkpoint %s unreadable (%s); using newest full snapshot of session %s", ckpt_id, e, out["session_id"])
+        out["context_snapshot"] = full
+    return out
 
 def delete(ckpt_id):
     logger.info("Deleting checkpoint %s", ckpt_id)
-    con = sqlite3.connect(DB_PATH); con.execute("DELETE FROM checkpoints WHERE checkpoint_id=?",(ckpt_id,)); con.commit(); con.close()
+    # Rare (resume only): drain queued inserts, then delete synchronously so
+    # delta children can be rebased against rows that are really on disk.
+    flush()
+    with _last_lock:
+        for sid, last in list(_last.items()):
+            if last[0] == ckpt_id:
+                del _last[sid]
+        _unconfirmed.pop(ckpt_id, None)
+    with db.transaction() as con:
+        _delete_now(con, ckpt_id)
 
 def put(user_id, session_id, pending_agent, pending_question, context_snapshot):
-    logger.info("Creating checkpoint session=%s user=%s pending_agent=%s", session_id, user_id, pending_agent)
-    con = sqlite3.connect(DB_PATH)
-    ckpt_id = uuid.uuid4().hex
-    con.execute("INSERT INTO checkpoints(checkpoint_id,user_id,session_id,pending_agent,pending_question,context_snapshot) VALUES (?,?,?,?,?,?)",
-                (ckpt_id, user_id, session_id, pending_agent, pending_question, context_snapshot))
-    con.commit(); con.close()
-    return {"checkpoint_id": ckpt_id}
\ No newline at end of file
+    return create(user_id, session_id, pending_agent, pending_question, context_snapshot)
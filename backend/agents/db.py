@@ -0,0 +1,117 @@
+import os, sqlite3, threading, logging
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Optional, Sequence
+import anyio
+
+DB_PATH = os.getenv("DB_PATH", "backend/db/app.db")
+logger = logging.getLogger("backend.db")
+
+# Tuned for many short reads/writes from concurrent sessions: WAL lets readers
+# proceed during a write, NORMAL sync is durable at checkpoint granularity.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_KB', '16000'))}",
+)
+STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+
+_local = threading.local()
+_all_lock = threading.Lock()
+_all: List[sqlite3.Connection] = []
+_generation = 0  # bumped by close_all() so every thread reopens lazily
+
+
+def _open(path: str) -> sqlite3.Connection:
+    # isolation_level=None: autocommit per statement, explicit BEGIN in transaction().
+    con = sqlite3.connect(
+        path, isolation_level=None, check_same_thread=False, cached_statements=STATEMENT_CACHE
+    )
+    for pragma in PRAGMAS:
+        con.execute(pragma)
+    with _all_lock:
+        _all.append(con)
+    logger.debug("Opened SQLite connection to %s on thread=%s", path, threading.current_thread().name)
+    return con
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """Return this thread's connection to path (one per thread per database).
+
+    Statements are prepared once per connection and reused from sqlite3's
+    statement cache, so callers should pass constant SQL with parameters.
+    """
+    path = path or DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "generation", None) != _generation:
+        conns = _local.conns = {}
+        _local.generation = _generation
+    con = conns.get(path)
+    if con is None:
+        con = conns[path] = _open(path)
+    return con
+
+
+def execute(sql: str, params: Sequence[Any] = ()) -> int:
+    cur = connect().execute(sql, params)
+    return cur.rowcount
+
+
+def executemany(sql: str, rows: Iterable[Sequence[Any]]) -> int:
+    with transaction() as con:
+        return con.executemany(sql, rows).rowcount
+
+
+def query(sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    return connect().execute(sql, params).fetchall()
+
+
+def query_one(sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+    return connect().execute(sql, params).fetchone()
+
+
+@contextmanager
+def transaction():
+    """Group several statements into one commit on this thread's connection."""
+    con = connect()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        yield con
+    except BaseException:
+        con.execute("ROLLBACK")
+        raise
+    else:
+        con.execute("COMMIT")
+
+
+# Async wrappers for FastAPI handlers: run on anyio's worker threads, each of
+# which keeps its own connection.
+async def aexecute(sql: str, params: Sequence[Any] = ()) -> int:
+    return await anyio.to_thread.run_sync(execute, sql, params)
+
+
+async def aquery(sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    return await anyio.to_thread.run_sync(query, sql, params)
+
+
+async def aquery_one(sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+    return await anyio.to_thread.run_sync(query_one, sql, params)
+
+
+def total_changes() -> int:
+    """Rows inserted/updated/deleted through every open connection of this process."""
+    with _all_lock:
+        return sum(con.total_changes for con in _all)
+
+
+def close_all():
+    global _generation
+    with _all_lock:
+        _generation += 1
+        for con in _all:
+            try:
+                con.close()
+            except Exception:
+                pass
+        _all.clear()
@@ -0,0 +1,34 @@
+"""Record -> (id, text, metadata) builders shared by ingestion and the benchmarks."""
+from typing import Dict, Tuple
+
+
+def claim_doc(rec) -> Tuple[str, str, Dict]:
+    # Flatten claim lines if present
+    claim_text = f"Claim ID: {rec['claim_id']}, Member: {rec['member_id']}, Provider: {rec['provider']}, Status: {rec['status']}, Billed: {rec['billed_amount']}, Allowed: {rec['allowed_amount']}, Paid: {rec['paid_amount']}"
+    if rec.get("denial_reason"):
+        claim_text += f", Denial Reason: {rec['denial_reason']}"
+    if rec.get("claim_lines"):
+        for line in rec["claim_lines"]:
+            claim_text += f"\n  Line: {line['procedure_code']} billed {line['billed_amount']} allowed {line['allowed_amount']} paid {line['paid_amount']}"
+
+    meta = {
+        "member_id": rec["member_id"],
+        "status": rec["status"],
+        "out_of_network": bool(rec.get("out_of_network", False)),
+        "denial_reason": rec.get("denial_reason") or "",  # convert None -> ""
+        "icd": rec.get("icd") or ""                      # convert None -> ""
+    }
+    return rec["claim_id"], claim_text, meta
+
+
+def benefit_doc(rec) -> Tuple[str, str, Dict]:
+    benefit_text = f"Member {rec['member_id']} has plan {rec['plan_name']} effective {rec['effective_date']}, OOP max {rec['out_of_pocket_max']}, Deductible remaining {rec['deductible_remaining']}."
+    meta = {
+        "member_id": rec["member_id"],
+        "plan_id": rec["plan_id"],
+        "in_network": rec["in_network"]
+    }
+    return rec["benefit_id"], benefit_text, meta
+
+
+DOC_BUILDERS = {"claims": claim_doc, "benefits": benefit_doc}
@@ -0,0 +1,105 @@
+import os, json, pathlib, re, threading, time, logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger("backend.agents.id_index")
+
+DATA_DIR = pathlib.Path(os.getenv("DATA_DIR", "backend/data"))
+INDEX_FILES = {
+    "benefits.json": "benefit",
+    "claims.json": "claim",
+    "claims_synthetic.json": "claim",
+}
+
+CLAIM_ID_REGEX = re.compile(r"\bclaim_[0-9a-f]{8}\b")      # e.g., claim_ad69f6a9
+BENEFIT_ID_REGEX = re.compile(r"\bbenefit_[0-9a-f]{8}\b")  # e.g., benefit_79a87fe2
+
+
+class IdIndex:
+    """In-memory claim_id / benefit_id → record index over backend/data/*.json.
+
+    ``users`` maps a session user_id to its member_id (from benefits.json).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.claims: Dict[str, Tuple[dict, str]] = {}
+        self.benefits: Dict[str, Tuple[dict, str]] = {}
+        self.users: Dict[str, str] = {}
+
+    def build(self, data_dir: pathlib.Path = DATA_DIR) -> "IdIndex":
+        start_ts = time.time()
+        claims, benefits, users = {}, {}, {}
+        for fname, kind in INDEX_FILES.items():
+            path = pathlib.Path(data_dir) / fname
+            if not path.exists():
+                continue
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except Exception as e:
+                logger.warning("Skipping %s for id index: %s", path, e)
+                continue
+            for rec in data:
+                rid = rec.get(f"{kind}_id")
+                if not rid:
+                    continue
+                (claims if kind == "claim" else benefits)[rid] = (rec, fname)
+                mid = rec.get("member_id")
+                if mid and rec.get("user_id"):
+                    users.setdefault(rec["user_id"], mid)
+        # Swap in atomically so readers never see a half-built index.
+        with self._lock:
+            self.claims, self.benefits, self.users = claims, benefits, users
+        logger.info(
+            "ID index built: claims=%d benefits=%d users=%d in %.3fs",
+            len(claims), len(benefits), len(users), time.time() - start_ts,
+        )
+        return self
+
+    def find(self, text: str) -> List[Tuple[str, str, dict, str]]:
+        """Return (kind, id, record, source_file) for every known ID mentioned in text."""
+        out = []
+        for kind, regex, table in (("claim", CLAIM_ID_REGEX, self.claims), ("benefit", BENEFIT_ID_REGEX, self.benefits)):
+            for rid in dict.fromkeys(regex.findall(text)):
+                hit = table.get(rid)
+                if hit:
+                    out.append((kind, rid, hit[0], hit[1]))
+        return out
+
+    def member_for_user(self, user_id: Optional[str]) -> Optional[str]:
+        return self.users.get(user_id) if user_id else None
+
+
+def format_record(kind: str, rec: dict) -> str:
+    """Render the structured fields of one record as a short answer block."""
+    if kind == "claim":
+        lines = [
+            f"Claim {rec.get('claim_id')} for member {rec.get('member_id')}",
+            f"- Provider: {rec.get('provider')}",
+            f"- Service date: {rec.get('service_date')}",
+            f"- Status: {rec.get('status')}",
+            f"- Billed: {rec.get('billed_amount')}, Allowed: {rec.get('allowed_amount')}, Paid: {rec.get('paid_amount')}",
+        ]
+        if rec.get("denial_reason"):
+            lines.append(f"- Denial reason: {rec['denial_reason']}")
+        return "\n".join(lines)
+
+    lines = [
+        f"Benefit {rec.get('benefit_id')} for member {rec.get('member_id')}",
+        f"- Plan: {rec.get('plan_name')} ({rec.get('plan_id')}), effective {rec.get('effective_date')}"
+        + (f" to {rec['termination_date']}" if rec.get("termination_date") else ""),
+        f"- In network: {rec.get('in_network')}",
+        f"- Out-of-pocket max: {rec.get('out_of_pocket_max')}, Deductible remaining: {rec.get('deductible_remaining')}",
+    ]
+    for cov in rec.get("coverages") or []:
+        lines.append(
+            f"- {cov.get('category')}: copay {cov.get('copay')}, coinsurance {cov.get('coinsurance')}, deductible {cov.get('deductible')}"
+        )
+    return "\n".join(lines)
+
+
+INDEX = IdIndex()
+
+
+def load(data_dir: Optional[pathlib.Path] = None) -> IdIndex:
+    return INDEX.build(data_dir or DATA_DIR)
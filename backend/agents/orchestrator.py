@@ -1,29 +1,44 @@
 from __future__ import annotations
 
 import logging
-import re
 import uuid
-import json
 import os
-from typing import Literal, Optional, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from typing import Callable, Literal, Optional, List
 from pydantic import BaseModel, Field
 from langgraph.graph import StateGraph, END
 from backend.logging_setup import setup_logging
-from backend.agents import ckpt_store
+from backend.agents import ckpt_store, id_index
+from backend.agents.retrieval import multi_search
+from backend.agents.semantic_router import keyword_route
+from backend.metrics import ROUTER_SECONDS
+from backend import tracing
 
 # Reduce noisy HF tokenizers warning in forked workers
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
 
 logger = setup_logging("orchestrator")
 
+# Per-request event sink used by the streaming execution mode. Set by
+# stream_graph() and read by the agent nodes; None means plain invoke().
+EMITTER_CTX: ContextVar[Optional[Callable[[dict], None]]] = ContextVar("graph_emitter", default=None)
+
+# Shared pool for the benefit/claim fan-out on the "both" route.
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "4"))
+_fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
 
 class GraphState(BaseModel):
     session_id: str
     user_id: str
     question: str
-    route: Literal["benefit", "claim", "both", "clarify", "unknown"] = "unknown"
+    route: Literal["benefit", "claim", "both", "lookup", "clarify", "unknown"] = "unknown"
     original_route: Optional[str] = None
     needs_claim: bool = False
+    # (kind, id, record, source_file) from the ID index, found once by the router
+    id_hits: List[tuple] = Field(default_factory=list)
 
     benefit_result: Optional[str] = None
     claim_result: Optional[str] = None
@@ -36,9 +51,26 @@ class GraphState(BaseModel):
 # Helpers
 # ---------------------------
 
-def contains_kw(q: str, kws: list[str]) -> bool:
-    """Check if question contains any of the keywords."""
-    return any(re.search(rf"\b{re.escape(w)}\b", q) for w in kws)
+def _route(q: str) -> str:
+    """Keyword route (single precompiled pass); the semantic router's fallback."""
+    return keyword_route(q)
+
+
+def run_agent(name: str, agent, state: GraphState, **kwargs) -> dict:
+    """Run an agent, forwarding agent_start/token/agent_end events when streaming."""
+    emit = EMITTER_CTX.get()
+    with tracing.span(f"agent.{name}"):
+        if emit is None:
+            return agent.run(state.question, state.session_id, state.user_id, **kwargs)
+
+        emit({"type": "agent_start", "data": {"agent": name}})
+        res = agent.run(
+            state.question, state.session_id, state.user_id,
+            on_token=lambda text: emit({"type": "token", "agent": name, "data": text}),
+            **kwargs,
+        )
+        emit({"type": "agent_end", "data": {"agent": name}})
+        return res
 
 
 # ---------------------------
@@ -46,39 +78,42 @@ def contains_kw(q: str, kws: list[str]) -> bool:
 # ---------------------------
 
 def router_node(state: GraphState) -> GraphState:
-    q = state.question.lower()
-
-    benefit_kw = ["benefit", "benefits", "coverage", "copay", "coinsurance", "deductible", "plan"]
-    claim_kw = ["claim", "claims", "eob", "paid", "allowed", "denied", "provider", "service date"]
-
-    b = contains_kw(q, benefit_kw)
-    c = contains_kw(q, claim_kw)
-
-    if b and c:
-        decided = "both"
-    elif b:
-        decided = "benefit"
-    elif c:
-        decided = "claim"
-    else:
-        decided = "clarify"
+    start = time.perf_counter()
+    # Fast path: explicit claim/benefit IDs are answered from the ID index.
+    state.id_hits = id_index.INDEX.find(state.question)
+    if state.id_hits:
+        state.route = "lookup"
+        state.original_route = "lookup"
+        state.needs_claim = False
+        ROUTER_SECONDS.observe(time.perf_counter() - start, route="lookup")
+        logger.info("Router decided route=lookup for q='%s'", state.question)
+        return state
+
+    decided = None
+    if semantic_router is not None:
+        decided, conf = semantic_router.classify(state.question)
+        if decided:
+            logger.info("Semantic router confidence=%.3f", conf)
+    if decided is None:
+        decided = _route(state.question)
 
     state.route = decided
     state.original_route = decided
     state.needs_claim = decided == "both"
+    ROUTER_SECONDS.observe(time.perf_counter() - start, route=decided)
 
     logger.info("Router decided route=%s for q='%s'", state.route, state.question)
     return state
 
 
+@tracing.traced("checkpoint.save")
 def save_checkpoint(state: GraphState, agent: str) -> GraphState:
-    snapshot = json.dumps(state.dict())
-    ckpt = ckpt_store.create(
+    ckpt = ckpt_store.save_state(
         user_id=state.user_id,
         session_id=state.session_id,
         pending_agent=agent,
         pending_question=state.question,
-        context_snapshot=snapshot,
+        state=state.dict(),
     )
     state.checkpoint_id = ckpt["checkpoint_id"]
     logger.debug("Checkpoint saved: %s for agent=%s", state.checkpoint_id, agent)
@@ -87,7 +122,7 @@ def save_checkpoint(state: GraphState, agent: str) -> GraphState:
 
 def claim_node(state: GraphState, agent) -> GraphState:
     logger.info(">>> Entered claim_node with question=%s", state.question)
-    res = agent.run(state.question, state.session_id, state.user_id)
+    res = run_agent("claim", agent, state)
     state.claim_result = res["answer"]
     state.provenance += res.get("provenance", [])
     save_checkpoint(state, "claim")
@@ -98,16 +133,92 @@ def claim_node(state: GraphState, agent) -> GraphState:
     return state
 
 
-def summary_node(state: GraphState) -> GraphState:
+def both_node(state: GraphState, benefit_agent, claim_agent) -> GraphState:
+    """Fan out benefit and claim concurrently, then fan in on this thread.
+
+    Branches only read the state; results and provenance are merged here so
+    GraphState is never mutated from two threads at once.
+    """
+    logger.info(">>> Entered both_node with question=%s", state.question)
+    b_kw, c_kw = {}, {}
+    b_ret, c_ret = getattr(benefit_agent, "ret", None), getattr(claim_agent, "ret", None)
+    if b_ret is not None and c_ret is not None:
+        # One embedding + one batched rerank for both collections.
+        found = multi_search(state.question, [b_ret, c_ret], user_id=state.user_id)
+        b_kw["retrieved"] = found[b_ret.collection_name]
+        c_kw["retrieved"] = found[c_ret.collection_name]
+
+    fb = _fanout_pool.submit(copy_context().run, run_agent, "benefit", benefit_agent, state, **b_kw)
+    fc = _fanout_pool.submit(copy_context().run, run_agent, "claim", claim_agent, state, **c_kw)
+    b_res, c_res = fb.result(), fc.result()
+
+    state.benefit_result = b_res["answer"]
+    state.claim_result = c_res["answer"]
+    state.provenance += b_res.get("provenance", []) + c_res.get("provenance", [])
+    save_checkpoint(state, "both")
     logger.info(
-        ">>> Entered summary_node with benefit_result=%s and claim_result=%s",
-        state.benefit_result, state.claim_result
+        "After both_node: route=%s original_route=%s needs_claim=%s",
+        state.route, state.original_route, state.needs_claim
     )
-    summ = (
-        f"Benefit:\n{state.benefit_result or '(none)'}\n\n"
-        f"Claim:\n{state.claim_result or '(none)'}"
+    return state
+
+
+def lookup_node(state: GraphState) -> GraphState:
+    """Answer direct-ID questions from structured fields, skipping retrieval and the LLM."""
+    hits = state.id_hits or id_index.INDEX.find(state.question)
+    state.summary = "\n\n".join(id_index.format_record(kind, rec) for kind, _, rec, _ in hits)
+    state.provenance += [{
+        "agent": "lookup",
+        "model": None,
+        "quant": None,
+        "sources": [{"file": src, "doc_id": rid, "member_id": rec.get("member_id"), "offsets": []}
+                    for _, rid, rec, src in hits],
+    }]
+    emit = EMITTER_CTX.get()
+    if emit is not None:
+        emit({"type": "agent_start", "data": {"agent": "lookup"}})
+        emit({"type": "token", "agent": "lookup", "data": state.summary})
+        emit({"type": "agent_end", "data": {"agent": "lookup"}})
+    logger.info("lookup_node answered %d id(s) for q='%s'", len(hits), state.question)
+    return state
+
+
+def _merge_answers(state: GraphState, summary_agent) -> str:
+    """Merged answer for the "both" route, streamed as summary tokens when possible."""
+    joined = f"Benefit:\n{state.benefit_result}\n\nClaim:\n{state.claim_result}"
+    if summary_agent is None:
+        return joined
+    emit = EMITTER_CTX.get()
+    with tracing.span("agent.summary"):
+        if emit is not None:
+            emit({"type": "agent_start", "data": {"agent": "summary"}})
+        try:
+            res = summary_agent.run(
+                state,
+                on_token=(lambda text: emit({"type": "token", "agent": "summary", "data": text})) if emit else None,
+            )
+        except Exception as e:
+            # both branch answers are already in hand: fall back to showing them side by side
+            logger.exception("SummaryAgent failed, returning branch answers unmerged: %s", e)
+            return joined
+        finally:
+            if emit is not None:
+                emit({"type": "agent_end", "data": {"agent": "summary"}})
+    state.provenance += res.get("provenance", [])
+    return res["answer"]
+
+
+def summary_node(state: GraphState, summary_agent=None) -> GraphState:
+    """Final answer. Single-branch answers pass through without an LLM call;
+    only the "both" route is merged, by summary_agent when one is configured."""
+    logger.info(
+        ">>> Entered summary_node route=%s with benefit_result=%s and claim_result=%s",
+        state.route, state.benefit_result, state.claim_result
     )
-    state.summary = summ
+    if state.route == "both" and state.benefit_result and state.claim_result:
+        state.summary = _merge_answers(state, summary_agent)
+    else:
+        state.summary = state.benefit_result or state.claim_result or ""
     save_checkpoint(state, "summary")
     logger.info("After summary_node: checkpoint_id=%s", state.checkpoint_id)
     return state
@@ -126,12 +237,14 @@ def noop_node(state: GraphState) -> GraphState:
 def build_graph(benefit_agent, claim_agent, summary_agent=None, ckpt_store=None):
     g = StateGraph(GraphState)
 
-    g.add_node("router", router_node)
+    node = lambda name, fn: tracing.traced(f"node.{name}")(fn)
+
+    g.add_node("router", node("router", router_node))
 
     def benefit_wrapper(state: GraphState) -> GraphState:
         try:
             logger.info(">>> Entered benefit_node with question=%s", state.question)
-            res = benefit_agent.run(state.question, state.session_id, state.user_id)
+            res = run_agent("benefit", benefit_agent, state)
             state.benefit_result = res["answer"]
             state.provenance += res.get("provenance", [])
             save_checkpoint(state, "benefit")
@@ -140,19 +253,17 @@ def build_graph(benefit_agent, claim_agent, summary_agent=None, ckpt_store=None)
                 state.route, state.original_route, state.needs_claim
             )
 
-            if state.needs_claim:
-                logger.info("Routing to claim_node …")
-                state = claim_node(state, claim_agent)
-
-            state = summary_node(state)
+            state = summary_node(state, summary_agent)
             return state
         except Exception as e:
             logger.exception("Error inside benefit_wrapper: %s", e)
             raise
 
-    g.add_node("benefit", benefit_wrapper)
-    g.add_node("claim", lambda s: claim_node(s, claim_agent))
-    g.add_node("summary_node", summary_node)
+    g.add_node("benefit", node("benefit", benefit_wrapper))
+    g.add_node("claim", node("claim", lambda s: claim_node(s, claim_agent)))
+    g.add_node("both", node("both", lambda s: both_node(s, benefit_agent, claim_agent)))
+    g.add_node("lookup", node("lookup", lookup_node))
+    g.add_node("summary_node", node("summary", lambda s: summary_node(s, summary_agent)))
     g.add_node("noop", noop_node)
 
     g.set_entry_point("router")
@@ -163,25 +274,42 @@ def build_graph(benefit_agent, claim_agent, summary_agent=None, ckpt_store=None)
         {
             "benefit": "benefit",
             "claim": "claim",
-            "both": "benefit",  # benefit wrapper handles claim+summary internally
+            "both": "both",  # parallel benefit+claim fan-out
+            "lookup": "lookup",
             "clarify": END,
             "unknown": END,
         },
     )
 
     g.add_edge("claim", "summary_node")
+    g.add_edge("both", "summary_node")
     g.add_edge("summary_node", END)
+    g.add_edge("lookup", END)
     g.add_edge("benefit", "noop")
     g.add_edge("noop", END)
 
     return g.compile()
 
 
+def stream_graph(graph, state: GraphState, emit: Callable[[dict], None]):
+    """Invoke the graph while pushing per-agent events to ``emit``.
+
+    ``emit`` is called from worker threads, so it must be thread-safe.
+    """
+    token = EMITTER_CTX.set(emit)
+    try:
+        with tracing.span("graph"), tracing.profiled():
+            return graph.invoke(state)
+    finally:
+        EMITTER_CTX.reset(token)
+
+
 # ---------------------------
 # Export a global graph placeholder
 # ---------------------------
 
 graph = None  # Will be set in main.py during startup
+semantic_router = None  # SemanticRouter, set in main.py during startup when ROUTER_MODE=semantic
 
 
 # ---------------------------
@@ -190,8 +318,10 @@ graph = None  # Will be set in main.py during startup
 
 if __name__ == "__main__":
     class DummyAgent:
-        def run(self, q, sid, uid):
+        def run(self, q, sid, uid, on_token=None):
             logger.info("DummyAgent answering for %s", q)
+            if on_token is not None:
+                on_token(f"Answer for {q}")
             return {"answer": f"Answer for {q}", "provenance": [{"q": q}]}
 
     g = build_graph(DummyAgent(), DummyAgent())
@@ -0,0 +1,135 @@
+import os, json, time, threading, logging
+from typing import Callable, Dict, Optional, Tuple
+from backend.agents import db
+
+logger = logging.getLogger("backend.pending_store")
+
+PENDING_STORE = os.getenv("PENDING_STORE", "sqlite")  # sqlite (multi-worker) | memory (single process)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS pending_streams (
+      token TEXT PRIMARY KEY,
+      user_id TEXT NOT NULL,
+      payload TEXT NOT NULL,
+      expires_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_pending_streams_expires ON pending_streams(expires_at)",
+    "CREATE INDEX IF NOT EXISTS idx_pending_streams_user ON pending_streams(user_id)",
+)
+INSERT_SQL = "INSERT INTO pending_streams(token,user_id,payload,expires_at) VALUES (?,?,?,?)"
+SELECT_SQL = "SELECT payload,expires_at FROM pending_streams WHERE token=?"
+DELETE_SQL = "DELETE FROM pending_streams WHERE token=?"
+EVICT_SQL = "DELETE FROM pending_streams WHERE expires_at<=?"
+COUNT_SQL = "SELECT COUNT(*), COALESCE(SUM(user_id=?),0) FROM pending_streams WHERE expires_at>?"
+
+# Admission check given (pending overall, pending for the user): a rejection reason or None.
+RoomCheck = Callable[[int, int], Optional[str]]
+
+
+class MemoryPendingStore:
+    """Pending send→stream handoffs in this process only (single-worker mode)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: Dict[str, Tuple[str, float, dict]] = {}
+
+    def put(self, token: str, user_id: str, payload: dict, ttl_s: float):
+        with self._lock:
+            self._rows[token] = (user_id, time.time() + ttl_s, payload)
+
+    def put_if_room(self, token: str, user_id: str, payload: dict, ttl_s: float,
+                    check: RoomCheck) -> Tuple[Optional[str], int]:
+        """Count, check and insert as one step; returns (rejection reason, pending)."""
+        now = time.time()
+        with self._lock:
+            live = [u for u, exp, _ in self._rows.values() if exp > now]
+            pending, mine = len(live), sum(1 for u in live if u == user_id)
+            reason = check(pending, mine)
+            if reason is None:
+                self._rows[token] = (user_id, now + ttl_s, payload)
+        return reason, pending
+
+    def claim(self, token: str) -> Optional[dict]:
+        with self._lock:
+            row = self._rows.pop(token, None)
+        if row is None or row[1] <= time.time():
+            return None
+        return row[2]
+
+    def counts(self, user_id: str) -> Tuple[int, int]:
+        """(pending overall, pending for user_id), expired entries excluded."""
+        now = time.time()
+        with self._lock:
+            live = [u for u, exp, _ in self._rows.values() if exp > now]
+        return len(live), sum(1 for u in live if u == user_id)
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            dead = [t for t, (_, exp, _) in self._rows.items() if exp <= now]
+            for t in dead:
+                del self._rows[t]
+        return len(dead)
+
+
+class SqlitePendingStore:
+    """Pending handoffs in the shared SQLite database, so the POST and the
+    WebSocket may land on different worker processes. A claim reads and
+    deletes the row inside one BEGIN IMMEDIATE transaction, so exactly one
+    worker can take a token, and only before it expires; put_if_room counts
+    and inserts the same way, so concurrent admits cannot overshoot a limit."""
+
+    def __init__(self):
+        self._ready = set()
+        self._lock = threading.Lock()
+
+    def _ensure_schema(self):
+        path = db.DB_PATH
+        if path in self._ready:
+            return
+        with self._lock:
+            if path not in self._ready:
+                for stmt in SCHEMA:
+                    db.execute(stmt)
+                self._ready.add(path)
+
+    def put(self, token: str, user_id: str, payload: dict, ttl_s: float):
+        self._ensure_schema()
+        db.execute(INSERT_SQL, (token, user_id, json.dumps(payload), time.time() + ttl_s))
+
+    def put_if_room(self, token: str, user_id: str, payload: dict, ttl_s: float,
+                    check: RoomCheck) -> Tuple[Optional[str], int]:
+        self._ensure_schema()
+        now = time.time()
+        with db.transaction() as con:
+            pending, mine = con.execute(COUNT_SQL, (user_id, now)).fetchone()
+            reason = check(pending, mine)
+            if reason is None:
+                con.execute(INSERT_SQL, (token, user_id, json.dumps(payload), now + ttl_s))
+        return reason, pending
+
+    def claim(self, token: str) -> Optional[dict]:
+        self._ensure_schema()
+        with db.transaction() as con:
+            row = con.execute(SELECT_SQL, (token,)).fetchone()
+            if row is None:
+                return None
+            con.execute(DELETE_SQL, (token,))
+        if row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def counts(self, user_id: str) -> Tuple[int, int]:
+        self._ensure_schema()
+        total, mine = db.query_one(COUNT_SQL, (user_id, time.time()))
+        return total, mine
+
+    def evict_expired(self) -> int:
+        self._ensure_schema()
+        return db.execute(EVICT_SQL, (time.time(),))
+
+
+def make_store(kind: str = PENDING_STORE):
+    if kind == "memory":
+        return MemoryPendingStore()
+    return SqlitePendingStore()
@@ -0,0 +1,99 @@
+import os, threading, logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+from backend.models import registry
+from backend.models.embedding_cache import normalize_query
+from backend.metrics import RERANK_SECONDS
+from backend import tracing
+
+logger = logging.getLogger("backend.agents.rerank")
+
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+RERANKER_INT8 = os.getenv("RERANKER_INT8", "false").lower() == "true"
+
+
+class Reranker:
+    """Cross-encoder scoring with a (query, doc_id) score cache.
+
+    ``items`` are (doc_id, text) pairs; only pairs missing from the cache
+    are sent to the model, in one batched predict() call.
+    """
+
+    def __init__(self, model, cache_size: int = RERANK_CACHE_SIZE):
+        self.model = model
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def score(self, query: str, items: Sequence[Tuple[str, str]]) -> List[float]:
+        nq = normalize_query(query)
+        # hash(text) guards against a doc_id whose content was re-ingested
+        keys = [(nq, doc_id, hash(text)) for doc_id, text in items]
+        scores: List[Optional[float]] = [None] * len(items)
+        todo = []
+        with self._lock:
+            for i, k in enumerate(keys):
+                s = self._cache.get(k)
+                if s is None:
+                    todo.append(i)
+                else:
+                    self._cache.move_to_end(k)
+                    scores[i] = s
+            self.hits += len(items) - len(todo)
+            self.misses += len(todo)
+        if todo:
+            with tracing.span("rerank", pairs=len(todo)), RERANK_SECONDS.time():
+                pred = self.model.predict([(query, items[i][1]) for i in todo])
+            with self._lock:
+                for i, s in zip(todo, pred):
+                    scores[i] = float(s)
+                    if self.cache_size > 0:
+                        self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rank(self, query: str, cands, final_k: int, scores: Optional[List[float]] = None,
+             force: bool = False):
+        """Top final_k (cand, score) pairs; cands are (doc_id, text, meta) tuples.
+
+        With final_k or fewer candidates the retrieval order is kept and the
+        cross-encoder is skipped entirely, unless force is set because the
+        candidates come in no relevance order (a member partition).
+        """
+        if scores is None and (len(cands) <= 1 or (len(cands) <= final_k and not force)):
+            with self._lock:
+                self.bypassed += 1
+            return [(c, None) for c in cands]
+        if scores is None:
+            scores = self.score(query, [(c[0], c[1]) for c in cands])
+        ranked = sorted(zip(cands, scores), key=lambda x: x[1], reverse=True)
+        return ranked[:final_k]
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_rerankers: Dict[tuple, Reranker] = {}
+_rerankers_lock = threading.Lock()
+
+
+def get_reranker(model_name: str, int8: bool = RERANKER_INT8) -> Reranker:
+    """One Reranker (and score cache) per model/precision per process."""
+    key = (model_name, int8)
+    with _rerankers_lock:
+        rr = _rerankers.get(key)
+        if rr is None:
+            rr = Reranker(registry.get_reranker(model_name, int8=int8))
+            _rerankers[key] = rr
+        return rr
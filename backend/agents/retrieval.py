@@ -1,9 +1,13 @@
 import os, pathlib, re
-from typing import List, Tuple, Dict, Optional
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer, CrossEncoder
+from typing import Callable, List, Tuple, Dict, Optional
 from backend.logging_setup import setup_logging
+from backend.models import registry
+from backend.models.embedding_cache import get_embedding_cache
+from backend.agents.rerank import get_reranker
+from backend.agents.vector_store import VECTOR_BACKEND, VectorStore, open_store
+from backend.agents import id_index
+from backend.metrics import VECTOR_QUERY_SECONDS
+from backend import tracing
 
 
 logger = setup_logging("retrieval")
@@ -16,104 +20,197 @@ TOP_K = int(os.getenv("RETRIEVE_K", "20"))
 FINAL_K = int(os.getenv("FINAL_K", "5"))
 
 MEMBER_ID_REGEX = re.compile(r"\bM\d{6}\b")  # e.g., M770487
+# First-person wording ("my claim", "am I covered"): the question is about the session user's own data.
+SELF_REF_REGEX = re.compile(r"\b(?:my|mine|me|i|i'm|i've|i'd|myself|our|ours|we|us)\b", re.IGNORECASE)
+
+
+def resolve_member(query: str, user_id: Optional[str] = None) -> Tuple[Optional[str], bool]:
+    """(member the question is about, whether the question names it explicitly).
+
+    An explicit member id wins; otherwise the session user's member applies
+    only when the question refers to the user's own data.
+    """
+    member_match = MEMBER_ID_REGEX.search(query)
+    if member_match:
+        return member_match.group(), True
+    if SELF_REF_REGEX.search(query):
+        return id_index.INDEX.member_for_user(user_id), False
+    return None, False
+
+
+def _needs_model(cands, from_partition: bool, final_k: int) -> bool:
+    """Whether candidates must go through the cross-encoder (see Reranker.rank)."""
+    return len(cands) > final_k or (from_partition and len(cands) > 1)
 
 
 class ChromaRetriever:
-    def __init__(self, collection_name: str):
+    def __init__(
+        self, collection_name: str, embedding_model: str = EMBEDDING_MODEL,
+        store: Optional[VectorStore] = None, reranker=None,
+    ):
         self.collection_name = collection_name
-        self.client = chromadb.PersistentClient(
-            path=str(CHROMA_PATH), settings=Settings(allow_reset=False)
-        )
-        self.collection = self.client.get_or_create_collection(collection_name)
-        self.embed = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
-        self.reranker = CrossEncoder(RERANKER_MODEL, device="cpu")
-        logger.info("Retriever ready: collection=%s", collection_name)
+        # Shared per process: every retriever gets the same client and models.
+        # The keyword arguments let benchmarks swap in another index, model or reranker.
+        self.client = None
+        if store is None:
+            if VECTOR_BACKEND == "chroma":
+                self.client = registry.get_chroma_client(str(CHROMA_PATH))
+            store = open_store(collection_name, self.client)
+        self.store = store
+        self.embed = registry.get_embedder(embedding_model)
+        self.embed_cache = get_embedding_cache(embedding_model)
+        self.reranker = reranker if reranker is not None else get_reranker(RERANKER_MODEL)
+        logger.info("Retriever ready: collection=%s backend=%s", collection_name, VECTOR_BACKEND)
+
+    def _where(self, member_id: Optional[str]) -> Optional[Dict]:
+        """Metadata filter to push down to the collection query."""
+        if member_id:
+            logger.info("Applying hybrid filter on %s: member_id=%s", self.collection_name, member_id)
+            return {"member_id": member_id}
+        logger.info("No member for query on %s. Running pure semantic search.", self.collection_name)
+        return None
+
+    def _partition(self, member_id: Optional[str], k: int) -> Optional[List[Tuple[str, str, Dict]]]:
+        """Every doc of the member when there are at most k, skipping the ANN query.
+
+        Read from the store's own metadata, so it always matches what was
+        ingested. Returns None when there is no member or the partition is
+        larger than k, in which case the caller runs a filtered vector query.
+        """
+        if not member_id:
+            return None
+        cands = self.store.get_where({"member_id": member_id}, k + 1)
+        if len(cands) > k:
+            return None
+        logger.debug("Member partition %s/%s: %d docs", self.collection_name, member_id, len(cands))
+        return cands
+
+    def _candidates(
+        self, query: str, member: Tuple[Optional[str], bool], k: int,
+        encode: Callable[[], List[float]],
+    ) -> Tuple[List[Tuple[str, str, Dict]], bool]:
+        """(candidates, whether they came unranked from the member partition).
+
+        When the session user's member has nothing in this collection, the
+        question falls back to a pure semantic search as it would with no
+        member at all; a member named in the question stays filtered.
+        """
+        member_id, explicit = member
+        cands = self._partition(member_id, k)
+        if cands:
+            return cands, True
+        if cands is None:
+            cands = self._query(query, k=k, where=self._where(member_id), qv=encode())
+        if not cands and member_id and not explicit:
+            logger.info("No %s docs for session member %s. Running pure semantic search.", self.collection_name, member_id)
+            cands = self._query(query, k=k, qv=encode())
+        return cands, False
 
     def _query(
-        self, query: str, k: int = TOP_K, where: Optional[Dict] = None
+        self, query: str, k: int = TOP_K, where: Optional[Dict] = None,
+        qv: Optional[List[float]] = None,
     ) -> List[Tuple[str, str, Dict]]:
-        qv = self.embed.encode([query], normalize_embeddings=True).tolist()[0]
-        res = self.collection.query(
-            query_embeddings=[qv],
-            n_results=k,
-            where=where,
-            include=["documents", "metadatas", "distances"],
-        )
-        docs = res.get("documents", [[]])[0]
-        metas = res.get("metadatas", [[]])[0]
-        ids = res.get("ids", [[]])[0] if "ids" in res else [m.get("id", "unknown") for m in metas]
-        out = [(i, d, m) for i, d, m in zip(ids, docs, metas)]
+        if qv is None:
+            qv = self.embed_cache.encode(query)
+        with tracing.span("retrieval.vector_query", collection=self.collection_name, k=k), \
+                VECTOR_QUERY_SECONDS.time(backend=VECTOR_BACKEND, collection=self.collection_name):
+            out = self.store.query(qv, k, where=where)
         logger.debug(
             "Retrieved %d candidates from %s with filter=%s",
             len(out), self.collection_name, where,
         )
         return out
 
+    def _prov(self, cand: Tuple[str, str, Dict]) -> Dict:
+        return {"file": self.collection_name, "doc_id": cand[0], "offsets": []}
+
+    def _build(self, top) -> Tuple[str, List[Dict]]:
+        context = "\n\n".join(item[0][1] for item in top)
+        prov = [self._prov(item[0]) for item in top]
+        return context, prov
+
+    @tracing.traced("retrieval.search")
     def search(
-        self, query: str, k: int = TOP_K, final_k: int = FINAL_K
+        self, query: str, k: int = TOP_K, final_k: int = FINAL_K, user_id: Optional[str] = None
     ) -> Tuple[str, List[Dict]]:
-        cands = self._query(query, k=k)
+        # Step 1: Candidate retrieval (member partition first, then filtered ANN)
+        member = resolve_member(query, user_id)
+        cands, from_partition = self._candidates(query, member, k, lambda: self.embed_cache.encode(query))
         if not cands:
             return "", []
-        pairs = [(query, txt) for _, txt, _ in cands]
-        scores = self.reranker.predict(pairs)
-        ranked = sorted(zip(cands, scores), key=lambda x: x[1], reverse=True)
-        top = ranked[:final_k]
-        context = "\n\n".join(item[0][1] for item in top)
-        prov = [
-            {"file": self.collection_name, "doc_id": item[0][0], "offsets": []}
-            for item in top
-        ]
+
+        # Step 2: Reranking (skipped for final_k or fewer ANN-ordered candidates)
+        top = self.reranker.rank(query, cands, final_k, force=from_partition)
+
+        # Step 3: Build context + provenance
         logger.info(
-            "Reranked %d→%d for %s", len(cands), len(top), self.collection_name
+            "Reranked %d→%d for %s (member=%s)",
+            len(cands), len(top), self.collection_name, member[0],
         )
-        return context, prov
+        return self._build(top)
 
 
 class BenefitRetriever(ChromaRetriever):
-    def __init__(self):
-        super().__init__("benefits")
+    def __init__(self, **kwargs):
+        super().__init__("benefits", **kwargs)
 
 
 class ClaimRetriever(ChromaRetriever):
-    def __init__(self):
-        super().__init__("claims")
-
-    def search(
-        self, query: str, k: int = TOP_K, final_k: int = FINAL_K
-    ) -> Tuple[str, List[Dict]]:
-        # Try to extract member_id
-        member_match = MEMBER_ID_REGEX.search(query)
-        where = {"member_id": member_match.group()} if member_match else None
-        if where:
-            logger.info("Applying hybrid filter: restricting to member_id=%s", where["member_id"])
+    def __init__(self, **kwargs):
+        super().__init__("claims", **kwargs)
+
+    def _prov(self, cand: Tuple[str, str, Dict]) -> Dict:
+        return {
+            "file": self.collection_name,
+            "doc_id": cand[0],
+            "member_id": cand[2].get("member_id"),
+            "offsets": [],
+        }
+
+
+@tracing.traced("retrieval.multi_search")
+def multi_search(
+    query: str, retrievers: List[ChromaRetriever], k: int = TOP_K, final_k: int = FINAL_K,
+    user_id: Optional[str] = None,
+) -> Dict[str, Tuple[str, List[Dict]]]:
+    """Search several collections for one question with shared model work.
+
+    The query is embedded at most once (not at all when every collection is
+    served from the member partition), each collection is queried with that
+    vector, and the candidates of every collection that needs reranking go
+    through a single batched cross-encoder call.
+    Returns {collection_name: (context, provenance)}.
+    """
+    if not retrievers:
+        return {}
+    member = resolve_member(query, user_id)
+    qv: List[List[float]] = []
+
+    def encode():
+        if not qv:
+            qv.append(retrievers[0].embed_cache.encode(query))
+        return qv[0]
+
+    per_coll = [(r, *r._candidates(query, member, k, encode)) for r in retrievers]
+
+    reranker = retrievers[0].reranker
+    items = [
+        (cid, txt)
+        for r, cands, part in per_coll if _needs_model(cands, part, final_k)
+        for cid, txt, _ in cands
+    ]
+    scores = reranker.score(query, items) if items else []
+
+    out, offset = {}, 0
+    for r, cands, part in per_coll:
+        if _needs_model(cands, part, final_k):
+            top = r.reranker.rank(query, cands, final_k, scores=scores[offset:offset + len(cands)])
+            offset += len(cands)
         else:
-            logger.info("No member_id found in query. Running pure semantic search.")
-
-        # Step 1: Candidate retrieval
-        cands = self._query(query, k=k, where=where)
-        if not cands:
-            return "", []
-
-        # Step 2: Reranking
-        pairs = [(query, txt) for _, txt, _ in cands]
-        scores = self.reranker.predict(pairs)
-        ranked = sorted(zip(cands, scores), key=lambda x: x[1], reverse=True)
-        top = ranked[:final_k]
-
-        # Step 3: Build context + provenance
-        context = "\n\n".join(item[0][1] for item in top)
-        prov = [
-            {
-                "file": self.collection_name,
-                "doc_id": item[0][0],
-                "member_id": item[0][2].get("member_id"),
-                "offsets": [],
-            }
-            for item in top
-        ]
-        logger.info(
-            "Reranked %d→%d for %s (filter=%s)",
-            len(cands), len(top), self.collection_name, where,
-        )
-        return context, prov
+            top = r.reranker.rank(query, cands, final_k)
+        out[r.collection_name] = r._build(top) if top else ("", [])
+    logger.info(
+        "Multi-search reranked %d candidates across %s in one pass",
+        len(items), [r.collection_name for r in retrievers],
+    )
+    return out
@@ -0,0 +1,124 @@
+import os, re, time, logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger("backend.agents.semantic_router")
+
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", "0.55"))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", "0.03"))
+
+ROUTES = ["benefit", "claim", "both", "clarify"]
+
+ROUTE_EXEMPLARS: Dict[str, List[str]] = {
+    "benefit": [
+        "What's my copay for imaging?",
+        "How much is my deductible?",
+        "Does my plan cover physical therapy?",
+        "What is my out-of-pocket maximum?",
+        "Is an MRI covered under my plan?",
+        "What's my coinsurance for specialist visits?",
+        "How much will I pay for an ER visit?",
+        "Am I covered for lab work in network?",
+        "When does my coverage start?",
+        "How much of my deductible is left?",
+    ],
+    "claim": [
+        "Why was my claim denied?",
+        "Why didn't insurance pay for the MRI?",
+        "What's the status of my last claim?",
+        "How much did the insurer pay the provider?",
+        "Why was I billed so much for my visit?",
+        "My EOB shows zero paid, why?",
+        "Was my doctor visit on June 14 processed?",
+        "Why was the allowed amount lower than billed?",
+        "Has the hospital bill been paid yet?",
+        "The lab charged me, did you reject it?",
+    ],
+    "both": [
+        "Does my plan cover ER and why was this claim denied?",
+        "Is physical therapy covered and why wasn't my PT visit paid?",
+        "What's my deductible and how much did you pay on my last claim?",
+        "My MRI was denied, isn't imaging part of my coverage?",
+        "Explain my benefits and the status of my claims",
+        "Why did I owe so much if my plan has a copay for this?",
+    ],
+    "clarify": [
+        "hello",
+        "hi there",
+        "thanks",
+        "can you help me?",
+        "what can you do?",
+        "I have a question",
+        "test",
+    ],
+}
+
+# Keyword fallback: one precompiled alternation, scanned in a single pass.
+BENEFIT_KW = ["benefit", "benefits", "coverage", "copay", "coinsurance", "deductible", "plan"]
+CLAIM_KW = ["claim", "claims", "eob", "paid", "allowed", "denied", "provider", "service date"]
+_KW_REGEX = re.compile(
+    r"\b(?:(?P<benefit>" + "|".join(map(re.escape, BENEFIT_KW)) + r")"
+    r"|(?P<claim>" + "|".join(map(re.escape, CLAIM_KW)) + r"))\b"
+)
+
+
+def keyword_route(q: str) -> str:
+    b = c = False
+    for m in _KW_REGEX.finditer(q.lower()):
+        if m.lastgroup == "benefit":
+            b = True
+        else:
+            c = True
+        if b and c:
+            return "both"
+    if b:
+        return "benefit"
+    if c:
+        return "claim"
+    return "clarify"
+
+
+class SemanticRouter:
+    """Nearest-centroid classifier over route exemplar embeddings.
+
+    Exemplars are embedded once at construction; routing a question is one
+    encode plus a (routes x dim) @ (dim,) product.
+    """
+
+    def __init__(self, encoder, exemplars: Dict[str, List[str]] = ROUTE_EXEMPLARS,
+                 min_score: float = ROUTER_MIN_SCORE, min_margin: float = ROUTER_MIN_MARGIN):
+        # encoder: anything with encode_many(texts) -> list of normalized vectors
+        # (EmbeddingCache), so the router's query embedding is reused by retrieval.
+        self.encoder = encoder
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.labels = [r for r in ROUTES if exemplars.get(r)]
+        start_ts = time.time()
+        rows = []
+        for label in self.labels:
+            vecs = np.asarray(encoder.encode_many(exemplars[label]), dtype=np.float32)
+            c = vecs.mean(axis=0)
+            rows.append(c / (np.linalg.norm(c) or 1.0))
+        self.centroids = np.stack(rows).astype(np.float32)
+        logger.info(
+            "Semantic router ready: routes=%s dim=%d in %.2fs",
+            self.labels, self.centroids.shape[1], time.time() - start_ts,
+        )
+
+    def scores(self, q: str) -> np.ndarray:
+        qv = np.asarray(self.encoder.encode(q), dtype=np.float32)
+        return self.centroids @ qv
+
+    def classify(self, q: str) -> Tuple[Optional[str], float]:
+        """Return (route, confidence), with route None when below the thresholds."""
+        s = self.scores(q)
+        order = np.argsort(s)[::-1]
+        best = float(s[order[0]])
+        margin = best - float(s[order[1]]) if len(order) > 1 else best
+        if best < self.min_score or margin < self.min_margin:
+            return None, best
+        return self.labels[order[0]], best
+
+    def route(self, q: str) -> str:
+        label, _ = self.classify(q)
+        return label or keyword_route(q)
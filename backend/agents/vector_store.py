@@ -0,0 +1,299 @@
+import os, json, time, uuid, fcntl, shutil, pathlib, threading, logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger("backend.agents.vector_store")
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # chroma | mmap
+VECTOR_PATH = pathlib.Path(os.getenv("VECTOR_PATH", "backend/db/vectors")).resolve()
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")     # float32 | float16
+VECTOR_RELOAD_S = float(os.getenv("VECTOR_RELOAD_S", "1.0"))  # how often readers re-check CURRENT
+VECTOR_KEEP_VERSIONS = int(os.getenv("VECTOR_KEEP_VERSIONS", "3"))  # published versions kept on disk
+
+Hit = Tuple[str, str, Dict]  # (doc_id, document, metadata)
+
+
+class VectorStore:
+    """Minimal interface the retrievers and ingest script need from an index."""
+
+    def query(self, qv: Sequence[float], k: int, where: Optional[Dict] = None) -> List[Hit]:
+        raise NotImplementedError
+
+    def get(self, ids: List[str]) -> List[Hit]:
+        """Fetch documents by id, in the order given; unknown ids are dropped."""
+        raise NotImplementedError
+
+    def get_metadatas(self, ids: List[str]) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    def get_where(self, where: Dict, limit: int) -> List[Hit]:
+        """Up to limit documents matching a metadata filter, without vector scoring."""
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict], embeddings: List[List[float]]):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+
+class ChromaStore(VectorStore):
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, qv, k, where=None):
+        res = self.collection.query(
+            query_embeddings=[list(qv)],
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        docs = res.get("documents", [[]])[0]
+        metas = res.get("metadatas", [[]])[0]
+        ids = res.get("ids", [[]])[0] if "ids" in res else [m.get("id", "unknown") for m in metas]
+        return [(i, d, m) for i, d, m in zip(ids, docs, metas)]
+
+    def get(self, ids):
+        res = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        found = {i: (i, d, m or {}) for i, d, m in zip(res.get("ids", []), res.get("documents") or [], res.get("metadatas") or [])}
+        return [found[i] for i in ids if i in found]
+
+    def get_metadatas(self, ids):
+        existing = self.collection.get(ids=ids, include=["metadatas"])
+        return {i: (m or {}) for i, m in zip(existing.get("ids", []), existing.get("metadatas") or [])}
+
+    def get_where(self, where, limit):
+        res = self.collection.get(where=where, limit=limit, include=["documents", "metadatas"])
+        return [(i, d, m or {}) for i, d, m in zip(res.get("ids", []), res.get("documents") or [], res.get("metadatas") or [])]
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+
+class MmapStore(VectorStore):
+    """Normalized embeddings in a memory-mapped .npy plus a metadata column index.
+
+    Layout: <root>/<name>/CURRENT names the live version directory holding
+    vectors.npy and docs.json. Writers hold an exclusive flock on
+    <root>/<name>/LOCK while they re-read CURRENT, build a new version on top
+    of it and swap CURRENT atomically, so concurrent publishers (threads or
+    processes) apply their upserts one after another instead of overwriting
+    each other's; readers in every worker process map the same file, so the
+    vectors live once in the OS page cache. Readers re-check CURRENT at most
+    every reload_s seconds, and the newest VECTOR_KEEP_VERSIONS versions stay
+    on disk so a reader that has not switched yet can still open its version.
+    """
+
+    def __init__(self, name: str, root: pathlib.Path = VECTOR_PATH, dtype: str = VECTOR_DTYPE,
+                 reload_s: float = VECTOR_RELOAD_S):
+        self.name = name
+        self.dir = pathlib.Path(root) / name
+        self.dtype = np.dtype(dtype)
+        self.reload_s = reload_s
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = float("-inf")
+        self._pending: Dict[str, tuple] = {}
+        self._load()
+
+    # -- reading ------------------------------------------------------------
+
+    def _current(self) -> Optional[str]:
+        try:
+            return (self.dir / "CURRENT").read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _read_version(self, version: str):
+        vdir = self.dir / version
+        vecs = np.load(vdir / "vectors.npy", mmap_mode="r")
+        with open(vdir / "docs.json") as f:
+            blob = json.load(f)
+        return vecs, blob["ids"], blob["documents"], blob["metadatas"]
+
+    def _load(self):
+        version = self._current()
+        if version is None:
+            vecs, ids, docs, metas = np.zeros((0, 0), dtype=self.dtype), [], [], []
+        else:
+            try:
+                vecs, ids, docs, metas = self._read_version(version)
+            except FileNotFoundError:
+                # collected between reading CURRENT and opening it: a newer one is live
+                version = self._current()
+                vecs, ids, docs, metas = self._read_version(version)
+        # column index: field -> value -> row numbers, so filters run before scoring
+        columns: Dict[str, Dict] = {}
+        for row, meta in enumerate(metas):
+            for field, value in (meta or {}).items():
+                if isinstance(value, (str, int, bool)):
+                    columns.setdefault(field, {}).setdefault(value, []).append(row)
+        with self._lock:
+            self.vecs, self.ids, self.docs, self.metas = vecs, ids, docs, metas
+            self.row_of = {i: r for r, i in enumerate(ids)}
+            self.columns = {f: {v: np.asarray(rows, dtype=np.int64) for v, rows in vals.items()} for f, vals in columns.items()}
+            self._version = version
+            self._checked_at = time.monotonic()
+        logger.info("Mmap store %s loaded version=%s rows=%d", self.name, version, len(ids))
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_s:
+            return
+        self._checked_at = now
+        if self._current() != self._version:
+            self._load()
+
+    def _rows(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Row numbers matching a Chroma-style equality filter (None = all rows)."""
+        if not where:
+            return None
+        clauses = where.get("$and", [where]) if "$and" in where else [{k: v} for k, v in where.items()]
+        rows = None
+        for clause in clauses:
+            for field, value in clause.items():
+                if isinstance(value, dict):
+                    value = value.get("$eq")
+                hit = self.columns.get(field, {}).get(value)
+                if hit is None:
+                    return np.zeros(0, dtype=np.int64)
+                rows = hit if rows is None else np.intersect1d(rows, hit, assume_unique=True)
+        return rows
+
+    def query(self, qv, k, where=None):
+        self._maybe_reload()
+        with self._lock:
+            vecs, ids, docs, metas = self.vecs, self.ids, self.docs, self.metas
+            rows = self._rows(where)
+        if not ids or (rows is not None and rows.size == 0):
+            return []
+        q = np.asarray(qv, dtype=np.float32)
+        if rows is None:
+            scores = np.asarray(vecs @ q.astype(vecs.dtype), dtype=np.float32)
+            cand = np.arange(len(ids))
+        else:
+            scores = np.asarray(vecs[rows], dtype=np.float32) @ q
+            cand = rows
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[cand[i]], docs[cand[i]], metas[cand[i]]) for i in top]
+
+    def get(self, ids):
+        self._maybe_reload()
+        with self._lock:
+            docs, metas, row_of = self.docs, self.metas, self.row_of
+        return [(i, docs[row_of[i]], metas[row_of[i]]) for i in ids if i in row_of]
+
+    def get_where(self, where, limit):
+        self._maybe_reload()
+        with self._lock:
+            ids, docs, metas = self.ids, self.docs, self.metas
+            rows = self._rows(where)
+        rows = range(len(ids)) if rows is None else rows.tolist()
+        return [(ids[r], docs[r], metas[r]) for r in rows[:limit]]
+
+    def get_metadatas(self, ids):
+        self._maybe_reload()
+        with self._lock:
+            metas, row_of = self.metas, self.row_of
+            pending = dict(self._pending)
+        out = {}
+        for i in ids:
+            if i in pending:
+                out[i] = pending[i][1]
+            elif i in row_of:
+                out[i] = metas[row_of[i]]
+        return out
+
+    # -- writing ------------------------------------------------------------
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        with self._lock:
+            for i, d, m, e in zip(ids, documents, metadatas, embeddings):
+                self._pending[i] = (d, m, e)
+
+    @contextmanager
+    def _publish_lock(self):
+        """Exclusive across threads and processes publishing to this store."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.dir / "LOCK", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def flush(self):
+        """Publish pending upserts as a new version (copy-on-write)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            with self._publish_lock():
+                version, n = self._publish(pending)
+        except BaseException:
+            with self._lock:  # keep them for the next flush; newer upserts win
+                self._pending = {**pending, **self._pending}
+            raise
+        logger.info("Mmap store %s published %s with %d rows", self.name, version, n)
+
+    def _publish(self, pending: Dict[str, tuple]):
+        # under the publish lock: build on whatever version is live now
+        if self._current() != self._version:
+            self._load()
+        with self._lock:
+            vecs, row_of = self.vecs, self.row_of
+            ids, docs, metas = list(self.ids), list(self.docs), list(self.metas)
+        rows = [np.asarray(vecs[r], dtype=np.float32) for r in range(len(ids))]
+        for i, (d, m, e) in pending.items():
+            v = np.asarray(e, dtype=np.float32)
+            v = v / (np.linalg.norm(v) or 1.0)
+            if i in row_of:
+                r = row_of[i]
+                docs[r], metas[r], rows[r] = d, m, v
+            else:
+                ids.append(i); docs.append(d); metas.append(m); rows.append(v)
+
+        # time-ordered for collection (publishes are serialized by the publish lock)
+        version = f"v{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        vdir = self.dir / version
+        vdir.mkdir(parents=True)
+        np.save(vdir / "vectors.npy", np.stack(rows).astype(self.dtype))
+        with open(vdir / "docs.json", "w") as f:
+            json.dump({"ids": ids, "documents": docs, "metadatas": metas}, f)
+        tmp = self.dir / "CURRENT.tmp"
+        tmp.write_text(version)
+        os.replace(tmp, self.dir / "CURRENT")
+        self._load()
+        self._collect(keep=version)
+        return version, len(ids)
+
+    def _collect(self, keep: str):
+        """Remove versions older than the newest VECTOR_KEEP_VERSIONS.
+
+        Deletion is deferred by VECTOR_KEEP_VERSIONS publishes rather than done
+        on swap: other processes may not have re-read CURRENT yet, and an
+        unlinked file stays readable through mappings that are already open.
+        """
+        versions = sorted(p.name for p in self.dir.iterdir() if p.is_dir() and p.name.startswith("v"))
+        for old in versions[:-max(1, VECTOR_KEEP_VERSIONS)]:
+            if old != keep:
+                shutil.rmtree(self.dir / old, ignore_errors=True)
+
+
+_mmap_stores: Dict[str, MmapStore] = {}
+_mmap_lock = threading.Lock()
+
+
+def open_store(name: str, client=None, backend: str = VECTOR_BACKEND) -> VectorStore:
+    """Store for a collection; client is the Chroma client for the chroma backend."""
+    if backend == "mmap":
+        # one mapping per collection per process
+        with _mmap_lock:
+            if name not in _mmap_stores:
+                _mmap_stores[name] = MmapStore(name)
+            return _mmap_stores[name]
+    return ChromaStore(client.get_or_create_collection(name))
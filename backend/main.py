@@ -1,18 +1,28 @@
 import anyio
-import os, json, uuid, logging, sqlite3
-from contextvars import ContextVar
+import asyncio
+import os, json, uuid, time, logging
+from contextlib import ExitStack
+from contextvars import copy_context
 from fastapi import FastAPI, WebSocket, UploadFile, Form, File, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from typing import Optional
 
 from .models.model_loader import load_llm
+from .models import registry, embedding_cache
 from .agents.benefit import BenefitAgent
 from .agents.claim import ClaimAgent
 from .agents.summary import SummaryAgent
-from .agents import ckpt_store
-from .agents.orchestrator import build_graph, GraphState
+from .agents import ckpt_store, id_index, db, answer_cache, rerank, admission
+from .agents import orchestrator
+from .agents.orchestrator import build_graph, stream_graph, GraphState
+from .agents.semantic_router import SemanticRouter
+from .agents.retrieval import EMBEDDING_MODEL, RERANKER_MODEL, CHROMA_PATH
+from .agents.vector_store import VECTOR_BACKEND, open_store
+from . import metrics, tracing, startup
+from .tracing import REQUEST_ID_CTX
 
 # ---------------------------
 # Env & Logging Setup
@@ -22,7 +32,6 @@ LOG_DIR = os.path.join(os.path.dirname(__file__), "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
 log_file = os.path.join(LOG_DIR, "app.log")
-REQUEST_ID_CTX: ContextVar[str] = ContextVar("request_id", default="-")
 
 
 class RequestIdFilter(logging.Filter):
@@ -48,8 +57,6 @@ root.addHandler(sh)
 logger = logging.getLogger("backend")
 logger.info("Starting backend application")
 
-DB_PATH = os.getenv("DB_PATH", "backend/db/app.db")
-
 # ---------------------------
 # FastAPI setup
 # ---------------------------
@@ -84,28 +91,116 @@ benefit_agent = None
 claim_agent = None
 summary_agent = None
 graph = None
+admission_ctrl = None
+
+# Sampled at scrape time from the admission controller (no DB access).
+metrics.Gauge("admission_queue_depth", "Streams waiting for a backend slot in this process.",
+              fn=lambda: admission_ctrl.queued() if admission_ctrl else 0)
+metrics.Gauge("admission_active_runs", "Graph runs holding a backend slot in this process.",
+              fn=lambda: admission_ctrl.active if admission_ctrl else 0)
 
 
 # ---------------------------
 # Startup — initialize models
 # ---------------------------
-@app.on_event("startup")
-async def startup_event():
-    global LLM, benefit_agent, claim_agent, summary_agent, graph
-    logger.info("Initializing LLM and agents")
+# Independent models load in parallel on the startup pool and get one warm-up
+# inference each; agents and the graph are built once their models are in the
+# registry. The server answers /healthz and /readyz meanwhile and rejects chat
+# traffic with 503 until every required component is ready.
+STARTUP_BLOCKING = os.getenv("STARTUP_BLOCKING", "false").lower() == "true"
+boot = startup.Startup()
+
+
+def _load_embedder():
+    return registry.get_embedder(EMBEDDING_MODEL)
+
+
+def _warm_embedder(model):
+    model.encode(["warm-up query"], normalize_embeddings=True)
+
 
-    # load LLM
-    LLM = load_llm()
+def _load_reranker():
+    return rerank.get_reranker(RERANKER_MODEL)
 
-    # init agents
+
+def _warm_reranker(rr):
+    rr.model.predict([("warm-up query", "warm-up document")])
+
+
+def _open_vector_stores():
+    client = registry.get_chroma_client(str(CHROMA_PATH)) if VECTOR_BACKEND == "chroma" else None
+    return {name: open_store(name, client) for name in ("claims", "benefits")}
+
+
+def _build_router():
+    router_model = os.getenv("ROUTER_MODEL", EMBEDDING_MODEL)
+    orchestrator.semantic_router = SemanticRouter(embedding_cache.get_embedding_cache(router_model))
+    return orchestrator.semantic_router
+
+
+def _build_agents():
+    global LLM, benefit_agent, claim_agent, summary_agent, graph, admission_ctrl
+    LLM = boot.value("llm")
+    # retrievers find the embedder, cross-encoder and stores already loaded
     benefit_agent = BenefitAgent(LLM)
     claim_agent = ClaimAgent(LLM)
     summary_agent = SummaryAgent(LLM)
-
     # build graph with checkpoint store + summary agent
     graph = build_graph(benefit_agent, claim_agent, summary_agent, ckpt_store)
-
+    admission_ctrl = admission.get_controller(LLM.backend)
     logger.info("Agents initialized and graph built")
+    return graph
+
+
+def _register_components(s: startup.Startup):
+    # in-memory claim/benefit/member ID index for the lookup fast path
+    s.add("id_index", id_index.load)
+    s.add("llm", lambda: load_llm(), warmup=lambda llm: llm.warmup())  # load_llm looked up at call time
+    s.add("embedder", _load_embedder, warmup=_warm_embedder)
+    s.add("reranker", _load_reranker, warmup=_warm_reranker)
+    s.add("vector_store", _open_vector_stores)
+    s.add("agents", _build_agents, deps=("llm", "embedder", "reranker", "vector_store", "id_index"))
+    # semantic router shares the retrieval embedder and its query cache; the
+    # keyword router covers for it if it fails
+    if os.getenv("ROUTER_MODE", "semantic") == "semantic":
+        s.add("router", _build_router, deps=("embedder",), required=False)
+
+
+@app.on_event("startup")
+async def startup_event():
+    logger.info("Initializing LLM and agents")
+    _register_components(boot)
+    if STARTUP_BLOCKING:
+        await anyio.to_thread.run_sync(boot.run)
+    else:
+        boot.start()
+    asyncio.create_task(_sweep_pending())
+
+
+async def _sweep_pending():
+    """Expire unclaimed stream tokens even when no new request arrives."""
+    while True:
+        await asyncio.sleep(admission.PENDING_TTL_S)
+        if admission_ctrl is not None:
+            try:
+                await anyio.to_thread.run_sync(admission_ctrl.sweep)
+            except Exception as e:
+                logger.warning("Pending-token sweep failed: %s", e)
+
+
+def _not_ready():
+    return JSONResponse(
+        status_code=503,
+        content={"error": "starting", "startup": boot.status()},
+        headers={"Retry-After": "5"},
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # drain write-behind checkpoints before the process exits
+    await anyio.to_thread.run_sync(ckpt_store.flush)
+    db.close_all()
 
 
 # ---------------------------
@@ -134,37 +229,64 @@ async def session_create(request: Request, user_id: Optional[str] = Form(None),
         pass
 
     logger.info("API /api/session/create called by content-type=%s", request.headers.get("content-type"))
-    con = sqlite3.connect(DB_PATH)
     if not user_id:
         user_id = "u" + uuid.uuid4().hex[:6]
     session_id = "s_" + uuid.uuid4().hex[:8]
-    con.execute("INSERT OR REPLACE INTO users(user_id) VALUES (?)", (user_id,))
-    con.execute(
-        "INSERT INTO sessions(session_id,user_id,title) VALUES (?,?,?)",
-        (session_id, user_id, title or "New Chat"),
-    )
-    con.commit()
-    con.close()
+
+    def _insert():
+        with db.transaction() as con:
+            con.execute("INSERT OR REPLACE INTO users(user_id) VALUES (?)", (user_id,))
+            con.execute(
+                "INSERT INTO sessions(session_id,user_id,title) VALUES (?,?,?)",
+                (session_id, user_id, title or "New Chat"),
+            )
+
+    await anyio.to_thread.run_sync(_insert)
     return {"session_id": session_id, "user_id": user_id}
 
 
+def _saturated(e: admission.Saturated):
+    logger.warning("Admission rejected: %s (retry after %ss)", e.reason, e.retry_after)
+    return JSONResponse(
+        status_code=429,
+        content={"error": e.reason, "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 @app.post("/api/chat/send")
-def chat_send(req: ChatSend):
+async def chat_send(req: ChatSend):
     logger.info("API /api/chat/send session=%s user=%s", req.session_id, req.user_id)
+    if not boot.ready:
+        return _not_ready()
     token = uuid.uuid4().hex
-    store = {"session_id": req.session_id, "user_id": req.user_id, "text": req.text, "token": token}
-    _pending_streams[token] = store
+    store = {
+        "session_id": req.session_id, "user_id": req.user_id, "text": req.text, "token": token,
+        "request_id": REQUEST_ID_CTX.get(),  # the stream continues this request's trace
+    }
+    try:
+        await anyio.to_thread.run_sync(admission_ctrl.admit, token, req.user_id, store)
+    except admission.Saturated as e:
+        return _saturated(e)
     return {"stream_url": f"/api/stream/{req.session_id}/{token}"}
 
 
 @app.post("/api/chat/resume")
-def chat_resume(checkpoint_id: str = Form(...), text: str = Form(...)):
+async def chat_resume(checkpoint_id: str = Form(...), text: str = Form(...)):
     logger.info("API /api/chat/resume checkpoint=%s", checkpoint_id)
-    ck = ckpt_store.get(checkpoint_id)
+    if not boot.ready:
+        return _not_ready()
+    ck = await anyio.to_thread.run_sync(ckpt_store.get, checkpoint_id)
     if not ck:
         return {"error": "invalid_checkpoint"}
     token = uuid.uuid4().hex
-    _pending_streams[token] = {"resume": True, "ckpt": ck, "text": text, "token": token}
+    user_id = json.loads(ck["context_snapshot"]).get("user_id") or ck["session_id"]
+    try:
+        payload = {"resume": True, "ckpt": ck, "text": text, "token": token, "user_id": user_id,
+                   "request_id": REQUEST_ID_CTX.get()}
+        await anyio.to_thread.run_sync(admission_ctrl.admit, token, user_id, payload)
+    except admission.Saturated as e:
+        return _saturated(e)
     return {"stream_url": f"/api/stream/{ck['session_id']}/{token}"}
 
 
@@ -183,27 +305,73 @@ async def ingest_files(benefits: UploadFile = File(None), claims: UploadFile = F
         out["claims_path"] = cpath
         with open(cpath, "wb") as f:
             f.write(await claims.read())
+    if benefits or claims:
+        await anyio.to_thread.run_sync(id_index.load)
     return out
 
 
 @app.get("/api/provenance/{session_id}")
-def get_prov(session_id: str):
-    con = sqlite3.connect(DB_PATH)
-    rows = [
+async def get_prov(session_id: str):
+    rows = await db.aquery(
+        "SELECT agent,model_name,quantization,sources FROM provenance WHERE session_id=?", (session_id,)
+    )
+    return [
         dict(session_id=session_id, agent=a, model_name=b, quantization=c, sources=json.loads(d))
-        for a, b, c, d in con.execute(
-            "SELECT agent,model_name,quantization,sources FROM provenance WHERE session_id=?", (session_id,)
-        )
+        for a, b, c, d in rows
     ]
-    con.close()
-    return rows
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process serves requests; per-component startup state and timings."""
+    return boot.report()
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once every required component is loaded and warmed up, else 503."""
+    report = boot.report()
+    return JSONResponse(status_code=200 if boot.ready else 503, content=report)
+
+
+@app.get("/api/models/memory")
+def models_memory():
+    """Per-model load time and approximate memory held by the shared registry."""
+    return registry.memory_report()
+
+
+@app.get("/api/models/embedding-cache")
+def embedding_cache_stats():
+    return {name: cache.stats() for name, cache in embedding_cache._caches.items()}
+
+
+@app.get("/api/models/rerank-cache")
+def rerank_cache_stats():
+    return {f"{name}{' (int8)' if int8 else ''}": rr.stats() for (name, int8), rr in rerank._rerankers.items()}
+
+
+@app.get("/api/admission")
+async def admission_stats():
+    """Concurrency, queue depth and rejection counters of the admission controller."""
+    return await anyio.to_thread.run_sync(admission_ctrl.stats) if admission_ctrl else {}
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of the per-stage histograms and gauges."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/cache/answers")
+def answer_cache_stats():
+    """Answer cache hit rate and generation time saved by hits."""
+    return answer_cache.stats()
 
 
 @app.get("/api/checkpoints/{session_id}")
-def list_ckpts(session_id: str):
-    con = sqlite3.connect(DB_PATH)
+async def list_ckpts(session_id: str):
     out = []
-    for row in con.execute(
+    for row in await db.aquery(
         "SELECT checkpoint_id,pending_agent,pending_question,created_at FROM checkpoints WHERE session_id=?",
         (session_id,),
     ):
@@ -215,47 +383,81 @@ def list_ckpts(session_id: str):
                 "created_at": row[3],
             }
         )
-    con.close()
     return out
 
 
 # ---------------------------
 # WebSocket streaming
 # ---------------------------
-_pending_streams = {}
-
-
 @app.websocket("/api/stream/{session_id}/{token}")
 async def ws_stream(ws: WebSocket, session_id: str, token: str):
     await ws.accept()
-    payload = _pending_streams.pop(token, None)
+    started, outcome = time.perf_counter(), "error"
+    if not boot.ready:
+        await ws.send_json({"type": "error", "data": "starting"})
+        await ws.close()
+        return
+    # atomic, expiring claim in the shared pending store: the POST that
+    # created the token may have been served by another worker
+    payload = await anyio.to_thread.run_sync(admission_ctrl.claim, token)
     if not payload:
         await ws.send_json({"type": "error", "data": "no_pending"})
         await ws.close()
         return
 
-    con = sqlite3.connect(DB_PATH)
-    try:
-        # Build GraphState
-        if "resume" in payload:
-            state_json = json.loads(payload["ckpt"]["context_snapshot"])
-            state_json["question"] = payload["text"]
-            ckpt_store.delete(payload["ckpt"]["checkpoint_id"])
-            state = GraphState(**state_json)
-        else:
-            con.execute(
-                "INSERT INTO messages(message_id,session_id,role,content,agent) VALUES (?,?,?,?,?)",
-                (uuid.uuid4().hex, payload["session_id"], "user", payload["text"], "user"),
-            )
-            con.commit()
-            state = GraphState(
-                session_id=payload["session_id"],
-                user_id=payload["user_id"],
-                question=payload["text"],
-            )
+    # The HTTP middleware does not run for WebSockets: restore the request id
+    # of the send call and open the request's trace under it.
+    REQUEST_ID_CTX.set(payload.get("request_id") or ("r-" + uuid.uuid4().hex[:8]))
+    trace_scope = ExitStack()
+    root_span = trace_scope.enter_context(
+        tracing.start_trace("ws_stream", trace_id=REQUEST_ID_CTX.get(), session_id=session_id)
+    )
 
-        # Run the full graph in a worker thread so the WS task stays alive
-        final = await anyio.to_thread.run_sync(graph.invoke, state)
+    # Agent events (agent_start / token / agent_end) and queue positions are
+    # pushed through one queue so they reach the socket in order.
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def emit(event):
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def on_position(position, queued):
+        events.put_nowait({"type": "queue", "data": {"position": position, "queued": queued}})
+
+    async def forward_events():
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            await ws.send_json(event)
+
+    try:
+        forwarder = asyncio.create_task(forward_events())
+        try:
+            # Wait for a backend slot, then run the graph in a worker thread
+            async with admission_ctrl.slot(payload.get("user_id") or session_id, on_position):
+                root_span.set(queue_ms=round((time.perf_counter() - started) * 1000, 1))
+                # Build GraphState
+                if "resume" in payload:
+                    state_json = json.loads(payload["ckpt"]["context_snapshot"])
+                    state_json["question"] = payload["text"]
+                    await anyio.to_thread.run_sync(ckpt_store.delete, payload["ckpt"]["checkpoint_id"])
+                    state = GraphState(**state_json)
+                else:
+                    await db.aexecute(
+                        "INSERT INTO messages(message_id,session_id,role,content,agent) VALUES (?,?,?,?,?)",
+                        (uuid.uuid4().hex, payload["session_id"], "user", payload["text"], "user"),
+                    )
+                    state = GraphState(
+                        session_id=payload["session_id"],
+                        user_id=payload["user_id"],
+                        question=payload["text"],
+                    )
+                # copy_context: request id and trace span follow the run into the worker thread
+                final = await anyio.to_thread.run_sync(copy_context().run, stream_graph, graph, state, emit)
+        finally:
+            events.put_nowait(None)
+            await forwarder
 
         # Coerce to GraphState if needed
         if isinstance(final, dict):
@@ -277,11 +479,10 @@ async def ws_stream(ws: WebSocket, session_id: str, token: str):
             summary_text, prov, ckpt_id = "", [], None
 
         # Persist assistant message
-        con.execute(
+        await db.aexecute(
             "INSERT INTO messages(message_id,session_id,role,content,agent) VALUES (?,?,?,?,?)",
             (uuid.uuid4().hex, session_id, "assistant", summary_text, "summary"),
         )
-        con.commit()
 
         # Send final response then 'done'
         await ws.send_json(
@@ -296,19 +497,20 @@ async def ws_stream(ws: WebSocket, session_id: str, token: str):
             }
         )
         await ws.send_json({"type": "done"})
+        outcome = "ok"
     except Exception as e:
+        root_span.error = f"{type(e).__name__}: {e}"
         logger.exception("Error in ws_stream: %s", e)
         try:
             await ws.send_json({"type": "error", "data": str(e)})
         except Exception:
             pass
     finally:
-        try:
-            con.close()
-        except Exception:
-            pass
         try:
             await ws.close()
         except Exception:
             pass
+        metrics.WS_STREAM_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        root_span.set(outcome=outcome)
+        trace_scope.close()
     logger.info("WebSocket stream closed for session=%s token=%s", session_id, token)
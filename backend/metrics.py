@@ -0,0 +1,173 @@
+"""Process-local metrics rendered in the Prometheus text exposition format.
+
+Hot paths only do a bisect and a few additions under a lock per observation;
+gauges backed by a callback are read at scrape time. Set METRICS_ENABLED=false
+to turn every observation into a no-op.
+"""
+import os, time, threading, bisect
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., +Inf count, sum, count]
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        key = self._key(labels)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * (len(self.buckets) + 3)
+            s[i] += 1  # i == len(buckets) is the +Inf overflow slot
+            s[-2] += value
+            s[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        out = super().render()
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for key, s in sorted(series.items()):
+            cum = 0
+            for bound, n in zip(self.buckets, s):
+                cum += n
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, ('le', _num(bound)))} {cum}")
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, ('le', '+Inf'))} {s[-1]}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_num(s[-2])}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {s[-1]}")
+        return out
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        out = super().render()
+        with self._lock:
+            values = dict(self._values)
+        out += [f"{self.name}{_fmt_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(values.items())]
+        return out
+
+
+class Gauge(_Metric):
+    """Set/inc/dec gauge; or pass ``fn`` returning {label tuple: value} (or a number) to sample at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn: Optional[Callable] = None):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        out = super().render()
+        with self._lock:
+            values = dict(self._values)
+        if self.fn is not None:
+            try:
+                sampled = self.fn()
+            except Exception:
+                sampled = {}
+            values.update(sampled if isinstance(sampled, dict) else {(): sampled})
+        out += [f"{self.name}{_fmt_labels(self.labelnames, k)} {_num(v)}" for k, v in sorted(values.items())]
+        return out
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for m in metrics:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------
+# Application metrics
+# ---------------------------
+ROUTER_SECONDS = Histogram("router_seconds", "Time to choose a route for a question.", ["route"])
+EMBEDDING_SECONDS = Histogram("embedding_seconds", "Query embedding model time (cache misses only).", ["model"])
+VECTOR_QUERY_SECONDS = Histogram("vector_query_seconds", "Vector store candidate query time.", ["backend", "collection"])
+RERANK_SECONDS = Histogram("rerank_seconds", "Cross-encoder scoring time per batch.")
+LLM_TTFT_SECONDS = Histogram("llm_time_to_first_token_seconds", "Time from generation request to first streamed chunk.", ["backend"])
+LLM_CHUNKS_PER_SECOND = Histogram("llm_chunks_per_second", "Streamed text chunks per second after the first chunk.", ["backend"], buckets=RATE_BUCKETS)
+LLM_CHUNKS = Counter("llm_chunks_total", "Streamed generation text chunks.", ["backend"])
+LLM_IN_FLIGHT = Gauge("llm_inflight_generations", "Generations currently streaming.", ["backend"])
+CHECKPOINT_WRITE_SECONDS = Histogram("checkpoint_write_seconds", "Checkpoint batch write transaction time.")
+TRACES_DROPPED = Counter("traces_dropped_total", "Finished traces dropped because the export queue was full.")
+WS_STREAM_SECONDS = Histogram("ws_stream_seconds", "End-to-end WebSocket stream duration, queueing included.", ["outcome"])
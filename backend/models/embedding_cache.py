@@ -0,0 +1,104 @@
+import os, re, threading, logging
+from collections import OrderedDict
+from typing import Dict, List
+from backend.models import registry
+from backend.metrics import EMBEDDING_SECONDS
+from backend import tracing
+
+logger = logging.getLogger("backend.models.embedding_cache")
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Cache key: case-folded, whitespace-collapsed, trailing punctuation dropped."""
+    return _WS.sub(" ", text).strip().lower().rstrip("?!. ")
+
+
+class EmbeddingCache:
+    """Thread-safe LRU cache in front of a SentenceTransformer's encode()."""
+
+    def __init__(self, embedder, maxsize: int = EMBED_CACHE_SIZE, name: str = ""):
+        self.embedder = embedder
+        self.name = name
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: str):
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def _put(self, key: str, vec: List[float]):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = vec
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def encode(self, text: str) -> List[float]:
+        return self.encode_many([text])[0]
+
+    def encode_many(self, texts: List[str]) -> List[List[float]]:
+        """Encode texts, running the model once over the cache misses only.
+
+        The normalized form is only the cache key; the model sees the original
+        text of the first miss for each key, so vectors match an uncached encode.
+        """
+        keys = [normalize_query(t) for t in texts]
+        out: List = [self._get(k) for k in keys]
+        todo = {}
+        for i, vec in enumerate(out):
+            if vec is None:
+                todo.setdefault(keys[i], []).append(i)
+        if todo:
+            miss_keys = list(todo)
+            miss_texts = [texts[todo[k][0]] for k in miss_keys]
+            with tracing.span("embed", texts=len(miss_keys)), EMBEDDING_SECONDS.time(model=self.name):
+                vecs = self.embedder.encode(miss_texts, normalize_embeddings=True).tolist()
+            for k, vec in zip(miss_keys, vecs):
+                self._put(k, vec)
+                for i in todo[k]:
+                    out[i] = vec
+        return out
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_caches: Dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, maxsize: int = EMBED_CACHE_SIZE) -> EmbeddingCache:
+    """One cache per embedding model per process, shared like the model itself."""
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            cache = EmbeddingCache(registry.get_embedder(model_name), maxsize=maxsize, name=model_name)
+            _caches[model_name] = cache
+            logger.info("Embedding cache created for %s (maxsize=%d)", model_name, maxsize)
+        return cache
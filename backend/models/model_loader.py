@@ -1,16 +1,274 @@
-import os, torch, logging
-from typing import Iterator
-from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
+import os, time, logging, queue
+from typing import Iterator, Optional
 from threading import Thread
-from huggingface_hub import InferenceClient
-from huggingface_hub.errors import HfHubHTTPError
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
+from backend import tracing
+from backend.metrics import LLM_TTFT_SECONDS, LLM_CHUNKS_PER_SECOND, LLM_CHUNKS, LLM_IN_FLIGHT
+from backend.models.remote_client import RemoteLLMClient, RemoteLLMError, ROUTER_BASE_URL, HF_INFERENCE_URL
 
 logger = logging.getLogger("backend.model_loader")
 
+GEN_SCHEDULER = os.getenv("GEN_SCHEDULER", "true").lower() == "true"
+GEN_MAX_BATCH = int(os.getenv("GEN_MAX_BATCH", "8"))
+PREFIX_CACHE = os.getenv("PREFIX_CACHE", "true").lower() == "true"
+
+# torch / transformers take seconds to import and only local generation needs
+# them (the remote modes never do): bound on first use by _import_torch().
+torch = F = DynamicCache = None
+
+
+def _import_torch():
+    global torch, F, DynamicCache
+    if torch is None:
+        import torch.nn.functional as _F
+        from transformers import DynamicCache as _DynamicCache
+        import torch as _torch
+        F, DynamicCache = _F, _DynamicCache
+        torch = _torch  # last: other threads test this name
+
+
+def static_prefix(template: str) -> str:
+    """Fixed leading text of a prompt template: everything before the first
+    placeholder, cut back to a line break so token boundaries stay stable."""
+    head = template.split("{", 1)[0]
+    cut = head.rfind("\n")
+    return head[:cut + 1] if cut >= 0 else ""
+
+
+class _GenRequest:
+    def __init__(self, input_ids, max_new_tokens):
+        self.input_ids = input_ids          # List[int] prompt token ids
+        self.max_new_tokens = max_new_tokens
+        self.generated = []                 # List[int]
+        self.text = ""                      # decoded text already sent
+        self.out = queue.Queue()            # str chunks, then None (or an Exception)
+        self.cancelled = False
+        self.prefix = None                  # registered prefix text whose KV can be reused
+
+
+class GenerationScheduler:
+    """Continuous batching over one local causal LM.
+
+    Callers submit prompts from any thread; a single worker thread owns the
+    model and runs one decode step at a time for every active sequence.
+    New prompts are prefilled together and merged into the running batch
+    between steps (left padding + attention mask + per-row position ids),
+    finished sequences are dropped, and each sequence's text is pushed to
+    its caller as soon as it is decoded.
+    """
+
+    def __init__(self, model, tokenizer, max_batch: int = GEN_MAX_BATCH,
+                 temperature: float = 0.2, top_p: float = 0.9, repetition_penalty: float = 1.1):
+        _import_torch()
+        self.model = model
+        self.tok = tokenizer
+        self.max_batch = max_batch
+        self.temperature = temperature
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.device = model.device
+        eos = model.generation_config.eos_token_id
+        if eos is None:
+            eos = tokenizer.eos_token_id
+        self.eos_ids = set(eos if isinstance(eos, (list, tuple)) else [eos])
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else next(iter(self.eos_ids))
+        self._incoming: "queue.Queue[_GenRequest]" = queue.Queue()
+        self._prefix_ids = {}   # prefix text -> token ids
+        self._prefix_kv = {}    # prefix text -> legacy past_key_values, built on the worker
+        self._thread = Thread(target=self._loop, name="gen-scheduler", daemon=True)
+        self._thread.start()
+
+    # -- caller side --------------------------------------------------------
+
+    def register_prefix(self, text: str):
+        """Keep the KV cache of a fixed prompt prefix so matching prompts skip its prefill."""
+        if text and text not in self._prefix_ids:
+            self._prefix_ids[text] = self.tok(text)["input_ids"]
+            logger.info("Registered prompt prefix (%d tokens) for KV reuse", len(self._prefix_ids[text]))
+
+    def _match_prefix(self, ids):
+        best = None
+        for text, p_ids in self._prefix_ids.items():
+            # Compare token ids, not text: the prefix only helps when the full
+            # prompt tokenizes to the same ids at the boundary.
+            if len(p_ids) < len(ids) and ids[:len(p_ids)] == p_ids:
+                if best is None or len(p_ids) > len(self._prefix_ids[best]):
+                    best = text
+        return best
+
+    def submit(self, prompt: str, max_new_tokens: int) -> Iterator[str]:
+        req = _GenRequest(self.tok(prompt)["input_ids"], max_new_tokens)
+        req.prefix = self._match_prefix(req.input_ids)
+        self._incoming.put(req)
+        try:
+            while True:
+                item = req.out.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            req.cancelled = True  # consumer went away: stop spending steps on it
+
+    # -- worker side --------------------------------------------------------
+
+    def _loop(self):
+        active, past, mask = [], None, None
+        while True:
+            new = []
+            if not active:
+                new.append(self._incoming.get())  # idle: block for work
+            while len(active) + len(new) < self.max_batch:
+                try:
+                    new.append(self._incoming.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with torch.no_grad():
+                    if new:
+                        # Prefill per shared prefix so each group starts from its cached KV.
+                        groups = {}
+                        for r in new:
+                            groups.setdefault(r.prefix, []).append(r)
+                        for prefix, reqs in groups.items():
+                            logits, n_past, n_mask = self._prefill(reqs, prefix)
+                            self._advance(reqs, logits)
+                            past, mask = self._merge(past, mask, n_past, n_mask)
+                            active = active + reqs
+                    active, past, mask = self._drop_finished(active, past, mask)
+                    if active:
+                        logits, past, mask = self._decode_step(active, past, mask)
+                        self._advance(active, logits)
+                        active, past, mask = self._drop_finished(active, past, mask)
+            except Exception as e:
+                logger.exception("Generation step failed for %d sequence(s): %s", len(active) + len(new), e)
+                for r in active + new:
+                    r.out.put(e)
+                active, past, mask = [], None, None
+
+    def _forward(self, input_ids, mask, position_ids, past):
+        cache = DynamicCache.from_legacy_cache(past) if past is not None else DynamicCache()
+        out = self.model(
+            input_ids=input_ids, attention_mask=mask, position_ids=position_ids,
+            past_key_values=cache, use_cache=True,
+        )
+        return out.logits[:, -1, :], out.past_key_values.to_legacy_cache()
+
+    def _prefix_cache(self, prefix):
+        kv = self._prefix_kv.get(prefix)
+        if kv is None:
+            ids = torch.tensor([self._prefix_ids[prefix]], device=self.device)
+            mask = torch.ones_like(ids)
+            _, kv = self._forward(ids, mask, (mask.cumsum(-1) - 1), None)
+            self._prefix_kv[prefix] = kv
+        return kv
+
+    def _prefill(self, reqs, prefix=None):
+        skip = len(self._prefix_ids[prefix]) if prefix else 0
+        tails = [r.input_ids[skip:] for r in reqs]
+        width = max(len(t) for t in tails)
+        ids = torch.full((len(reqs), width), self.pad_id, dtype=torch.long)
+        mask = torch.zeros((len(reqs), width), dtype=torch.long)
+        for i, t in enumerate(tails):
+            ids[i, width - len(t):] = torch.tensor(t)
+            mask[i, width - len(t):] = 1
+        ids, mask = ids.to(self.device), mask.to(self.device)
+
+        past = None
+        if prefix:
+            # [prefix][pad][suffix]: padding sits between the cached prefix and
+            # each suffix; the mask and cumsum positions account for the gap.
+            past = tuple(
+                (k.expand(len(reqs), -1, -1, -1), v.expand(len(reqs), -1, -1, -1))
+                for k, v in self._prefix_cache(prefix)
+            )
+            mask = torch.cat([torch.ones((len(reqs), skip), dtype=mask.dtype, device=mask.device), mask], dim=1)
+        pos = (mask.cumsum(-1) - 1).clamp(min=0)[:, skip:]
+        logits, past = self._forward(ids, mask, pos, past)
+        return logits, past, mask
+
+    def _decode_step(self, active, past, mask):
+        ids = torch.tensor([[r.generated[-1]] for r in active], device=self.device)
+        mask = torch.cat([mask, torch.ones((len(active), 1), dtype=mask.dtype, device=mask.device)], dim=1)
+        pos = mask.sum(-1, keepdim=True) - 1
+        logits, past = self._forward(ids, mask, pos, past)
+        return logits, past, mask
+
+    @staticmethod
+    def _merge(past, mask, n_past, n_mask):
+        """Concatenate two batches along the batch dim, left-padding the shorter one."""
+        if past is None:
+            return n_past, n_mask
+        t_old, t_new = mask.shape[1], n_mask.shape[1]
+        width = max(t_old, t_new)
+
+        def pad_kv(kv, t):
+            return tuple(
+                (F.pad(k, (0, 0, width - t, 0)), F.pad(v, (0, 0, width - t, 0))) for k, v in kv
+            )
+
+        past = pad_kv(past, t_old)
+        n_past = pad_kv(n_past, t_new)
+        merged = tuple(
+            (torch.cat([k1, k2], dim=0), torch.cat([v1, v2], dim=0))
+            for (k1, v1), (k2, v2) in zip(past, n_past)
+        )
+        mask = torch.cat([F.pad(mask, (width - t_old, 0)), F.pad(n_mask, (width - t_new, 0))], dim=0)
+        return merged, mask
+
+    def _drop_finished(self, active, past, mask):
+        keep = [i for i, r in enumerate(active) if not self._finished(r)]
+        for r in active:
+            if self._finished(r):
+                r.out.put(None)
+        if len(keep) == len(active):
+            return active, past, mask
+        if not keep:
+            return [], None, None
+        idx = torch.tensor(keep, device=mask.device)
+        mask = mask.index_select(0, idx)
+        past = tuple((k.index_select(0, idx), v.index_select(0, idx)) for k, v in past)
+        # Trim columns that are padding for every remaining row.
+        first = int((mask.sum(0) > 0).nonzero()[0])
+        if first:
+            mask = mask[:, first:]
+            past = tuple((k[:, :, first:], v[:, :, first:]) for k, v in past)
+        return [active[i] for i in keep], past, mask
+
+    def _finished(self, r) -> bool:
+        return r.cancelled or len(r.generated) >= r.max_new_tokens or (
+            bool(r.generated) and r.generated[-1] in self.eos_ids
+        )
+
+    def _advance(self, reqs, logits):
+        """Sample one token per row and stream the newly decoded text."""
+        next_ids = self._sample(reqs, logits.float())
+        for r, t in zip(reqs, next_ids.tolist()):
+            r.generated.append(t)
+            if t in self.eos_ids:
+                continue
+            text = self.tok.decode(r.generated, skip_special_tokens=True)
+            # Hold back incomplete multi-byte characters until the next token.
+            if len(text) > len(r.text) and not text.endswith("�"):
+                r.out.put(text[len(r.text):])
+                r.text = text
+
+    def _sample(self, reqs, logits):
+        if self.repetition_penalty != 1.0:
+            for i, r in enumerate(reqs):
+                seen = torch.tensor(list(set(r.input_ids + r.generated)), device=logits.device)
+                vals = logits[i, seen]
+                logits[i, seen] = torch.where(vals > 0, vals / self.repetition_penalty, vals * self.repetition_penalty)
+        if self.temperature <= 0:
+            return logits.argmax(-1)
+        probs = torch.softmax(logits / self.temperature, dim=-1)
+        sorted_p, sorted_idx = probs.sort(dim=-1, descending=True)
+        cum = sorted_p.cumsum(-1)
+        sorted_p[(cum - sorted_p) > self.top_p] = 0.0
+        choice = torch.multinomial(sorted_p / sorted_p.sum(-1, keepdim=True), 1)
+        return sorted_idx.gather(-1, choice).squeeze(-1)
+
+
 class StreamLLM:
     """Adapter exposing .stream(prompt) -> iterator[str] for both local Transformers and HF Inference API."""
     def __init__(self):
@@ -19,21 +277,23 @@ class StreamLLM:
         self.token = os.getenv("HF_TOKEN") or None
         self.logger = logger
         self.logger.info("StreamLLM mode=%s model_id=%s", self.mode, self.model_id)
-        if self.mode == "inference_api":
-            self.client = InferenceClient(model=self.model_id, token=self.token)
-            self.backend = "hf-inference-api"
-        elif self.mode == "router":
-            if OpenAI is None:
-                raise RuntimeError("openai package is required for router mode (pip install openai)")
-            # router client uses HF_TOKEN as API key
-            self.router = OpenAI(base_url="https://router.huggingface.co/v1", api_key=self.token)
-            self.backend = "hf-router"
+        if self.mode in ("inference_api", "router"):
+            # Pooled async clients (keep-alive, in-flight cap, rate limit, retries);
+            # the router client doubles as the inference_api fallback. Both use HF_TOKEN.
+            self.router = RemoteLLMClient(ROUTER_BASE_URL, api_key=self.token)
+            if self.mode == "inference_api":
+                self.client = RemoteLLMClient(HF_INFERENCE_URL, api_key=self.token)
+                self.backend = "hf-inference-api"
+            else:
+                self.backend = "hf-router"
         else:
             self._load_local()
             self.backend = "transformers"
 
     def _load_local(self):
         self.logger.info("Loading local model %s", self.model_id)
+        _import_torch()
+        from transformers import AutoModelForCausalLM, AutoTokenizer
         device = "mps" if torch.backends.mps.is_available() else "cpu"
         dtype = torch.bfloat16 if device=="mps" else torch.float16
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_id, use_fast=True, token=self.token)
@@ -44,96 +304,121 @@ class StreamLLM:
         )
         self.device = device
         self.logger.info("Loaded model on device=%s dtype=%s", device, dtype)
+        self.scheduler = GenerationScheduler(self.model, self.tokenizer) if GEN_SCHEDULER else None
+
+    def register_prefix(self, template: str):
+        """Precompute the KV cache for a prompt template's static prefix (local mode only)."""
+        if PREFIX_CACHE and getattr(self, "scheduler", None) is not None:
+            self.scheduler.register_prefix(static_prefix(template))
+
+    def warmup(self) -> bool:
+        """One short local generation so the first request does not pay for lazy
+        CUDA/MPS kernels and allocator growth. Remote modes are skipped: a
+        warm-up there would be a billed request."""
+        if self.backend != "transformers":
+            return False
+        # one new token, consumed to the end, so no generation outlives the warm-up
+        for _ in self._stream("Hello", max_new_tokens=1):
+            pass
+        return True
 
     def stream(self, prompt: str):
-        if self.mode == "inference_api":
-            try:
-                gen = self.client.text_generation(
-                    prompt, stream=True,
-                    max_new_tokens=int(os.getenv("LLM_MAX_TOKENS","512")),
-                    temperature=0.2, top_p=0.9, return_full_text=False
-                )
-            except HfHubHTTPError as e:
-                # Provide clearer logging and guidance for common issues like 404 (model not found)
-                self.logger.error("Hugging Face Inference API call failed for model %s: %s", self.model_id, str(e))
-                raise RuntimeError(
-                    f"Inference API request failed for model '{self.model_id}': {e}.\n"
-                    "Common causes: model id is incorrect, model is private/gated and requires accepting terms, or your HF token is missing/insufficient.\n"
-                    "Remedies: verify the model id on huggingface.co, accept model repo terms, set HF_TOKEN in backend/.env or login with `huggingface-cli login`, and ensure HF_MODE is 'inference_api'."
-                ) from e
+        """Stream generated text chunks, recording TTFT, throughput and in-flight count."""
+        start = time.perf_counter()
+        first = None
+        n = 0
+        # not made current: the caller's code runs between our yields
+        sp = tracing.child_span("llm.generate", backend=self.backend, prompt_chars=len(prompt))
+        LLM_IN_FLIGHT.inc(backend=self.backend)
+        try:
+            for text in self._stream(prompt):
+                if first is None:
+                    first = time.perf_counter()
+                    LLM_TTFT_SECONDS.observe(first - start, backend=self.backend)
+                n += 1
+                yield text
+        finally:
+            LLM_IN_FLIGHT.dec(backend=self.backend)
+            if sp is not None:
+                sp.set(chunks=n, ttft_ms=round((first - start) * 1000, 1) if first else None)
+                sp.finish()
+            LLM_CHUNKS.inc(n, backend=self.backend)
+            if first is not None and n > 1:
+                elapsed = time.perf_counter() - first
+                if elapsed > 0:
+                    LLM_CHUNKS_PER_SECOND.observe((n - 1) / elapsed, backend=self.backend)
 
+    def _stream(self, prompt: str, max_new_tokens: Optional[int] = None):
+        max_new_tokens = max_new_tokens or int(os.getenv("LLM_MAX_TOKENS","512"))
+        if self.mode == "inference_api":
+            gen = self.client.stream_text_generation(
+                self.model_id, prompt,
+                max_new_tokens=max_new_tokens,
+                temperature=0.2, top_p=0.9, return_full_text=False
+            )
+            started = False
             try:
-                for ev in gen:
-                    # ev may be TextGenerationResponseStream
-                    text = getattr(getattr(ev, "token", None), "text", None)
-                    if text is None:
-                        text = str(ev)
+                for text in gen:
+                    started = True
                     yield text
-            except HfHubHTTPError as e:
-                # If inference_api fails with 404/403, try router fallback when possible
-                self.logger.error("Hugging Face Inference API streaming error for model %s: %s", self.model_id, str(e))
-                if OpenAI is not None:
+            except RemoteLLMError as e:
+                if e.status in (403, 404) and not started:
+                    # model not served by the Inference API: try the router instead
+                    self.logger.error("Hugging Face Inference API call failed for model %s: %s", self.model_id, str(e))
                     self.logger.info("Attempting router fallback for model %s", self.model_id)
-                    # attempt router approach if available
                     try:
-                        for t in self._stream_via_router(prompt):
+                        for t in self._stream_via_router(prompt, max_new_tokens):
                             yield t
                         return
                     except Exception as e2:
                         self.logger.error("Router fallback failed: %s", str(e2))
+                    raise RuntimeError(
+                        f"Inference API request failed for model '{self.model_id}': {e}.\n"
+                        "Common causes: model id is incorrect, model is private/gated and requires accepting terms, or your HF token is missing/insufficient.\n"
+                        "Remedies: verify the model id on huggingface.co, accept model repo terms, set HF_TOKEN in backend/.env or login with `huggingface-cli login`, and ensure HF_MODE is 'inference_api'."
+                    ) from e
+                self.logger.error("Hugging Face Inference API streaming error for model %s: %s", self.model_id, str(e))
                 raise RuntimeError(
                     f"Inference API streaming failed for model '{self.model_id}': {e}.\n"
                     "This may indicate a permissions issue or a transient error. Ensure your HF_TOKEN has access and consider retrying."
                 ) from e
         elif self.mode == "router":
             # use router-based streaming exclusively
-            for t in self._stream_via_router(prompt):
+            for t in self._stream_via_router(prompt, max_new_tokens):
                 yield t
+        elif self.scheduler is not None:
+            # shared continuous-batching scheduler instead of one generate() thread per call
+            for text in self.scheduler.submit(prompt, max_new_tokens):
+                yield text
         else:
+            from transformers import TextIteratorStreamer
             inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
             streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
             gen_kwargs = dict(
                 **inputs,
                 streamer=streamer,
-                max_new_tokens=int(os.getenv("LLM_MAX_TOKENS","512")),
+                max_new_tokens=max_new_tokens,
                 do_sample=True, temperature=0.2, top_p=0.9, repetition_penalty=1.1
             )
             thread = Thread(target=self.model.generate, kwargs=gen_kwargs)
             thread.start()
             for text in streamer:
                 yield text
+            thread.join()
 
-    def _stream_via_router(self, prompt: str):
-        """Stream text from Hugging Face OpenAI-compatible router using openai.OpenAI client."""
-        if OpenAI is None:
-            raise RuntimeError("openai package not available; install with pip install openai")
+    def _stream_via_router(self, prompt: str, max_new_tokens: int):
+        """Stream text from the Hugging Face OpenAI-compatible router."""
         # Build a simple chat message; some router models expect chat format
         messages = [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ]
-        model_id = self.model_id
-        # If model id doesn't include a provider suffix, try using as-is
-        stream = self.router.chat.completions.create(
-            model=model_id,
-            messages=messages,
-            stream=True,
-            max_tokens=int(os.getenv("LLM_MAX_TOKENS","512")),
+        yield from self.router.stream_chat(
+            self.model_id, messages,
+            max_tokens=max_new_tokens,
             temperature=0.2,
             top_p=0.9,
         )
-        for chunk in stream:
-            # try attribute access first (openai SDK returns objects with .choices)
-            text = None
-            try:
-                text = chunk.choices[0].delta.content
-            except Exception:
-                try:
-                    text = chunk["choices"][0]["delta"].get("content")
-                except Exception:
-                    text = None
-            if text:
-                yield text
 
 def load_llm():
     return StreamLLM()
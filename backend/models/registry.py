@@ -0,0 +1,101 @@
+import threading, time, logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+
+if TYPE_CHECKING:  # imported inside the loaders: both pull in torch and take seconds
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+
+logger = logging.getLogger("backend.models.registry")
+
+# Process-wide registry: every retriever/script asks here instead of building
+# its own SentenceTransformer / CrossEncoder / PersistentClient.
+_lock = threading.Lock()
+_key_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+_objects: Dict[Tuple[str, str, str], object] = {}
+_stats: Dict[Tuple[str, str, str], dict] = {}
+
+
+def _param_bytes(obj) -> int:
+    """Approximate resident size of a torch-backed model (params + buffers)."""
+    module = getattr(obj, "model", obj)  # CrossEncoder wraps the nn.Module in .model
+    total = 0
+    for attr in ("parameters", "buffers"):
+        fn = getattr(module, attr, None)
+        if fn is None:
+            continue
+        for t in fn():
+            total += t.numel() * t.element_size()
+    return total
+
+
+def _get_or_load(kind: str, name: str, device: str, loader: Callable[[], object]):
+    key = (kind, name, device)
+    obj = _objects.get(key)
+    if obj is not None:
+        return obj
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    # Per-key lock so two different models can load concurrently while the
+    # same model is never loaded twice.
+    with key_lock:
+        obj = _objects.get(key)
+        if obj is not None:
+            return obj
+        start_ts = time.time()
+        obj = loader()
+        load_s = time.time() - start_ts
+        _objects[key] = obj
+        _stats[key] = {
+            "kind": kind,
+            "name": name,
+            "device": device,
+            "load_seconds": round(load_s, 3),
+            "bytes": _param_bytes(obj) if kind != "chroma" else 0,
+        }
+        logger.info("Registry loaded %s %s on %s in %.2fs", kind, name, device, load_s)
+        return obj
+
+
+def _sentence_transformer(name: str, device: str) -> "SentenceTransformer":
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name, device=device)
+
+
+def _cross_encoder(name: str, device: str) -> "CrossEncoder":
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(name, device=device)
+
+
+def get_embedder(name: str, device: str = "cpu") -> "SentenceTransformer":
+    return _get_or_load("embedder", name, device, lambda: _sentence_transformer(name, device))
+
+
+def _quantized_cross_encoder(name: str) -> "CrossEncoder":
+    import torch
+    ce = _cross_encoder(name, "cpu")
+    # int8 dynamic quantization of the Linear layers: smaller and faster on CPU
+    ce.model = torch.quantization.quantize_dynamic(ce.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return ce
+
+
+def get_reranker(name: str, device: str = "cpu", int8: bool = False) -> "CrossEncoder":
+    if int8:
+        return _get_or_load("reranker", name, "cpu-int8", lambda: _quantized_cross_encoder(name))
+    return _get_or_load("reranker", name, device, lambda: _cross_encoder(name, device))
+
+
+def _chroma_client(path: str, allow_reset: bool):
+    import chromadb
+    from chromadb.config import Settings
+    return chromadb.PersistentClient(path=path, settings=Settings(allow_reset=allow_reset))
+
+
+def get_chroma_client(path: str, allow_reset: bool = False):
+    return _get_or_load("chroma", path, "-", lambda: _chroma_client(path, allow_reset))
+
+
+def memory_report() -> List[dict]:
+    """Return one entry per loaded object with its approximate memory footprint."""
+    out = []
+    for st in list(_stats.values()):
+        out.append(dict(st, megabytes=round(st["bytes"] / (1024 * 1024), 1)))
+    return out
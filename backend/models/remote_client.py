@@ -0,0 +1,259 @@
+import os, json, time, random, queue, asyncio, threading, logging
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+import httpx
+
+logger = logging.getLogger("backend.models.remote_client")
+
+ROUTER_BASE_URL = os.getenv("ROUTER_BASE_URL", "https://router.huggingface.co/v1")
+HF_INFERENCE_URL = os.getenv("HF_INFERENCE_URL", "https://api-inference.huggingface.co/models")
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+LLM_RATE_PER_S = float(os.getenv("LLM_RATE_PER_S", "0"))   # 0 = no rate limit
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class RemoteLLMError(RuntimeError):
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` requests/s on average, bursts up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RemoteLLMClient:
+    """Async streaming client for OpenAI-compatible and HF text-generation endpoints.
+
+    All requests share one keep-alive httpx.AsyncClient on a dedicated event
+    loop thread, capped at ``max_in_flight`` concurrent streams and shaped by
+    a token bucket. Failed requests (connect errors, 429, 5xx) are retried
+    with jittered backoff as long as no token has been produced yet.
+    ``astream_*`` are for async callers on any event loop and ``stream_*``
+    bridge to sync generators for the agents running in worker threads;
+    both run the request on the client's own loop, so the pool, semaphore
+    and token bucket are only ever used from that loop.
+    """
+
+    def __init__(
+        self, base_url: str, api_key: Optional[str] = None,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT, pool_size: int = LLM_POOL_SIZE,
+        rate_per_s: float = LLM_RATE_PER_S, burst: int = LLM_BURST,
+        max_retries: int = LLM_MAX_RETRIES, timeout_s: float = LLM_TIMEOUT_S,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_in_flight = max_in_flight
+        self.pool_size = pool_size
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.max_retries = max_retries
+        self.timeout_s = timeout_s
+        self.in_flight = 0
+        self.retries = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._http: Optional[httpx.AsyncClient] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._bucket: Optional[TokenBucket] = None
+
+    # -- event loop ---------------------------------------------------------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="remote-llm", daemon=True)
+                self._thread.start()
+                self._loop = loop
+        return self._loop
+
+    def _setup(self):
+        # called on the client loop only: the pool and asyncio primitives are bound to it
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout_s, connect=min(10.0, self.timeout_s)),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else None,
+            )
+            self._sem = asyncio.Semaphore(self.max_in_flight)
+            self._bucket = TokenBucket(self.rate_per_s, self.burst)
+
+    async def _aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def aclose(self):
+        if self._loop is not None:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._aclose(), self._loop))
+
+    def close(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._aclose(), self._loop).result(timeout=5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+    # -- requests -----------------------------------------------------------
+
+    async def _stream_sse(self, url: str, payload: Dict) -> AsyncIterator[Dict]:
+        """POST payload and yield each decoded SSE ``data:`` event."""
+        self._setup()
+        async with self._sem:
+            self.in_flight += 1
+            try:
+                attempt = 0
+                while True:
+                    await self._bucket.acquire()
+                    started = False
+                    try:
+                        async with self._http.stream("POST", url, json=payload) as resp:
+                            if resp.status_code >= 400:
+                                body = (await resp.aread()).decode("utf-8", "replace")[:500]
+                                ra = resp.headers.get("Retry-After", "")
+                                raise RemoteLLMError(
+                                    f"{url} returned {resp.status_code}: {body}", resp.status_code,
+                                    retry_after=float(ra) if ra.replace(".", "", 1).isdigit() else None,
+                                )
+                            async for line in resp.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    continue  # drain to the end so the connection goes back to the pool
+                                started = True
+                                yield json.loads(data)
+                        return
+                    except (httpx.TransportError, RemoteLLMError) as e:
+                        status = getattr(e, "status", None)
+                        retryable = status is None or status in RETRY_STATUS
+                        if started or not retryable or attempt >= self.max_retries:
+                            if isinstance(e, RemoteLLMError):
+                                raise
+                            raise RemoteLLMError(f"{url} failed: {e}") from e
+                        delay = backoff_delay(attempt)
+                        if getattr(e, "retry_after", None) is not None:
+                            delay = max(delay, min(e.retry_after, 30.0))
+                        attempt += 1
+                        self.retries += 1
+                        logger.warning("Remote LLM call failed (%s); retry %d in %.2fs", e, attempt, delay)
+                        await asyncio.sleep(delay)
+            finally:
+                self.in_flight -= 1
+
+    async def _achat(self, model: str, messages: List[Dict], **params) -> AsyncIterator[str]:
+        payload = dict(params, model=model, messages=messages, stream=True)
+        async for ev in self._stream_sse(f"{self.base_url}/chat/completions", payload):
+            for choice in ev.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+    async def _atext_generation(self, model: str, prompt: str, **params) -> AsyncIterator[str]:
+        payload = {"inputs": prompt, "parameters": params, "stream": True}
+        async for ev in self._stream_sse(f"{self.base_url}/{model}", payload):
+            tok = ev.get("token") or {}
+            if tok.get("text") and not tok.get("special"):
+                yield tok["text"]
+
+    _DONE = object()
+
+    def _pump(self, agen: AsyncIterator[str], put) -> "asyncio.Future":
+        """Run agen on the client loop, handing each item, error and the end marker to put."""
+
+        async def pump():
+            try:
+                async for text in agen:
+                    put(text)
+            except Exception as e:  # surfaced to the caller
+                put(e)
+            finally:  # cancellation propagates; the caller still sees the end marker
+                put(self._DONE)
+
+        return asyncio.run_coroutine_threadsafe(pump(), self._ensure_loop())
+
+    async def _relay(self, agen: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Consume an async generator on the client loop from a caller on another loop."""
+        caller = asyncio.get_running_loop()
+        out: "asyncio.Queue" = asyncio.Queue()
+
+        def put(item):
+            try:
+                caller.call_soon_threadsafe(out.put_nowait, item)
+            except RuntimeError:  # caller's loop already closed
+                pass
+
+        fut = self._pump(agen, put)
+        try:
+            while True:
+                item = await out.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            fut.cancel()  # caller stopped early: free the connection and slot
+
+    def _bridge(self, agen: AsyncIterator[str]) -> Iterator[str]:
+        """Consume an async generator on the client loop from a sync caller."""
+        out: "queue.Queue" = queue.Queue()
+        fut = self._pump(agen, out.put)
+        try:
+            while True:
+                item = out.get()
+                if item is self._DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            fut.cancel()  # caller stopped early: free the connection and slot
+
+    def astream_chat(self, model: str, messages: List[Dict], **params) -> AsyncIterator[str]:
+        """OpenAI-compatible /chat/completions streaming."""
+        return self._relay(self._achat(model, messages, **params))
+
+    def astream_text_generation(self, model: str, prompt: str, **params) -> AsyncIterator[str]:
+        """HF text-generation-inference streaming (``token.text`` events)."""
+        return self._relay(self._atext_generation(model, prompt, **params))
+
+    def stream_chat(self, model: str, messages: List[Dict], **params) -> Iterator[str]:
+        return self._bridge(self._achat(model, messages, **params))
+
+    def stream_text_generation(self, model: str, prompt: str, **params) -> Iterator[str]:
+        return self._bridge(self._atext_generation(model, prompt, **params))
+
+    def stats(self) -> Dict:
+        return {"base_url": self.base_url, "in_flight": self.in_flight, "max_in_flight": self.max_in_flight, "retries": self.retries}
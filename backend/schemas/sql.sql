@@ -85,3 +85,44 @@ CREATE TABLE IF NOT EXISTS ragas_runs (
   metrics_json TEXT,
   created_at TEXT DEFAULT CURRENT_TIMESTAMP
 );
+
+CREATE TABLE IF NOT EXISTS answer_cache (
+  cache_key TEXT PRIMARY KEY,
+  agent TEXT NOT NULL,
+  answer TEXT NOT NULL,
+  gen_seconds REAL,
+  created_at REAL NOT NULL,
+  last_used_at REAL NOT NULL,
+  hits INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS answer_cache_docs (
+  cache_key TEXT NOT NULL,
+  doc_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_answer_cache_docs_doc ON answer_cache_docs(doc_id);
+CREATE INDEX IF NOT EXISTS idx_answer_cache_docs_key ON answer_cache_docs(cache_key);
+CREATE INDEX IF NOT EXISTS idx_answer_cache_created ON answer_cache(created_at);
+CREATE INDEX IF NOT EXISTS idx_answer_cache_last_used ON answer_cache(last_used_at);
+
+CREATE TABLE IF NOT EXISTS pending_streams (
+  token TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pending_streams_expires ON pending_streams(expires_at);
+CREATE INDEX IF NOT EXISTS idx_pending_streams_user ON pending_streams(user_id);
+
+CREATE TABLE IF NOT EXISTS trace_spans (
+  trace_id TEXT NOT NULL,
+  span_id TEXT NOT NULL,
+  parent_id TEXT,
+  name TEXT NOT NULL,
+  start_ts REAL NOT NULL,
+  duration_ms REAL NOT NULL,
+  thread TEXT,
+  attrs TEXT,
+  error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trace_spans_trace ON trace_spans(trace_id);
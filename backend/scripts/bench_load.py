@@ -0,0 +1,382 @@
+"""End-to-end load test of the chat API with deterministic stub models.
+
+Starts the FastAPI app in-process (uvicorn on a free port) against a scratch
+SQLite database and an mmap vector store built from backend/data, with
+local stand-ins for the embedder, the cross-encoder and the LLM. The numbers
+therefore measure the serving path (admission, routing, retrieval plumbing,
+graph, checkpoints, WebSocket streaming), not model speed; per-token and
+per-call latencies are configurable to emulate a backend.
+
+Every virtual user runs /api/session/create, then --turns times
+/api/chat/send followed by the WebSocket stream, all users concurrently.
+A 429 from admission is retried after its Retry-After.
+
+Run from the project root:
+    python -m backend.scripts.bench_load [--sessions 32] [--turns 3] [--token-ms 5]
+        [--llm stub|server] [--json] [--out report.json]
+"""
+import os, re, sys, json, time, zlib, atexit, socket, shutil, asyncio, logging, argparse, tempfile, threading, statistics
+from collections import Counter
+
+DATA_DIR = "backend/data"
+SCHEMA_PATH = "backend/schemas/sql.sql"
+TABLES = ("sessions", "messages", "checkpoints", "provenance", "answer_cache", "pending_streams")
+
+# Deterministic question mix, cycled by session and turn (keyword routes in comments).
+QUESTIONS = [
+    "What's my copay for an emergency room visit?",           # benefit
+    "Why was my claim denied?",                               # claim
+    "Does my plan cover ER and why was this claim denied?",   # both
+    "Show me {claim_id}",                                     # lookup
+    "How much of my deductible is left on my plan?",          # benefit
+    "When will my last claim be paid?",                       # claim
+]
+
+_WORD = re.compile(r"[a-z0-9_]+")
+_VOCAB = ("coverage", "copay", "claim", "denied", "deductible", "provider", "network", "allowed", "paid", "plan")
+
+
+# ---------------------------
+# Stub models
+# ---------------------------
+class HashEmbedder:
+    """Signed feature hashing of words: same text, same vector; shared words, similar vectors."""
+
+    def __init__(self, dim: int = 384, latency_s: float = 0.0):
+        self.dim = dim
+        self.latency_s = latency_s
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32, **kwargs):
+        import numpy as np
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for w in _WORD.findall(text.lower()):
+                h = zlib.crc32(w.encode())
+                out[i, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms == 0, 1.0, norms)
+        return out[0] if single else out
+
+
+class OverlapCrossEncoder:
+    """Scores (query, doc) pairs by word overlap."""
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+
+    def predict(self, pairs, **kwargs):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        out = []
+        for q, d in pairs:
+            qw, dw = set(_WORD.findall(q.lower())), set(_WORD.findall(d.lower()))
+            out.append(len(qw & dw) / (len(qw | dw) or 1))
+        return out
+
+
+def make_stub_llm(tokens: int, token_latency_s: float):
+    from backend.models.model_loader import StreamLLM
+
+    class StubLLM(StreamLLM):
+        """StreamLLM emitting prompt-seeded words with a fixed delay per token.
+
+        Inherits stream(), so TTFT / chunks-per-second metrics and the
+        llm.generate span are recorded exactly as for a real backend.
+        """
+
+        def __init__(self):
+            self.mode = self.backend = "stub"
+            self.model_id = "stub-llm"
+            self.logger = logging.getLogger("backend.scripts.bench_load")
+
+        def register_prefix(self, template: str):
+            pass
+
+        def _stream(self, prompt: str):
+            seed = zlib.crc32(prompt.encode())
+            for i in range(tokens):
+                if token_latency_s:
+                    time.sleep(token_latency_s)
+                yield _VOCAB[(seed + i) % len(_VOCAB)] + " "
+
+    return StubLLM()
+
+
+# ---------------------------
+# Environment
+# ---------------------------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def configure_env(args, workdir: str):
+    """Settings that backend modules read at import time; call before importing them."""
+    os.environ["DB_PATH"] = os.path.join(workdir, "app.db")
+    os.environ["VECTOR_BACKEND"] = "mmap"
+    os.environ["VECTOR_PATH"] = os.path.join(workdir, "vectors")
+    os.environ["ANSWER_CACHE"] = "true" if args.answer_cache else "false"
+    os.environ.setdefault("TRACE_SINK", "off")
+    os.environ.setdefault("ROUTER_MODE", "keyword")
+    if args.server_concurrency:
+        os.environ["ADMISSION_MAX_CONCURRENCY"] = str(args.server_concurrency)
+    if args.llm == "server":
+        os.environ["HF_MODE"] = "router"
+
+    import sqlite3
+    with open(SCHEMA_PATH) as f, sqlite3.connect(os.environ["DB_PATH"]) as con:
+        con.executescript(f.read())
+
+
+def install_models(args):
+    """Put the stub embedder / cross-encoder into the shared registry and index backend/data."""
+    from backend.models import registry
+    from backend.agents import retrieval, rerank, vector_store
+    from backend.agents.documents import DOC_BUILDERS
+
+    embedder = HashEmbedder(latency_s=args.embed_ms / 1000)
+    cross_encoder = OverlapCrossEncoder(latency_s=args.rerank_ms / 1000)
+    for name in {retrieval.EMBEDDING_MODEL, os.getenv("ROUTER_MODEL", retrieval.EMBEDDING_MODEL)}:
+        registry._objects[("embedder", name, "cpu")] = embedder
+    device = "cpu-int8" if rerank.RERANKER_INT8 else "cpu"
+    registry._objects[("reranker", retrieval.RERANKER_MODEL, device)] = cross_encoder
+
+    for collection, fname in (("claims", "claims_synthetic.json"), ("benefits", "benefits.json")):
+        with open(os.path.join(DATA_DIR, fname)) as f:
+            docs = [DOC_BUILDERS[collection](rec) for rec in json.load(f)]
+        store = vector_store.open_store(collection, backend="mmap")
+        store.upsert(
+            [d[0] for d in docs], [d[1] for d in docs], [d[2] for d in docs],
+            embedder.encode([d[1] for d in docs]).tolist(),
+        )
+        store.flush()
+
+
+def start_server(args):
+    import uvicorn
+
+    if args.llm == "server":
+        from backend.scripts import stub_llm_server
+        stub = stub_llm_server.serve(state=stub_llm_server.StubState(
+            tokens=[w + " " for w in _VOCAB * (args.tokens // len(_VOCAB) + 1)][:args.tokens],
+            token_latency_s=args.token_ms / 1000,
+        ))
+        os.environ["ROUTER_BASE_URL"] = f"http://127.0.0.1:{stub.server_address[1]}/v1"
+
+    from backend import main
+    if args.llm == "stub":
+        llm = make_stub_llm(args.tokens, args.token_ms / 1000)
+        main.load_llm = lambda: llm
+
+    # main installs INFO handlers on the root logger; keep the run quiet
+    logging.getLogger().setLevel(logging.WARNING)
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("server failed to start")
+        time.sleep(0.05)
+    if not main.boot.wait(timeout=300):
+        raise RuntimeError(f"server not ready: {main.boot.report()}")
+    return server, thread, port
+
+
+def db_snapshot():
+    from backend.agents import db, ckpt_store
+    ckpt_store.flush()  # count write-behind checkpoints as written
+    rows = {}
+    for table in TABLES:
+        try:
+            rows[table] = db.query_one(f"SELECT COUNT(*) FROM {table}")[0]
+        except Exception:
+            rows[table] = 0
+    return db.total_changes(), rows
+
+
+# ---------------------------
+# Load generation
+# ---------------------------
+def question(i: int, turn: int, claim_ids) -> str:
+    q = QUESTIONS[(i + turn) % len(QUESTIONS)]
+    return q.format(claim_id=claim_ids[(i * 7 + turn) % len(claim_ids)])
+
+
+async def one_request(client, ws_base: str, session_id: str, user_id: str, text: str) -> dict:
+    import websockets
+    t0 = time.perf_counter()
+    rejected = 0
+    while True:
+        r = await client.post("/api/chat/send", json={"session_id": session_id, "user_id": user_id, "text": text})
+        if r.status_code != 429:
+            break
+        rejected += 1
+        await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+    r.raise_for_status()
+
+    res = {"rejected": rejected, "ok": False, "error": None, "agents": [], "queue_events": 0, "tokens": 0}
+    first_event = first_token = None
+    async with websockets.connect(ws_base + r.json()["stream_url"], max_size=None) as ws:
+        async for raw in ws:
+            now = time.perf_counter()
+            msg = json.loads(raw)
+            kind = msg.get("type")
+            if first_event is None:
+                first_event = now
+            if kind == "queue":
+                res["queue_events"] += 1
+            elif kind == "token":
+                res["tokens"] += 1
+                if first_token is None:
+                    first_token = now
+            elif kind == "agent_start":
+                res["agents"].append(msg["data"]["agent"])
+            elif kind == "done":
+                res["ok"] = True
+                break
+            elif kind == "error":
+                res["error"] = str(msg.get("data"))
+                break
+    end = time.perf_counter()
+    res["e2e_ms"] = (end - t0) * 1000
+    res["first_event_ms"] = (first_event - t0) * 1000 if first_event else None
+    res["first_token_ms"] = (first_token - t0) * 1000 if first_token else None
+    return res
+
+
+async def virtual_user(i: int, base: str, args, users, claim_ids, results: list):
+    import httpx
+    ws_base = base.replace("http://", "ws://", 1)
+    async with httpx.AsyncClient(base_url=base, timeout=args.timeout) as client:
+        r = await client.post("/api/session/create", json={"user_id": users[i % len(users)]})
+        r.raise_for_status()
+        sess = r.json()
+        for turn in range(args.turns):
+            try:
+                res = await one_request(client, ws_base, sess["session_id"], sess["user_id"], question(i, turn, claim_ids))
+            except Exception as e:
+                res = {"ok": False, "error": f"{type(e).__name__}: {e}", "rejected": 0, "agents": []}
+            results.append(res)
+
+
+def _dist(values) -> dict:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {}
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))]
+    return {
+        "mean": round(statistics.mean(values), 2),
+        "p50": round(pick(0.50), 2),
+        "p95": round(pick(0.95), 2),
+        "p99": round(pick(0.99), 2),
+        "max": round(values[-1], 2),
+    }
+
+
+async def run_load(args, port: int) -> dict:
+    with open(os.path.join(DATA_DIR, "benefits.json")) as f:
+        users = [r["user_id"] for r in json.load(f) if r.get("user_id")]
+    with open(os.path.join(DATA_DIR, "claims.json")) as f:
+        claim_ids = [r["claim_id"] for r in json.load(f)]
+    base = f"http://127.0.0.1:{port}"
+    results: list = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(virtual_user(i, base, args, users, claim_ids, results) for i in range(args.sessions)))
+    elapsed = time.perf_counter() - t0
+
+    import httpx
+    async with httpx.AsyncClient(base_url=base) as client:
+        admission = (await client.get("/api/admission")).json()
+        answers = (await client.get("/api/cache/answers")).json()
+    ok = [r for r in results if r["ok"]]
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "error_samples": sorted({r["error"] for r in results if r.get("error")})[:5],
+        "rejected_429": sum(r["rejected"] for r in results),
+        "duration_s": round(elapsed, 3),
+        "requests_per_s": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "end_to_end": _dist(r["e2e_ms"] for r in ok),
+            "first_event": _dist(r["first_event_ms"] for r in ok),
+            "first_token": _dist(r["first_token_ms"] for r in ok),
+        },
+        "routes": dict(Counter("+".join(sorted(set(r["agents"]))) or "none" for r in ok)),
+        "queued_requests": sum(1 for r in ok if r["queue_events"]),
+        "admission": admission,
+        "answer_cache": answers,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=32, help="concurrent virtual users")
+    ap.add_argument("--turns", type=int, default=3, help="questions per session, sent one after another")
+    ap.add_argument("--tokens", type=int, default=40, help="tokens per LLM answer")
+    ap.add_argument("--token-ms", type=float, default=5.0, help="stub LLM latency per token")
+    ap.add_argument("--embed-ms", type=float, default=0.0, help="stub embedder latency per encode call")
+    ap.add_argument("--rerank-ms", type=float, default=0.0, help="stub cross-encoder latency per predict call")
+    ap.add_argument("--llm", choices=("stub", "server"), default="stub",
+                    help="in-process stub, or the remote client against stub_llm_server")
+    ap.add_argument("--server-concurrency", type=int, default=0, help="ADMISSION_MAX_CONCURRENCY for the run")
+    ap.add_argument("--answer-cache", action="store_true", help="keep the answer cache on")
+    ap.add_argument("--timeout", type=float, default=120.0)
+    ap.add_argument("--keep", action="store_true", help="keep the scratch DB and vector store")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    ap.add_argument("--out", help="also write the JSON report to this file")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    if not args.keep:
+        # registered before the backend imports, so it runs after their atexit flushes
+        atexit.register(shutil.rmtree, workdir, True)
+    configure_env(args, workdir)
+    install_models(args)
+    server, thread, port = start_server(args)
+    try:
+        writes0, rows0 = db_snapshot()
+        report = asyncio.run(run_load(args, port))
+        writes1, rows1 = db_snapshot()
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    report["db"] = {
+        "writes": writes1 - writes0,
+        "writes_per_request": round((writes1 - writes0) / report["ok"], 2) if report["ok"] else None,
+        "rows_added": {t: rows1[t] - rows0[t] for t in TABLES},
+    }
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("json", "out", "keep")}
+    if args.keep:
+        report["workdir"] = workdir
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    lat = report["latency_ms"]
+    print(f"{report['ok']}/{report['requests']} ok in {report['duration_s']}s "
+          f"({report['requests_per_s']} req/s), {report['rejected_429']} x 429")
+    print(f"{'ms':<14}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name in ("end_to_end", "first_event", "first_token"):
+        d = lat[name]
+        print(f"{name:<14}" + "".join(f"{d.get(k, '-'):>10}" for k in ("mean", "p50", "p95", "p99", "max")))
+    print(f"routes: {report['routes']}")
+    print(f"db writes: {report['db']['writes']} ({report['db']['writes_per_request']}/request) "
+          f"rows added: {report['db']['rows_added']}")
+    if report["errors"]:
+        print(f"errors: {report['error_samples']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
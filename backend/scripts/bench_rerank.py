@@ -0,0 +1,88 @@
+"""Reranking latency vs ranking quality on claims_synthetic.json.
+
+Candidates come from an in-memory embedding search over the claim documents
+(no Chroma needed); each configuration reorders the same candidate lists.
+
+Run from the project root:
+    python -m backend.scripts.bench_rerank [--k 20] [--final-k 5] [--json]
+"""
+import os, json, time, argparse
+import numpy as np
+from backend.agents.documents import claim_doc
+from backend.agents.rerank import Reranker
+from backend.models import registry
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-large-en-v1.5")
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+
+def build_queries(records):
+    # Paraphrased, member-style questions whose answer is exactly one claim.
+    return [
+        (f"What happened with my {r['status'].lower()} claim at {r['provider']} on {r['service_date']}?", r["claim_id"])
+        for r in records
+    ]
+
+
+def evaluate(name, queries, cand_lists, reranker, final_k, passes=1):
+    lat, rr, hit1 = [], 0.0, 0
+    for _ in range(passes):  # only the last pass is measured (warms the score cache)
+        lat, rr, hit1 = [], 0.0, 0
+        for (q, target), cands in zip(queries, cand_lists):
+            t0 = time.perf_counter()
+            if reranker is None:
+                top = [(c, None) for c in cands[:final_k]]
+            else:
+                top = reranker.rank(q, cands, final_k)
+            lat.append((time.perf_counter() - t0) * 1000)
+            ids = [c[0] for c, _ in top]
+            if target in ids:
+                rr += 1.0 / (ids.index(target) + 1)
+                hit1 += ids[0] == target
+    lat.sort()
+    n = len(queries)
+    return {
+        "config": name,
+        "mrr": round(rr / n, 4),
+        "recall_at_1": round(hit1 / n, 4),
+        "mean_ms": round(sum(lat) / n, 3),
+        "p95_ms": round(lat[min(n - 1, int(n * 0.95))], 3),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--data", default="backend/data/claims_synthetic.json")
+    ap.add_argument("--k", type=int, default=20)
+    ap.add_argument("--final-k", type=int, default=5)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    with open(args.data) as f:
+        records = json.load(f)
+    docs = [claim_doc(r) for r in records]
+    embedder = registry.get_embedder(EMBEDDING_MODEL)
+    doc_vecs = embedder.encode([d[1] for d in docs], normalize_embeddings=True)
+    queries = build_queries(records)
+    q_vecs = embedder.encode([q for q, _ in queries], normalize_embeddings=True)
+    cand_lists = [[docs[i] for i in np.argsort(-(doc_vecs @ qv))[:args.k]] for qv in q_vecs]
+
+    fp32 = registry.get_reranker(RERANKER_MODEL)
+    int8 = registry.get_reranker(RERANKER_MODEL, int8=True)
+    results = [
+        evaluate("embedding-only", queries, cand_lists, None, args.final_k),
+        evaluate("fp32", queries, cand_lists, Reranker(fp32, cache_size=0), args.final_k),
+        evaluate("int8", queries, cand_lists, Reranker(int8, cache_size=0), args.final_k),
+        evaluate("fp32+score-cache", queries, cand_lists, Reranker(fp32), args.final_k, passes=2),
+    ]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'config':<18}{'MRR':>8}{'R@1':>8}{'mean ms':>10}{'p95 ms':>10}")
+    for r in results:
+        print(f"{r['config']:<18}{r['mrr']:>8}{r['recall_at_1']:>8}{r['mean_ms']:>10}{r['p95_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
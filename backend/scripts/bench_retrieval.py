@@ -0,0 +1,238 @@
+"""Retrieval quality vs latency over a grid of RETRIEVE_K / FINAL_K / embedding model / reranking.
+
+Labeled queries are built from claims_synthetic.json and benefits.json
+(claim-, member- and provider-specific for claims, member- and plan-specific
+for benefits) and run through ClaimRetriever / BenefitRetriever.search, so
+member partitions, metadata filters and the rerank bypass behave as in
+serving. Each embedding model gets its own scratch mmap index, and the
+embedding and rerank caches are off so every query pays for every stage.
+Per-stage latency is read from the retrieval trace spans.
+
+Every configuration is stored as one ragas_runs row (metrics_json holds the
+config, the metrics and the git commit), so runs can be compared across
+releases with --history.
+
+Run from the project root:
+    python -m backend.scripts.bench_retrieval [--k 10,20] [--final-k 5] [--models MODEL,...]
+        [--rerank on,off] [--label NAME] [--json]
+    python -m backend.scripts.bench_retrieval --history 20
+Model "hash" and reranker "overlap" are the deterministic stand-ins of bench_load.
+"""
+import os, json, time, uuid, argparse, tempfile, itertools, subprocess
+from collections import defaultdict
+
+os.environ.setdefault("TRACE_SINK", "off")  # spans are read in-process, not exported
+
+from backend import tracing
+from backend.agents import db
+from backend.agents.documents import DOC_BUILDERS
+from backend.agents.rerank import Reranker
+from backend.agents.retrieval import EMBEDDING_MODEL, RERANKER_MODEL, BenefitRetriever, ClaimRetriever
+from backend.agents.vector_store import MmapStore
+from backend.models import registry
+from backend.models.embedding_cache import EmbeddingCache
+from backend.scripts.bench_load import HashEmbedder, OverlapCrossEncoder
+
+DATASET = "retrieval:claims_synthetic+benefits"
+DATA = {"claims": "backend/data/claims_synthetic.json", "benefits": "backend/data/benefits.json"}
+STAGES = {"embed": "embed", "vector_query": "retrieval.vector_query", "rerank": "rerank", "search": "retrieval.search"}
+
+RAGAS_SCHEMA = """CREATE TABLE IF NOT EXISTS ragas_runs (
+  run_id TEXT PRIMARY KEY,
+  dataset_name TEXT,
+  metrics_json TEXT,
+  created_at TEXT DEFAULT CURRENT_TIMESTAMP
+)"""
+INSERT_SQL = "INSERT INTO ragas_runs(run_id,dataset_name,metrics_json) VALUES (?,?,?)"
+HISTORY_SQL = "SELECT run_id,created_at,metrics_json FROM ragas_runs WHERE dataset_name=? ORDER BY created_at DESC, rowid DESC LIMIT ?"
+
+
+def build_queries(records):
+    """(collection, kind, question, relevant doc ids) for every labeled question."""
+    out = []
+    by_member, by_provider = defaultdict(list), defaultdict(list)
+    for r in records["claims"]:
+        by_member[r["member_id"]].append(r["claim_id"])
+        by_provider[(r["provider"], r["status"])].append(r["claim_id"])
+        out.append(("claims", "claim",
+                    f"Why is my {r['status'].lower()} claim at {r['provider']} billed {r['billed_amount']} not fully paid?",
+                    {r["claim_id"]}))
+    for member_id, ids in by_member.items():
+        out.append(("claims", "member", f"List the claims for member {member_id}", set(ids)))
+    for (provider, status), ids in by_provider.items():
+        out.append(("claims", "provider", f"Which claims from {provider} are {status.lower()}?", set(ids)))
+    for r in records["benefits"]:
+        out.append(("benefits", "member", f"How much deductible does member {r['member_id']} have left?", {r["benefit_id"]}))
+        out.append(("benefits", "plan", f"Who has the {r['plan_name']} plan effective {r['effective_date']}?", {r["benefit_id"]}))
+    return out
+
+
+def load_models(model: str, reranker_model: str):
+    if model == "hash":
+        registry._objects.setdefault(("embedder", "hash", "cpu"), HashEmbedder())
+    if reranker_model == "overlap":
+        registry._objects.setdefault(("reranker", "overlap", "cpu"), OverlapCrossEncoder())
+    return registry.get_embedder(model), registry.get_reranker(reranker_model)
+
+
+def build_index(model: str, embedder, records, root: str):
+    """Scratch mmap store per collection embedded with model; returns (stores, seconds)."""
+    t0 = time.perf_counter()
+    stores = {}
+    for collection, recs in records.items():
+        docs = [DOC_BUILDERS[collection](r) for r in recs]
+        store = MmapStore(collection, root=os.path.join(root, model.replace("/", "__")))
+        vecs = embedder.encode([d[1] for d in docs], batch_size=64, normalize_embeddings=True)
+        store.upsert([d[0] for d in docs], [d[1] for d in docs], [d[2] for d in docs], vecs.tolist())
+        store.flush()
+        stores[collection] = store
+    return stores, time.perf_counter() - t0
+
+
+class NoRerank:
+    """Keeps the vector store order (rerank=off)."""
+
+    def rank(self, query, cands, final_k, scores=None, force=False):
+        return [(c, None) for c in cands[:final_k]]
+
+
+def evaluate(retrievers, queries, k: int, final_k: int):
+    """Recall@final_k, MRR and per-stage latency of one configuration."""
+    per_kind = defaultdict(lambda: [0, 0.0, 0.0])  # n, recall sum, reciprocal rank sum
+    lat = defaultdict(list)
+    for collection, kind, q, relevant in queries:
+        with tracing.start_trace("bench_retrieval") as root:
+            _, prov = retrievers[collection].search(q, k=k, final_k=final_k)
+        ids = [p["doc_id"] for p in prov]
+        ranks = [i for i, d in enumerate(ids) if d in relevant]
+        acc = per_kind[f"{collection}/{kind}"]
+        acc[0] += 1
+        acc[1] += len(ranks) / min(len(relevant), final_k)
+        acc[2] += 1.0 / (ranks[0] + 1) if ranks else 0.0
+        stage_ms = defaultdict(float)
+        for sp in root.trace.spans:
+            stage_ms[sp.name] += sp.duration_ms
+        for stage, span_name in STAGES.items():
+            lat[stage].append(stage_ms.get(span_name, 0.0))  # 0 when the stage was skipped
+
+    n = sum(a[0] for a in per_kind.values())
+    pct = lambda xs, p: sorted(xs)[min(len(xs) - 1, int(len(xs) * p))]
+    return {
+        "queries": n,
+        "recall_at_k": round(sum(a[1] for a in per_kind.values()) / n, 4),
+        "mrr": round(sum(a[2] for a in per_kind.values()) / n, 4),
+        "by_query_type": {
+            name: {"queries": a[0], "recall_at_k": round(a[1] / a[0], 4), "mrr": round(a[2] / a[0], 4)}
+            for name, a in sorted(per_kind.items())
+        },
+        "latency_ms": {
+            stage: {"mean": round(sum(xs) / len(xs), 3), "p95": round(pct(xs, 0.95), 3)}
+            for stage, xs in lat.items()
+        },
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def save_run(result: dict) -> str:
+    run_id = uuid.uuid4().hex
+    db.execute(RAGAS_SCHEMA)
+    db.execute(INSERT_SQL, (run_id, DATASET, json.dumps(result)))
+    return run_id
+
+
+def show_history(limit: int, as_json: bool):
+    db.execute(RAGAS_SCHEMA)
+    rows = [(rid, ts, json.loads(m)) for rid, ts, m in db.query(HISTORY_SQL, (DATASET, limit))]
+    if as_json:
+        print(json.dumps([dict(run_id=rid, created_at=ts, **m) for rid, ts, m in rows], indent=2))
+        return
+    print(f"{'created_at':<21}{'commit':<9}{'label':<12}{'config':<48}{'recall':>8}{'mrr':>8}{'p95 ms':>9}")
+    for _, ts, m in rows:
+        c = m["config"]
+        cfg = f"{c['model']} k={c['k']} final_k={c['final_k']} rerank={c['rerank']}"
+        print(f"{ts:<21}{(m.get('git_commit') or '-'):<9}{(m.get('label') or '-'):<12}{cfg[-47:]:<48}"
+              f"{m['recall_at_k']:>8}{m['mrr']:>8}{m['latency_ms']['search']['p95']:>9}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--k", default=os.getenv("RETRIEVE_K", "20"), help="comma-separated RETRIEVE_K values")
+    ap.add_argument("--final-k", default=os.getenv("FINAL_K", "5"), help="comma-separated FINAL_K values")
+    ap.add_argument("--models", default=EMBEDDING_MODEL, help="comma-separated embedding models")
+    ap.add_argument("--reranker", default=RERANKER_MODEL)
+    ap.add_argument("--rerank", default="on,off", help="on, off or both")
+    ap.add_argument("--label", default=os.getenv("BENCH_LABEL"), help="release/run label stored with each row")
+    ap.add_argument("--no-save", action="store_true", help="do not write to ragas_runs")
+    ap.add_argument("--history", type=int, metavar="N", help="show the last N stored runs and exit")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    if args.history:
+        show_history(args.history, args.json)
+        return
+
+    records = {}
+    for collection, path in DATA.items():
+        with open(path) as f:
+            records[collection] = json.load(f)
+    queries = build_queries(records)
+    ks = [int(x) for x in args.k.split(",")]
+    final_ks = [int(x) for x in args.final_k.split(",")]
+    reranks = [x.strip() == "on" for x in args.rerank.split(",")]
+    commit = git_commit()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_retrieval_") as root:
+        for model in args.models.split(","):
+            embedder, cross_encoder = load_models(model, args.reranker)
+            stores, index_s = build_index(model, embedder, records, root)
+            for rerank_on, k, final_k in itertools.product(reranks, ks, final_ks):
+                if final_k > k:
+                    continue
+                reranker = Reranker(cross_encoder, cache_size=0) if rerank_on else NoRerank()
+                retrievers = {
+                    "claims": ClaimRetriever(embedding_model=model, store=stores["claims"], reranker=reranker),
+                    "benefits": BenefitRetriever(embedding_model=model, store=stores["benefits"], reranker=reranker),
+                }
+                for r in retrievers.values():
+                    r.embed_cache = EmbeddingCache(r.embed, maxsize=0, name=model)
+                evaluate(retrievers, queries[:5], k, final_k)  # warm-up, not recorded
+                metrics = evaluate(retrievers, queries, k, final_k)
+                result = {
+                    "label": args.label,
+                    "git_commit": commit,
+                    "config": {
+                        "model": model, "reranker": args.reranker if rerank_on else None,
+                        "rerank": rerank_on, "k": k, "final_k": final_k, "vector_backend": "mmap",
+                    },
+                    "index_build_s": round(index_s, 3),
+                    **metrics,
+                }
+                if not args.no_save:
+                    result["run_id"] = save_run(result)
+                results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'model':<34}{'k':>4}{'fk':>4}{'rerank':>8}{'recall':>8}{'mrr':>8}"
+          f"{'embed':>9}{'query':>9}{'rerank':>9}{'search':>9}{'p95':>9}")
+    for r in results:
+        c, lat = r["config"], r["latency_ms"]
+        print(f"{c['model'][-33:]:<34}{c['k']:>4}{c['final_k']:>4}{str(c['rerank']):>8}"
+              f"{r['recall_at_k']:>8}{r['mrr']:>8}{lat['embed']['mean']:>9}{lat['vector_query']['mean']:>9}"
+              f"{lat['rerank']['mean']:>9}{lat['search']['mean']:>9}{lat['search']['p95']:>9}")
+    print("latency columns: mean ms per query (p95 of the whole search)")
+    if not args.no_save:
+        print(f"{len(results)} run(s) saved to ragas_runs ({db.DB_PATH})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare keyword vs semantic routing: accuracy and per-call latency.
+
+Run from the project root:
+    python -m backend.scripts.bench_router [--repeat 5] [--json]
+"""
+import os, json, time, argparse, statistics
+from backend.agents.semantic_router import SemanticRouter, keyword_route
+from backend.models.embedding_cache import EmbeddingCache
+from backend.models import registry
+
+EMBEDDING_MODEL = os.getenv("ROUTER_MODEL", os.getenv("EMBEDDING_MODEL", "BAAI/bge-large-en-v1.5"))
+
+# Held-out questions (not in ROUTE_EXEMPLARS), including paraphrases with no keywords.
+LABELED = [
+    ("What's my copay for imaging?", "benefit"),
+    ("How much is a specialist visit under my insurance?", "benefit"),
+    ("Do I need to meet my deductible before PT is covered?", "benefit"),
+    ("Is acupuncture something my policy pays for?", "benefit"),
+    ("What will an urgent care visit cost me?", "benefit"),
+    ("Why was my claim denied?", "claim"),
+    ("why didn't insurance pay the MRI", "claim"),
+    ("The hospital says you rejected the bill for my surgery", "claim"),
+    ("When will my doctor get reimbursed for the March visit?", "claim"),
+    ("I got a statement saying I owe $900, what happened?", "claim"),
+    ("Does my plan cover ER and why was this claim denied?", "both"),
+    ("Is my MRI covered and why hasn't it been paid?", "both"),
+    ("What's my coinsurance and how much was allowed on my last claim?", "both"),
+    ("My therapy sessions should be covered, so why were they refused?", "both"),
+    ("hello", "clarify"),
+    ("good morning", "clarify"),
+    ("can I ask you something", "clarify"),
+    ("thank you!", "clarify"),
+]
+
+
+def run(name, fn, repeat):
+    correct, lat = 0, []
+    for q, want in LABELED:
+        got = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            got = fn(q)
+            lat.append((time.perf_counter() - t0) * 1000)
+        correct += got == want
+    lat.sort()
+    return {
+        "router": name,
+        "accuracy": round(correct / len(LABELED), 3),
+        "mean_ms": round(statistics.mean(lat), 3),
+        "p50_ms": round(lat[len(lat) // 2], 3),
+        "p95_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 3),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    results = [run("keyword", keyword_route, args.repeat)]
+    # maxsize=0 disables the cache so every call pays for the encode.
+    encoder = EmbeddingCache(registry.get_embedder(EMBEDDING_MODEL), maxsize=0)
+    router = SemanticRouter(encoder)
+    results.append(run("semantic", router.route, args.repeat))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'router':<10}{'accuracy':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for r in results:
+        print(f"{r['router']:<10}{r['accuracy']:>10}{r['mean_ms']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
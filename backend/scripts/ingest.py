@@ -1,58 +1,131 @@
-import os, json, pathlib, chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
+import os, json, pathlib, hashlib, time, argparse, logging
+from typing import Dict, Iterable, Iterator, List
+from backend.models import registry
+from backend.agents import answer_cache
+from backend.agents.documents import DOC_BUILDERS
+from backend.agents.vector_store import open_store
+
+logger = logging.getLogger("backend.scripts.ingest")
 
 CHROMA_PATH = pathlib.Path(os.getenv("CHROMA_PATH", "backend/db/chroma")).resolve()
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-large-en-v1.5")
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
 
-client = chromadb.PersistentClient(path=str(CHROMA_PATH), settings=Settings(allow_reset=True))
-embed = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
-
-def embed_text(text): return embed.encode([text], normalize_embeddings=True).tolist()[0]
-
-def load_and_ingest(collection_name, file_path, doc_type):
-    coll = client.get_or_create_collection(collection_name)
-    with open(file_path, "r") as f: data = json.load(f)
-
-    for rec in data:
-        if doc_type == "claims":
-            # Flatten claim lines if present
-            claim_text = f"Claim ID: {rec['claim_id']}, Member: {rec['member_id']}, Provider: {rec['provider']}, Status: {rec['status']}, Billed: {rec['billed_amount']}, Allowed: {rec['allowed_amount']}, Paid: {rec['paid_amount']}"
-            if rec.get("denial_reason"):
-                claim_text += f", Denial Reason: {rec['denial_reason']}"
-            if rec.get("claim_lines"):
-                for line in rec["claim_lines"]:
-                    claim_text += f"\n  Line: {line['procedure_code']} billed {line['billed_amount']} allowed {line['allowed_amount']} paid {line['paid_amount']}"
-
-            meta = {
-                "member_id": rec["member_id"],
-                "status": rec["status"],
-                "out_of_network": bool(rec.get("out_of_network", False)),
-                "denial_reason": rec.get("denial_reason") or "",  # convert None -> ""
-                "icd": rec.get("icd") or ""                      # convert None -> ""
-            }
-            coll.add(
-                ids=[rec["claim_id"]],
-                documents=[claim_text],
-                metadatas=[meta],
-                embeddings=[embed_text(claim_text)]
-            )
+client = registry.get_chroma_client(str(CHROMA_PATH), allow_reset=True)
+embed = registry.get_embedder(EMBEDDING_MODEL)
+
+
+def iter_json_array(file_path, chunk_size: int = 1 << 16) -> Iterator:
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(file_path, "r") as f:
+        buf, pos, started, eof = "", 0, False, False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf):
+                if not started:
+                    if buf[pos] != "[":
+                        raise ValueError(f"{file_path}: expected a top-level JSON array")
+                    started, pos = True, pos + 1
+                    continue
+                if buf[pos] == "]":
+                    return
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield obj
+                    pos = end
+                    continue
+            elif eof:
+                raise ValueError(f"{file_path}: truncated JSON array")
+            # Need more input: drop consumed text and read the next chunk.
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+
+
+def content_hash(text: str, meta: Dict) -> str:
+    payload = json.dumps([text, meta], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def batched(it: Iterable, n: int) -> Iterator[List]:
+    batch = []
+    for item in it:
+        batch.append(item)
+        if len(batch) >= n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-        elif doc_type == "benefits":
-            benefit_text = f"Member {rec['member_id']} has plan {rec['plan_name']} effective {rec['effective_date']}, OOP max {rec['out_of_pocket_max']}, Deductible remaining {rec['deductible_remaining']}."
-            meta = {
-                "member_id": rec["member_id"],
-                "plan_id": rec["plan_id"],
-                "in_network": rec["in_network"]
-            }
-            coll.add(
-                ids=[rec["benefit_id"]],
-                documents=[benefit_text],
-                metadatas=[meta],
-                embeddings=[embed_text(benefit_text)]
+
+def load_and_ingest(collection_name, file_path, doc_type, batch_size: int = INGEST_BATCH_SIZE):
+    """Stream records from file_path and upsert changed ones in batches.
+
+    Each document's metadata carries a content_hash; records whose hash
+    matches what is already stored are skipped, so re-runs are cheap and
+    never fail on existing IDs.
+    """
+    store = open_store(collection_name, client)
+    build = DOC_BUILDERS[doc_type]
+    seen = written = 0
+    start_ts = time.time()
+
+    for batch in batched(iter_json_array(file_path), batch_size):
+        docs = [build(rec) for rec in batch]
+        for _, text, meta in docs:
+            meta["content_hash"] = content_hash(text, meta)
+        seen += len(docs)
+
+        ids = [d[0] for d in docs]
+        stored = {i: m.get("content_hash") for i, m in store.get_metadatas(ids).items()}
+        todo = [d for d in docs if stored.get(d[0]) != d[2]["content_hash"]]
+
+        if todo:
+            texts = [d[1] for d in todo]
+            vecs = embed.encode(texts, batch_size=batch_size, normalize_embeddings=True).tolist()
+            store.upsert(
+                ids=[d[0] for d in todo],
+                documents=texts,
+                metadatas=[d[2] for d in todo],
+                embeddings=vecs,
             )
+            written += len(todo)
+            # cached LLM answers built on the old text of these docs are stale now
+            answer_cache.invalidate_docs([d[0] for d in todo])
+
+        elapsed = time.time() - start_ts
+        logger.info(
+            "%s: processed=%d written=%d skipped=%d (%.1f docs/s)",
+            collection_name, seen, written, seen - written, seen / elapsed if elapsed else 0.0,
+        )
+
+    store.flush()
+    elapsed = time.time() - start_ts
+    stats = {
+        "collection": collection_name,
+        "processed": seen,
+        "written": written,
+        "skipped": seen - written,
+        "seconds": round(elapsed, 2),
+        "docs_per_sec": round(seen / elapsed, 1) if elapsed else 0.0,
+    }
+    print(f"{collection_name}: {stats['processed']} records, {stats['written']} upserted, "
+          f"{stats['skipped']} unchanged in {stats['seconds']}s ({stats['docs_per_sec']} docs/s)")
+    return stats
 
 if __name__ == "__main__":
-    load_and_ingest("claims", "backend/data/claims_synthetic.json", "claims")
-    load_and_ingest("benefits", "backend/data/benefits.json", "benefits")
-    print("Ingestion complete.")
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s - %(message)s")
+    ap = argparse.ArgumentParser(description="Batched, incremental ingestion into the vector store")
+    ap.add_argument("--claims", default="backend/data/claims_synthetic.json")
+    ap.add_argument("--benefits", default="backend/data/benefits.json")
+    ap.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    args = ap.parse_args()
+    load_and_ingest("claims", args.claims, "claims", batch_size=args.batch_size)
+    load_and_ingest("benefits", args.benefits, "benefits", batch_size=args.batch_size)
+    print("Ingestion complete.")
@@ -0,0 +1,113 @@
+"""Local OpenAI-compatible (and HF text-generation) streaming stub.
+
+Serves POST .../chat/completions and POST .../models/<id> with SSE token
+streams, a configurable per-token latency and optional injected failures,
+so the remote client can be tested and load-tested without a real backend.
+
+Run from the project root:
+    python -m backend.scripts.stub_llm_server [--port 8089] [--token-latency-ms 20]
+then point the app at it with ROUTER_BASE_URL=http://127.0.0.1:8089/v1 HF_MODE=router
+"""
+import json, time, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, tokens=None, token_latency_s: float = 0.0, fail_first: int = 0, fail_status: int = 503):
+        self.tokens = tokens or ["Hello", " from", " the", " stub", "."]
+        self.token_latency_s = token_latency_s
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.connections = set()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive; responses use chunked encoding
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        st: StubState = self.server.state
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with st.lock:
+            st.requests += 1
+            st.connections.add(self.client_address)
+            fail = st.fail_first > 0
+            if fail:
+                st.fail_first -= 1
+        if fail:
+            msg = b'{"error": "injected failure"}'
+            self.send_response(st.fail_status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(msg)))
+            self.end_headers()
+            self.wfile.write(msg)
+            return
+
+        chat = self.path.endswith("/chat/completions")
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            payload = {}
+        with st.lock:
+            st.active += 1
+            st.max_active = max(st.max_active, st.active)
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for tok in st.tokens:
+                if st.token_latency_s:
+                    time.sleep(st.token_latency_s)
+                if chat:
+                    ev = {"object": "chat.completion.chunk", "model": payload.get("model"),
+                          "choices": [{"index": 0, "delta": {"content": tok}}]}
+                else:
+                    ev = {"token": {"text": tok, "special": False}}
+                self._chunk(b"data: " + json.dumps(ev).encode() + b"\n\n")
+            if chat:
+                self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+        finally:
+            with st.lock:
+                st.active -= 1
+
+
+def serve(host: str = "127.0.0.1", port: int = 0, state: StubState = None) -> ThreadingHTTPServer:
+    """Start the stub in a daemon thread; port 0 picks a free port (see server.server_port)."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = state or StubState()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--token-latency-ms", type=float, default=20.0)
+    ap.add_argument("--tokens", type=int, default=32, help="tokens per response")
+    args = ap.parse_args()
+    state = StubState(tokens=[f" tok{i}" for i in range(args.tokens)], token_latency_s=args.token_latency_ms / 1000)
+    server = serve(args.host, args.port, state)
+    print(f"Stub LLM listening on http://{args.host}:{server.server_port} (OpenAI base URL: /v1)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
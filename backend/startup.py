@@ -0,0 +1,151 @@
+"""Parallel warm start: components load on a thread pool in dependency order.
+
+Each component is a load function, optional dependencies and an optional
+warm-up run once on the loaded object before the process reports ready.
+Independent components (LLM, embedder, cross-encoder, vector store) load
+concurrently; a failed required component fails its dependents and keeps
+the process unready, while an optional one is only reported.
+"""
+import os, time, threading, logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger("backend.startup")
+
+STARTUP_WORKERS = int(os.getenv("STARTUP_WORKERS", "4"))
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+
+PENDING, LOADING, WARMING, READY, FAILED = "pending", "loading", "warming", "ready", "failed"
+
+
+class Component:
+    def __init__(self, name: str, load: Callable[[], object], deps: Iterable[str] = (),
+                 warmup: Optional[Callable[[object], None]] = None, required: bool = True):
+        self.name = name
+        self.load = load
+        self.deps = tuple(deps)
+        self.warmup = warmup
+        self.required = required
+        self.state = PENDING
+        self.load_s: Optional[float] = None
+        self.warmup_s: Optional[float] = None
+        self.error: Optional[str] = None
+        self.value = None
+
+    def report(self) -> Dict:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "load_s": None if self.load_s is None else round(self.load_s, 3),
+            "warmup_s": None if self.warmup_s is None else round(self.warmup_s, 3),
+            "error": self.error,
+        }
+
+
+class Startup:
+    def __init__(self, workers: int = STARTUP_WORKERS, warmup: bool = WARMUP):
+        self.workers = workers
+        self.warmup = warmup
+        self.components: Dict[str, Component] = {}
+        self._done = threading.Event()
+        self.started_at: Optional[float] = None
+        self.elapsed_s: Optional[float] = None
+
+    def add(self, name: str, load: Callable[[], object], deps: Iterable[str] = (),
+            warmup: Optional[Callable[[object], None]] = None, required: bool = True):
+        self.components[name] = Component(name, load, deps, warmup, required)
+
+    def value(self, name: str):
+        return self.components[name].value
+
+    # -- running ------------------------------------------------------------
+
+    def _run_one(self, c: Component):
+        t0 = time.perf_counter()
+        try:
+            c.value = c.load()
+            c.load_s = time.perf_counter() - t0
+            if self.warmup and c.warmup is not None:
+                c.state = WARMING
+                t1 = time.perf_counter()
+                c.warmup(c.value)
+                c.warmup_s = time.perf_counter() - t1
+            c.state = READY
+            logger.info("Startup: %s ready (load %.2fs, warm-up %s)", c.name, c.load_s,
+                        f"{c.warmup_s:.2f}s" if c.warmup_s is not None else "-")
+        except Exception as e:
+            if c.load_s is None:
+                c.load_s = time.perf_counter() - t0
+            c.state, c.error = FAILED, f"{type(e).__name__}: {e}"
+            log = logger.exception if c.required else logger.warning
+            log("Startup: %s failed: %s", c.name, e)
+
+    def run(self):
+        """Load every component, at most ``workers`` at a time; returns when all settled."""
+        self.started_at = time.perf_counter()
+        for c in self.components.values():
+            missing = [d for d in c.deps if d not in self.components]
+            if missing:
+                raise ValueError(f"startup component {c.name} depends on unknown {missing}")
+        pending = dict(self.components)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="startup") as pool:
+            while pending or running:
+                for name, c in list(pending.items()):
+                    dep_states = [self.components[d].state for d in c.deps]
+                    if FAILED in dep_states:
+                        failed = [d for d in c.deps if self.components[d].state == FAILED]
+                        c.state, c.error = FAILED, f"dependency failed: {', '.join(failed)}"
+                        del pending[name]
+                    elif all(s == READY for s in dep_states):
+                        c.state = LOADING
+                        running[name] = pool.submit(self._run_one, c)
+                        del pending[name]
+                if not running:
+                    break  # nothing runnable: only possible with a dependency cycle
+                wait_futures(list(running.values()), return_when=FIRST_COMPLETED)
+                for name, fut in list(running.items()):
+                    if fut.done():
+                        del running[name]
+        for c in pending.values():
+            c.state, c.error = FAILED, "dependency cycle"
+        self.elapsed_s = time.perf_counter() - self.started_at
+        self._done.set()
+        logger.info("Startup finished in %.2fs: %s", self.elapsed_s,
+                    {n: c.state for n, c in self.components.items()})
+
+    def start(self) -> threading.Thread:
+        """Run in a background thread so the server can answer health checks meanwhile."""
+        t = threading.Thread(target=self.run, name="startup", daemon=True)
+        t.start()
+        return t
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        self._done.wait(timeout)
+        return self.ready
+
+    # -- reporting ----------------------------------------------------------
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.components) and all(
+            c.state == READY for c in self.components.values() if c.required
+        )
+
+    def status(self) -> str:
+        if self.ready:
+            return "ready"
+        if self._done.is_set():
+            return "failed"
+        return "starting"
+
+    def report(self) -> Dict:
+        elapsed = self.elapsed_s
+        if elapsed is None and self.started_at is not None:
+            elapsed = time.perf_counter() - self.started_at
+        return {
+            "status": self.status(),
+            "elapsed_s": None if elapsed is None else round(elapsed, 3),
+            "components": {n: c.report() for n, c in self.components.items()},
+        }
+
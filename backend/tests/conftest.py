@@ -0,0 +1,15 @@
+import pytest
+
+from ..agents import ckpt_store, db
+
+
+@pytest.fixture(autouse=True)
+def _isolated_db(tmp_path, monkeypatch):
+    # Every test gets a throwaway database so the committed app.db is never
+    # opened (and never switched to WAL). Queued checkpoint writes are drained
+    # before DB_PATH is restored, so the write-behind thread cannot retry them
+    # against the real file.
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "app.db"))
+    yield
+    ckpt_store.flush()
+    db.close_all()
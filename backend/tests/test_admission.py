@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+import pytest
+from ..agents import db
+from ..agents.admission import AdmissionController, Saturated
+from ..agents.pending_store import MemoryPendingStore, SqlitePendingStore
+
+
+def test_admit_bounds_backlog_and_expires_tokens():
+    ctrl = AdmissionController(max_concurrency=1, max_queue=3, max_per_user=2, pending_ttl_s=0.05, store=MemoryPendingStore())
+    ctrl.admit("t1", "alice", {"n": 1})
+    ctrl.admit("t2", "alice", {"n": 2})
+    with pytest.raises(Saturated) as e:
+        ctrl.admit("t3", "alice", {})
+    assert e.value.reason == "user_limit" and e.value.retry_after >= 1
+    ctrl.admit("t4", "bob", {})
+    with pytest.raises(Saturated) as e:
+        ctrl.admit("t5", "carol", {})
+    assert e.value.reason == "queue_full"
+
+    assert ctrl.claim("t1") == {"n": 1}
+    assert ctrl.claim("t1") is None  # single use
+    time.sleep(0.06)
+    assert ctrl.claim("t2") is None  # expired
+    assert ctrl.stats()["pending"] == 0
+    ctrl.admit("t6", "carol", {})  # expired tokens no longer count against the queue
+    assert ctrl.stats()["expired"] == 1
+
+
+def test_slots_are_fair_across_users_and_report_positions():
+    async def run():
+        ctrl = AdmissionController(max_concurrency=1, store=MemoryPendingStore())
+        order, positions = [], {}
+        gate = asyncio.Event()
+
+        async def job(name, user):
+            def on_position(pos, queued):
+                positions.setdefault(name, []).append(pos)
+            async with ctrl.slot(user, on_position):
+                order.append(name)
+                if name == "a1":
+                    await gate.wait()
+
+        tasks = [asyncio.create_task(job("a1", "alice"))]
+        await asyncio.sleep(0)
+        for name, user in (("a2", "alice"), ("a3", "alice"), ("b1", "bob")):
+            tasks.append(asyncio.create_task(job(name, user)))
+            await asyncio.sleep(0)
+        assert ctrl.stats()["queued"] == 3
+        gate.set()
+        await asyncio.gather(*tasks)
+        return ctrl, order, positions
+
+    ctrl, order, positions = asyncio.run(run())
+    # bob's single request is not stuck behind all of alice's
+    assert order == ["a1", "a2", "b1", "a3"]
+    assert positions["a3"][0] == 2 and positions["a3"][-1] == 1
+    assert positions["b1"] == [2, 1]
+    assert ctrl.stats()["active"] == 0
+
+
+def test_sqlite_store_handoff_across_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "t.db"))
+    sender, streamer = SqlitePendingStore(), SqlitePendingStore()  # two worker processes
+    sender.put("tok", "alice", {"text": "hi"}, ttl_s=60)
+    sender.put("old", "alice", {"text": "late"}, ttl_s=-1)
+    assert streamer.counts("alice") == (1, 1) and streamer.counts("bob") == (1, 0)
+
+    won = []
+    threads = [threading.Thread(target=lambda: won.append(streamer.claim("tok"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [w for w in won if w] == [{"text": "hi"}]  # exactly one claim succeeds
+
+    assert streamer.claim("old") is None
+    assert sender.evict_expired() == 0  # the expired row was consumed by the failed claim
+    db.close_all()
+
+
+def test_counters_are_exact_under_concurrent_admits():
+    ctrl = AdmissionController(max_concurrency=1, max_queue=10_000, max_per_user=10_000, store=MemoryPendingStore())
+
+    def worker(n):
+        for i in range(500):
+            ctrl.admit(f"{n}-{i}", f"u{n}", {})
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ctrl.stats()["admitted"] == 4000
+
+
+@pytest.mark.parametrize("store_cls", [MemoryPendingStore, SqlitePendingStore])
+def test_racing_admits_never_overshoot_queue(store_cls, tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "t.db"))
+    ctrl = AdmissionController(max_concurrency=1, max_queue=1, max_per_user=100, store=store_cls())
+    barrier = threading.Barrier(16)
+    won, refused = [], []
+
+    def worker(n):
+        barrier.wait()
+        try:
+            ctrl.admit(f"t{n}", f"u{n}", {})
+            won.append(n)
+        except Saturated as e:
+            refused.append(e.reason)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(won) == 1 and refused == ["queue_full"] * 15
+    assert ctrl.stats()["pending"] == 1
+    db.close_all()
+
+
+def test_stats_sweeps_expired_tokens():
+    ctrl = AdmissionController(max_concurrency=1, store=MemoryPendingStore(), pending_ttl_s=-1)
+    ctrl.admit("stale", "alice", {})
+    stats = ctrl.stats()
+    assert stats["pending"] == 0 and stats["expired"] == 1
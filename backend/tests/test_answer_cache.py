@@ -0,0 +1,54 @@
+import pytest
+from ..agents import answer_cache, db
+
+
+@pytest.fixture
+def cache_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "ac.db"))
+    yield
+    db.close_all()
+
+
+def test_key_normalizes_question_and_keeps_doc_order():
+    k = answer_cache.make_key("claim", "Why was my claim denied?", ["c1", "c2"])
+    assert k == answer_cache.make_key("claim", "why was my  claim denied", ["c1", "c2"])
+    assert k != answer_cache.make_key("claim", "why was my claim denied", ["c2", "c1"])
+    assert k != answer_cache.make_key("benefit", "why was my claim denied", ["c1", "c2"])
+    assert k != answer_cache.make_key("claim", "why was my claim denied", ["c1", "c2"], "hf-router:other-model")
+
+
+def test_hit_ttl_invalidation_and_eviction(cache_db, monkeypatch):
+    key = answer_cache.make_key("claim", "q", ["c1", "c2"])
+    assert answer_cache.get(key) is None
+    answer_cache.put(key, "claim", "Denied: out of network", ["c1", "c2"], gen_seconds=2.5)
+    assert answer_cache.get(key) == "Denied: out of network"
+    assert answer_cache.stats()["saved_seconds"] >= 2.5
+
+    assert answer_cache.invalidate_docs(["c2"]) == 1
+    assert answer_cache.get(key) is None
+
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_MAX", 2)
+    keys = [answer_cache.make_key("claim", f"q{i}", [f"d{i}"]) for i in range(3)]
+    for k in keys:
+        answer_cache.put(k, "claim", "a", [], gen_seconds=1.0)
+    assert answer_cache.get(keys[0]) is None
+    assert answer_cache.get(keys[2]) == "a"
+
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_TTL_S", -1)
+    assert answer_cache.get(keys[2]) is None
+
+
+def test_eviction_sweeps_are_amortized(cache_db, monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_EVICT_EVERY", 10)
+    sweeps = []
+    evict = answer_cache._evict
+    monkeypatch.setattr(answer_cache, "_evict", lambda: sweeps.append(1) or evict())
+    for i in range(25):
+        answer_cache.put(f"k{i}", "claim", "a", [], gen_seconds=1.0)
+    assert len(sweeps) == 3  # first put (row count unknown), then every 10th
+
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_MAX", 26)
+    answer_cache.put("k25", "claim", "a", [], gen_seconds=1.0)
+    answer_cache.put("k26", "claim", "a", [], gen_seconds=1.0)  # estimate passes the cap
+    assert len(sweeps) == 4
+    assert db.query_one("SELECT COUNT(*) FROM answer_cache")[0] == 26
@@ -1,9 +1,77 @@
 from ..agents import ckpt_store
 
 def test_ckpt_cycle(tmp_path, monkeypatch):
-    # Use real DB per env
+    from ..agents import db
+    db.execute("CREATE TABLE checkpoints (checkpoint_id TEXT PRIMARY KEY, user_id TEXT, session_id TEXT, pending_agent TEXT, pending_question TEXT, context_snapshot TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP)")
     res = ckpt_store.create("u1","s1","claim","Provide date","{}")
     ck = ckpt_store.get(res["checkpoint_id"])
     assert ck and ck["pending_agent"]=="claim"
     ckpt_store.delete(res["checkpoint_id"])
     assert ckpt_store.get(res["checkpoint_id"]) is None
+
+
+def test_delta_snapshots_rebuild_full_state(tmp_path, monkeypatch):
+    import json
+    from ..agents import db
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "ck.db"))
+    db.execute("CREATE TABLE checkpoints (checkpoint_id TEXT PRIMARY KEY, user_id TEXT, session_id TEXT, pending_agent TEXT, pending_question TEXT, context_snapshot TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP)")
+
+    s1 = {"session_id": "sd", "question": "q", "benefit_result": "b", "claim_result": None, "provenance": [{"agent": "benefit"}]}
+    s2 = dict(s1, claim_result="c", provenance=s1["provenance"] + [{"agent": "claim"}])
+    c1 = ckpt_store.save_state("u1", "sd", "benefit", "q", s1)["checkpoint_id"]
+    ckpt_store.flush()  # deltas are only taken against a base that is on disk
+    c2 = ckpt_store.save_state("u1", "sd", "claim", "q", s2)["checkpoint_id"]
+    ckpt_store.flush()
+
+    stored = json.loads(db.query_one("SELECT context_snapshot FROM checkpoints WHERE checkpoint_id=?", (c2,))[0])
+    assert stored["__delta__"]["prov_append"] == [{"agent": "claim"}]
+    assert "benefit_result" not in stored["__delta__"]["set"]
+    assert json.loads(ckpt_store.get(c2)["context_snapshot"]) == s2
+
+    # deleting the base keeps the child readable
+    ckpt_store.delete(c1)
+    assert ckpt_store.get(c1) is None
+    assert json.loads(ckpt_store.get(c2)["context_snapshot"]) == s2
+    db.close_all()
+
+
+def test_failed_flush_never_becomes_a_delta_base(tmp_path, monkeypatch):
+    import json
+    from ..agents import db
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "ck.db"))
+    monkeypatch.setattr(ckpt_store, "RETRY_BACKOFF_S", 0)
+    db.execute("CREATE TABLE checkpoints (checkpoint_id TEXT PRIMARY KEY, user_id TEXT, session_id TEXT, pending_agent TEXT, pending_question TEXT, context_snapshot TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP)")
+
+    s1 = {"session_id": "sf", "question": "q", "benefit_result": None, "provenance": []}
+    s2 = dict(s1, benefit_result="b", provenance=[{"agent": "benefit"}])
+    s3 = dict(s2, summary="done")
+    c1 = ckpt_store.save_state("u1", "sf", "benefit", "q", s1)["checkpoint_id"]
+    ckpt_store.flush()
+
+    apply = ckpt_store._apply
+    def failing(ops):
+        raise RuntimeError("disk I/O error")
+    monkeypatch.setattr(ckpt_store, "_apply", failing)
+    c2 = ckpt_store.save_state("u1", "sf", "claim", "q", s2)["checkpoint_id"]
+    ckpt_store.flush()
+    monkeypatch.setattr(ckpt_store, "_apply", apply)
+    assert c2 not in ckpt_store._pending
+
+    c3 = ckpt_store.save_state("u1", "sf", "summary", "q", s3)["checkpoint_id"]
+    ckpt_store.flush()
+    stored = json.loads(db.query_one("SELECT context_snapshot FROM checkpoints WHERE checkpoint_id=?", (c3,))[0])
+    assert stored["__delta__"]["base"] == c1
+
+    # reopen: a fresh process has no in-memory rows or bases
+    monkeypatch.setattr(ckpt_store, "_last", type(ckpt_store._last)())
+    db.close_all()
+    assert ckpt_store.get(c2) is None
+    assert json.loads(ckpt_store.get(c3)["context_snapshot"]) == s3
+
+    # a delta whose base is gone resumes from the newest full snapshot
+    broken = json.dumps({"__delta__": {"base": "gone", "set": {"summary": "x"}}})
+    ckpt_store.create("u1", "sf", "summary", "q", broken)
+    ckpt_store.flush()
+    bid = db.query_one("SELECT checkpoint_id FROM checkpoints WHERE context_snapshot=?", (broken,))[0]
+    assert json.loads(ckpt_store.get(bid)["context_snapshot"]) == s1
+    db.close_all()
@@ -0,0 +1,30 @@
+import threading
+import pytest
+from ..agents import db
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "t.db"))
+    db.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT)")
+    yield
+    db.close_all()
+
+
+def test_wal_and_per_thread_connections(tmp_db):
+    assert db.query_one("PRAGMA journal_mode")[0] == "wal"
+    main_con = db.connect()
+    assert db.connect() is main_con
+    other = []
+    t = threading.Thread(target=lambda: other.append(db.connect()))
+    t.start(); t.join()
+    assert other[0] is not main_con
+
+
+def test_transaction_rolls_back(tmp_db):
+    db.executemany("INSERT INTO kv VALUES (?,?)", [("a", "1"), ("b", "2")])
+    with pytest.raises(RuntimeError):
+        with db.transaction() as con:
+            con.execute("INSERT INTO kv VALUES ('c','3')")
+            raise RuntimeError("boom")
+    assert [r[0] for r in db.query("SELECT k FROM kv ORDER BY k")] == ["a", "b"]
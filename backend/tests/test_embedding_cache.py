@@ -0,0 +1,51 @@
+import numpy as np
+from ..models.embedding_cache import EmbeddingCache, normalize_query
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, normalize_embeddings=True):
+        self.calls += 1
+        return np.array([[float(len(t)), 1.0] for t in texts])
+
+
+def test_normalize_query():
+    assert normalize_query("  Why was my   claim DENIED? ") == "why was my claim denied"
+
+
+def test_hits_misses_and_lru_eviction():
+    emb = FakeEmbedder()
+    cache = EmbeddingCache(emb, maxsize=2)
+    cache.encode("why was my claim denied")
+    cache.encode("Why was my claim denied?")
+    assert emb.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.encode("copay for imaging")
+    cache.encode("deductible remaining")  # evicts the claim question
+    cache.encode("why was my claim denied")
+    assert emb.calls == 4
+    assert cache.stats()["size"] == 2
+
+
+def test_encode_many_batches_misses_once():
+    emb = FakeEmbedder()
+    cache = EmbeddingCache(emb, maxsize=10)
+    vecs = cache.encode_many(["a b", "A  B", "c"])
+    assert emb.calls == 1
+    assert vecs[0] == vecs[1]
+
+
+def test_model_sees_original_text_not_cache_key():
+    seen = []
+
+    class Recording(FakeEmbedder):
+        def encode(self, texts, normalize_embeddings=True):
+            seen.extend(texts)
+            return super().encode(texts, normalize_embeddings)
+
+    cache = EmbeddingCache(Recording(), maxsize=10)
+    cache.encode_many(["Why was my claim DENIED?", "why was my claim denied"])
+    assert seen == ["Why was my claim DENIED?"]
@@ -0,0 +1,24 @@
+import time
+from ..agents import orchestrator
+from ..agents.orchestrator import GraphState, both_node
+
+
+class SlowAgent:
+    def __init__(self, name, delay):
+        self.name, self.delay = name, delay
+
+    def run(self, q, sid, uid, on_token=None):
+        time.sleep(self.delay)
+        return {"answer": f"{self.name} answer", "provenance": [{"agent": self.name}]}
+
+
+def test_both_node_runs_branches_concurrently(monkeypatch):
+    monkeypatch.setattr(orchestrator, "save_checkpoint", lambda state, agent: state)
+    st = GraphState(session_id="s1", user_id="u1", question="Does my plan cover ER and why was this claim denied?")
+    t0 = time.perf_counter()
+    out = both_node(st, SlowAgent("benefit", 0.3), SlowAgent("claim", 0.3))
+    elapsed = time.perf_counter() - t0
+    assert elapsed < 0.55
+    assert out.benefit_result == "benefit answer"
+    assert out.claim_result == "claim answer"
+    assert [p["agent"] for p in out.provenance] == ["benefit", "claim"]
@@ -0,0 +1,42 @@
+import json
+from ..agents import id_index
+from ..agents.orchestrator import GraphState, router_node, lookup_node
+
+
+def build(tmp_path):
+    (tmp_path / "claims.json").write_text(json.dumps([{
+        "claim_id": "claim_ad69f6a9", "member_id": "M770487", "provider": "Riverside",
+        "service_date": "2024-06-14", "status": "Denied", "billed_amount": 100,
+        "allowed_amount": 0, "paid_amount": 0, "denial_reason": "Not covered",
+    }]))
+    (tmp_path / "benefits.json").write_text(json.dumps([{
+        "benefit_id": "benefit_79a87fe2", "user_id": "u1000", "member_id": "M770487", "plan_id": "plan_1",
+        "plan_name": "Bronze PPO", "effective_date": "2023-01-26", "in_network": True,
+        "out_of_pocket_max": 5000, "deductible_remaining": 200, "coverages": [],
+    }]))
+    return id_index.load(tmp_path)
+
+
+def test_index_by_id_and_user(tmp_path):
+    idx = build(tmp_path)
+    hits = idx.find("status of claim_ad69f6a9 and benefit_79a87fe2? claim_00000000")
+    assert [(k, i) for k, i, _, _ in hits] == [("claim", "claim_ad69f6a9"), ("benefit", "benefit_79a87fe2")]
+    assert idx.member_for_user("u1000") == "M770487" and idx.member_for_user("u9") is None
+
+
+def test_router_fast_path(tmp_path):
+    build(tmp_path)
+    st = router_node(GraphState(session_id="s", user_id="u", question="Why was claim_ad69f6a9 denied?"))
+    assert st.route == "lookup" and st.id_hits[0][1] == "claim_ad69f6a9"
+    calls = []
+    find, id_index.INDEX.find = id_index.INDEX.find, lambda q: calls.append(q) or []
+    try:
+        out = lookup_node(st)  # reuses the router's hits
+    finally:
+        id_index.INDEX.find = find
+    assert calls == []
+    assert "Not covered" in out.summary
+    assert out.provenance[-1]["sources"][0]["doc_id"] == "claim_ad69f6a9"
+
+    st = router_node(GraphState(session_id="s", user_id="u", question="Why was claim_00000000 denied?"))
+    assert st.route == "claim"
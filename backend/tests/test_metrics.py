@@ -0,0 +1,23 @@
+from .. import metrics
+
+
+def test_histogram_and_gauge_render():
+    h = metrics.Histogram("test_stage_seconds", "Test stage.", ["stage"], buckets=(0.1, 1.0))
+    h.observe(0.0625, stage="a")
+    h.observe(0.5, stage="a")
+    h.observe(3.0, stage="a")
+    with h.time(stage="b"):
+        pass
+    g = metrics.Gauge("test_queue_depth", "Test gauge.", fn=lambda: 7)
+    c = metrics.Counter("test_tokens_total", "Test counter.", ["backend"])
+    c.inc(3, backend='x"y')
+
+    text = metrics.render()
+    assert "# TYPE test_stage_seconds histogram" in text
+    assert 'test_stage_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'test_stage_seconds_bucket{stage="a",le="1"} 2' in text
+    assert 'test_stage_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'test_stage_seconds_sum{stage="a"} 3.5625' in text
+    assert 'test_stage_seconds_count{stage="b"} 1' in text
+    assert "test_queue_depth 7" in text
+    assert 'test_tokens_total{backend="x\\"y"} 3' in text
@@ -0,0 +1,105 @@
+import time
+import asyncio
+import pytest
+from ..models import remote_client
+from ..models.remote_client import RemoteLLMClient, RemoteLLMError, TokenBucket
+from ..scripts.stub_llm_server import StubState, serve
+
+
+@pytest.fixture
+def stub():
+    server = serve(state=StubState(token_latency_s=0.01))
+    yield server
+    server.shutdown()
+
+
+def url(server, path="/v1"):
+    return f"http://127.0.0.1:{server.server_port}{path}"
+
+
+def test_streams_chat_and_text_generation(stub):
+    chat = RemoteLLMClient(url(stub))
+    assert "".join(chat.stream_chat("m", [{"role": "user", "content": "hi"}])) == "Hello from the stub."
+    tgi = RemoteLLMClient(url(stub, "/models"))
+    assert "".join(tgi.stream_text_generation("m", "hi", max_new_tokens=8)) == "Hello from the stub."
+    chat.close(); tgi.close()
+
+
+def test_in_flight_cap_and_keepalive(stub):
+    client = RemoteLLMClient(url(stub), max_in_flight=3, pool_size=3)
+
+    async def one():
+        return "".join([t async for t in client.astream_chat("m", [])])
+
+    async def many():
+        return await asyncio.gather(*[one() for _ in range(12)])
+
+    out = asyncio.run(many())
+    assert out == ["Hello from the stub."] * 12
+    assert stub.state.max_active <= 3
+    assert len(stub.state.connections) <= 3  # pooled connections were reused
+
+
+def test_retries_then_gives_up(stub, monkeypatch):
+    monkeypatch.setattr(remote_client, "backoff_delay", lambda attempt: 0.0)
+    stub.state.fail_first = 2
+    client = RemoteLLMClient(url(stub), max_retries=3)
+    assert "".join(client.stream_chat("m", [])) == "Hello from the stub."
+    assert client.retries == 2
+
+    stub.state.fail_first, stub.state.fail_status = 1, 401
+    with pytest.raises(RemoteLLMError) as e:
+        list(client.stream_chat("m", []))
+    assert e.value.status == 401  # not retryable
+    client.close()
+
+
+def test_token_bucket_rate():
+    async def run():
+        bucket = TokenBucket(rate=50, burst=2)
+        t0 = time.monotonic()
+        for _ in range(7):
+            await bucket.acquire()
+        return time.monotonic() - t0
+
+    assert asyncio.run(run()) >= 0.09  # 2 burst, then 5 at 50/s
+
+
+def test_shared_across_event_loops(stub):
+    client = RemoteLLMClient(url(stub), max_in_flight=2)
+
+    async def one():
+        return "".join([t async for t in client.astream_chat("m", [])])
+
+    async def some():
+        return await asyncio.gather(*[one() for _ in range(4)])
+
+    assert "".join(client.stream_chat("m", [])) == "Hello from the stub."
+    for _ in range(2):  # each asyncio.run is a fresh loop
+        assert asyncio.run(some()) == ["Hello from the stub."] * 4
+    assert "".join(client.stream_chat("m", [])) == "Hello from the stub."
+    client.close()
+
+
+
+def test_pump_cancellation_propagates_and_ends_the_stream():
+    import concurrent.futures
+    client = RemoteLLMClient("http://127.0.0.1:1/v1")
+
+    async def agen():
+        yield "a"
+        await asyncio.sleep(60)
+        yield "b"
+
+    items = []
+    fut = client._pump(agen(), items.append)
+    deadline = time.monotonic() + 5
+    while not items and time.monotonic() < deadline:
+        time.sleep(0.01)
+    fut.cancel()
+    with pytest.raises(concurrent.futures.CancelledError):
+        fut.result(timeout=5)
+    while items[-1] is not client._DONE and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert items == ["a", client._DONE]  # the CancelledError itself is not handed to put
+    client.close()
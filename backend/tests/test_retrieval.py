@@ -0,0 +1,182 @@
+from ..agents import id_index
+from ..agents.retrieval import BenefitRetriever, ClaimRetriever, multi_search
+from ..agents.rerank import Reranker
+from ..agents.vector_store import ChromaStore, MmapStore
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.calls = []
+
+    def query(self, query_embeddings, n_results, where=None, include=None):
+        self.calls.append(where)
+        rows = [d for d in self.docs if not where or d[2].get("member_id") == where["member_id"]][:n_results]
+        return {"ids": [[r[0] for r in rows]], "documents": [[r[1] for r in rows]], "metadatas": [[r[2] for r in rows]]}
+
+    def get(self, ids=None, where=None, limit=None, include=None):
+        rows = [d for d in self.docs
+                if (ids is None or d[0] in ids) and (not where or d[2].get("member_id") == where["member_id"])][:limit]
+        return {"ids": [r[0] for r in rows], "documents": [r[1] for r in rows], "metadatas": [r[2] for r in rows]}
+
+
+class CountingCache:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text):
+        self.calls += 1
+        return [0.0, 1.0]
+
+
+class CountingReranker:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, pairs):
+        self.calls += 1
+        return [float(len(txt)) for _, txt in pairs]
+
+
+def make(cls, name, docs, cache, reranker):
+    r = cls.__new__(cls)
+    r.collection_name = name
+    r.store = ChromaStore(FakeCollection(docs))
+    r.embed_cache = cache
+    r.reranker = Reranker(reranker)
+    return r
+
+
+def test_multi_search_embeds_and_reranks_once():
+    cache, reranker = CountingCache(), CountingReranker()
+    b = make(BenefitRetriever, "benefits", [("benefit_1", "plan doc", {"member_id": "M000001"})], cache, reranker)
+    c = make(ClaimRetriever, "claims", [
+        ("claim_1", "short", {"member_id": "M000001"}),
+        ("claim_2", "a longer claim doc", {"member_id": "M000001"}),
+        ("claim_3", "other member", {"member_id": "M999999"}),
+    ], cache, reranker)
+
+    out = multi_search("why was claim for M000001 denied", [b, c], k=1, final_k=1)
+
+    assert cache.calls == 1
+    assert reranker.calls == 0  # one candidate per collection: no model call
+    assert c.store.collection.calls == [{"member_id": "M000001"}]  # partition larger than k
+    assert out["benefits"][1][0]["doc_id"] == "benefit_1"
+
+    out = multi_search("why was this claim denied", [b, c], k=20, final_k=1, user_id="u1000")
+    assert cache.calls == 2 and reranker.calls == 1  # no member: one embedding, one batched rerank
+    assert c.store.collection.calls[-1] is None
+    assert out["claims"][1] == [{"file": "claims", "doc_id": "claim_2", "member_id": "M000001", "offsets": []}]
+
+
+def test_member_partition_from_session_user(monkeypatch):
+    monkeypatch.setattr(id_index.INDEX, "users", {"u1000": "M000001", "u2000": "M555555"})
+    cache, reranker = CountingCache(), CountingReranker()
+    b = make(BenefitRetriever, "benefits", [
+        ("benefit_1", "plan doc", {"member_id": "M000001"}),
+        ("benefit_2", "someone else's plan", {"member_id": "M999999"}),
+    ], cache, reranker)
+    c = make(ClaimRetriever, "claims", [
+        ("claim_1", "short", {"member_id": "M000001"}),
+        ("claim_2", "a longer claim doc", {"member_id": "M000001"}),
+        ("claim_3", "other member", {"member_id": "M999999"}),
+    ], cache, reranker)
+
+    out = multi_search("what does my plan cover and why was my claim denied", [b, c], k=20, final_k=5, user_id="u1000")
+
+    # Both collections are served from the store's member partition: no embedding or
+    # ANN query; the two unordered claims are still ranked by the cross-encoder.
+    assert cache.calls == 0 and reranker.calls == 1
+    assert b.store.collection.calls == [] and c.store.collection.calls == []
+    assert [p["doc_id"] for p in out["benefits"][1]] == ["benefit_1"]
+    assert [p["doc_id"] for p in out["claims"][1]] == ["claim_2", "claim_1"]
+
+    # An explicit member id in the question wins over the session user's.
+    ctx, prov = b.search("benefits for M999999", k=20, final_k=5, user_id="u1000")
+    assert [p["doc_id"] for p in prov] == ["benefit_2"]
+    assert b.search("benefits for M123456", k=20, final_k=5, user_id="u1000") == ("", [])
+
+    # No first-person reference: the session member is not applied.
+    b.search("what does a bronze plan cover", k=20, final_k=5, user_id="u1000")
+    assert b.store.collection.calls == [None]
+
+    # A session member with nothing in the collection falls back to semantic search.
+    ctx, prov = b.search("what does my plan cover", k=20, final_k=5, user_id="u2000")
+    assert b.store.collection.calls == [None, None]
+    assert [p["doc_id"] for p in prov] == ["benefit_1", "benefit_2"]
+
+
+def test_rerank_bypass_and_score_cache():
+    model = CountingReranker()
+    rr = Reranker(model)
+    cands = [("c1", "short", {}), ("c2", "a longer doc", {}), ("c3", "mid doc", {})]
+
+    top = rr.rank("q", cands, final_k=5)
+    assert [c[0] for c, _ in top] == ["c1", "c2", "c3"] and model.calls == 0
+
+    top = rr.rank("q", cands, final_k=2)
+    assert [c[0] for c, _ in top] == ["c2", "c3"] and model.calls == 1
+    rr.rank("Q?", cands, final_k=2)
+    assert model.calls == 1
+    assert rr.stats()["hits"] == 3
+
+
+def test_mmap_store_filters_and_reloads(tmp_path):
+    w = MmapStore("claims", root=tmp_path, dtype="float16")
+    w.upsert(
+        ["c1", "c2", "c3"], ["one", "two", "three"],
+        [{"member_id": "M1"}, {"member_id": "M1"}, {"member_id": "M2"}],
+        [[1.0, 0.0], [0.6, 0.8], [3.0, 0.1]],
+    )
+    w.flush()
+
+    r = MmapStore("claims", root=tmp_path, reload_s=0)
+    assert [h[0] for h in r.query([1.0, 0.0], k=2)] == ["c1", "c3"]  # cosine, not raw dot product
+    assert [h[0] for h in r.query([0.0, 1.0], k=5, where={"member_id": "M1"})] == ["c2", "c1"]
+    assert r.query([1.0, 0.0], k=5, where={"member_id": "M9"}) == []
+    assert [h[0] for h in r.get_where({"member_id": "M1"}, 5)] == ["c1", "c2"]
+    assert [h[0] for h in r.get_where({"member_id": "M1"}, 1)] == ["c1"]
+
+    w.upsert(["c2"], ["two v2"], [{"member_id": "M2"}], [[0.0, 1.0]])
+    w.flush()
+    hits = r.query([0.0, 1.0], k=5, where={"$and": [{"member_id": "M2"}]})
+    assert [h[:2] for h in hits] == [("c2", "two v2"), ("c3", "three")]
+    assert r.get_metadatas(["c2", "nope"]) == {"c2": {"member_id": "M2"}}
+
+
+def test_mmap_store_versions_are_collected_late_and_reloads_rate_limited(tmp_path, monkeypatch):
+    from ..agents import vector_store
+    monkeypatch.setattr(vector_store, "VECTOR_KEEP_VERSIONS", 2)
+    w = MmapStore("claims", root=tmp_path)
+    r = MmapStore("claims", root=tmp_path, reload_s=3600)
+    published = []
+    for n in range(4):
+        w.upsert([f"c{n}"], [f"doc {n}"], [{}], [[1.0, float(n)]])
+        w.flush()
+        published.append(w._version)
+    assert len(set(published)) == 4
+    on_disk = sorted(p.name for p in (tmp_path / "claims").iterdir() if p.is_dir())
+    assert on_disk == sorted(published[-2:])
+    assert r.get_metadatas(["c0"]) == {}  # still on the version it loaded; CURRENT not re-read yet
+    r._checked_at = float("-inf")
+    assert r.get_metadatas(["c3"]) == {"c3": {}}
+
+
+def test_mmap_store_concurrent_publishers_keep_every_upsert(tmp_path):
+    import threading
+    writers = [MmapStore("claims", root=tmp_path) for _ in range(4)]  # one per worker process
+    barrier = threading.Barrier(len(writers))
+
+    def publish(n, w):
+        barrier.wait()
+        for j in range(5):
+            w.upsert([f"w{n}-{j}"], [f"doc {n}/{j}"], [{}], [[1.0, float(j)]])
+            w.flush()
+
+    threads = [threading.Thread(target=publish, args=(n, w)) for n, w in enumerate(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    r = MmapStore("claims", root=tmp_path)
+    assert sorted(r.ids) == sorted(f"w{n}-{j}" for n in range(4) for j in range(5))
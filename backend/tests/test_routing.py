@@ -9,3 +9,33 @@ from ..agents.orchestrator import _route
 ])
 def test_route(q, route):
     assert _route(q) == route
+
+
+class BagOfWords:
+    """Tiny deterministic encoder: one dimension per vocabulary word."""
+    VOCAB = ["copay", "deductible", "cover", "denied", "pay", "claim", "hello", "thanks", "mri"]
+
+    def encode(self, text):
+        import numpy as np
+        v = np.array([float(w in text.lower()) for w in self.VOCAB] + [0.0])
+        if not v.any():
+            v[-1] = 1.0  # out-of-vocabulary text gets its own orthogonal axis
+        return list(v / np.linalg.norm(v))
+
+    def encode_many(self, texts):
+        return [self.encode(t) for t in texts]
+
+
+def test_semantic_router_and_fallback():
+    from ..agents.semantic_router import SemanticRouter
+    ex = {
+        "benefit": ["copay", "deductible", "cover"],
+        "claim": ["denied claim", "pay claim"],
+        "clarify": ["hello", "thanks"],
+    }
+    r = SemanticRouter(BagOfWords(), exemplars=ex, min_score=0.5, min_margin=0.05)
+    assert r.classify("why didn't they pay the claim")[0] == "claim"
+    assert r.classify("hello there")[0] == "clarify"
+    # nothing in the vocabulary: below threshold, keyword fallback decides
+    assert r.classify("xyz")[0] is None
+    assert r.route("zzz provider") == "claim"
@@ -0,0 +1,80 @@
+import threading
+import torch
+from transformers import Qwen2Config, Qwen2ForCausalLM
+from ..models.model_loader import GenerationScheduler
+
+
+class CharTokenizer:
+    pad_token_id, eos_token_id = 0, 1
+
+    def __call__(self, s):
+        return {"input_ids": [2 + (ord(c) % 60) for c in s]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(65 + (i % 26)) for i in ids if i > 1)
+
+
+def tiny_model():
+    torch.manual_seed(0)
+    cfg = Qwen2Config(vocab_size=64, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+                      num_attention_heads=4, num_key_value_heads=2, eos_token_id=1, pad_token_id=0)
+    return Qwen2ForCausalLM(cfg).eval()
+
+
+def test_batched_greedy_matches_generate():
+    m, tok = tiny_model(), CharTokenizer()
+    prompts = ["hello world", "a much longer prompt with more tokens", "xy", "medium prompt"]
+    expected = []
+    for p in prompts:
+        ids = torch.tensor([tok(p)["input_ids"]])
+        out = m.generate(ids, attention_mask=torch.ones_like(ids), max_new_tokens=10,
+                         do_sample=False, eos_token_id=1, pad_token_id=0)
+        expected.append(tok.decode(out[0, ids.shape[1]:].tolist()))
+
+    # max_batch below the number of prompts forces admission into a running batch
+    sched = GenerationScheduler(m, tok, max_batch=3, temperature=0, repetition_penalty=1.0)
+    got = [None] * len(prompts)
+
+    def run(i):
+        got[i] = "".join(sched.submit(prompts[i], 10))
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(prompts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert got == expected
+
+
+def test_static_prefix_and_prefix_reuse_matches_generate():
+    from ..models.model_loader import static_prefix
+    assert static_prefix("You are X.\nRules.\nQuestion: {question}\n") == "You are X.\nRules.\n"
+    assert static_prefix("{question}") == ""
+
+    m, tok = tiny_model(), CharTokenizer()
+    prefix = "You are a helpful agent with fixed rules.\nAnswer carefully.\n"
+    prompts = [prefix + "Question: why denied", prefix + "x", "no prefix here"]
+    expected = []
+    for p in prompts:
+        ids = torch.tensor([tok(p)["input_ids"]])
+        out = m.generate(ids, attention_mask=torch.ones_like(ids), max_new_tokens=10,
+                         do_sample=False, eos_token_id=1, pad_token_id=0)
+        expected.append(tok.decode(out[0, ids.shape[1]:].tolist()))
+
+    sched = GenerationScheduler(m, tok, temperature=0, repetition_penalty=1.0)
+    sched.register_prefix(prefix)
+    got = ["".join(sched.submit(p, 10)) for p in prompts]
+    assert got == expected
+    assert list(sched._prefix_kv) == [prefix]
+
+
+def test_warmup_generates_a_single_token():
+    from ..models.model_loader import StreamLLM
+    llm = StreamLLM.__new__(StreamLLM)
+    llm.mode = llm.backend = "transformers"
+    llm.scheduler = GenerationScheduler(tiny_model(), CharTokenizer())
+    calls = []
+    submit = llm.scheduler.submit
+    llm.scheduler.submit = lambda prompt, n: calls.append(n) or submit(prompt, n)
+    assert llm.warmup() is True
+    assert calls == [1]
@@ -0,0 +1,61 @@
+import time
+import threading
+from ..startup import Startup
+
+
+def test_independent_components_load_in_parallel_after_deps():
+    s = Startup(workers=4)
+    order, warmed = [], []
+    lock = threading.Lock()
+
+    def slow(name):
+        def load():
+            time.sleep(0.2)
+            with lock:
+                order.append(name)
+            return name
+        return load
+
+    s.add("llm", slow("llm"), warmup=warmed.append)
+    s.add("embedder", slow("embedder"), warmup=warmed.append)
+    s.add("reranker", slow("reranker"))
+    s.add("agents", lambda: (s.value("llm"), s.value("embedder")), deps=("llm", "embedder", "reranker"))
+
+    assert s.status() == "starting" and not s.ready
+    t0 = time.perf_counter()
+    s.run()
+    assert time.perf_counter() - t0 < 0.5  # the three 0.2s loads overlapped
+    assert order[-1] != "agents" and s.value("agents") == ("llm", "embedder")
+    assert sorted(warmed) == ["embedder", "llm"]
+    report = s.report()
+    assert report["status"] == "ready" and s.ready
+    assert report["components"]["llm"]["load_s"] >= 0.2
+    assert report["components"]["llm"]["warmup_s"] is not None
+    assert report["components"]["reranker"]["warmup_s"] is None
+
+
+def test_failures_propagate_to_dependents_unless_optional():
+    s = Startup(workers=2)
+
+    def boom():
+        raise RuntimeError("no weights")
+
+    s.add("llm", boom)
+    s.add("embedder", lambda: "emb")
+    s.add("agents", lambda: "graph", deps=("llm", "embedder"))
+    s.add("router", boom, deps=("embedder",), required=False)
+    assert not s.wait(timeout=0.01)
+    s.start().join(timeout=5)
+
+    comps = s.report()["components"]
+    assert comps["llm"]["state"] == "failed" and "no weights" in comps["llm"]["error"]
+    assert comps["agents"]["state"] == "failed" and comps["agents"]["error"] == "dependency failed: llm"
+    assert comps["embedder"]["state"] == "ready"
+    assert s.status() == "failed" and not s.wait(timeout=0)
+
+    # an optional component failing does not block readiness
+    s2 = Startup()
+    s2.add("embedder", lambda: "emb")
+    s2.add("router", boom, deps=("embedder",), required=False)
+    s2.run()
+    assert s2.ready and s2.report()["components"]["router"]["state"] == "failed"
@@ -1,3 +1,4 @@
+from ..agents import orchestrator, summary
 from ..agents.summary import SummaryAgent
 from ..agents.orchestrator import GraphState
 from ..models.model_loader import load_llm
@@ -10,3 +11,39 @@ def test_summary_runs():
     st = GraphState(session_id="s", user_id="u", question="q", benefit_result="Benefit ok", claim_result="Denied")
     out = sa.run(st)
     assert "Next" in out["answer"] or out["answer"]
+
+
+class CountingLLM:
+    def __init__(self, chunks):
+        self.chunks, self.calls = chunks, 0
+
+    def stream(self, prompt):
+        self.calls += 1
+        yield from self.chunks
+
+
+def test_summary_node_passes_single_branch_through(monkeypatch):
+    monkeypatch.setattr(orchestrator, "save_checkpoint", lambda state, agent: state)
+    llm = CountingLLM(["merged"])
+    st = GraphState(session_id="s", user_id="u", question="q", route="claim", claim_result="Denied: no auth")
+    out = orchestrator.summary_node(st, SummaryAgent(llm))
+    assert out.summary == "Denied: no auth" and llm.calls == 0
+
+
+def test_summary_node_streams_merge_for_both(monkeypatch):
+    monkeypatch.setattr(orchestrator, "save_checkpoint", lambda state, agent: state)
+    monkeypatch.setattr(summary, "log_provenance", lambda *a: None)
+    llm = CountingLLM(["ER is ", "covered; ", "claim denied."])
+    st = GraphState(session_id="s", user_id="u", question="q", route="both",
+                    benefit_result="ER covered", claim_result="Denied")
+    events = []
+    token = orchestrator.EMITTER_CTX.set(events.append)
+    try:
+        out = orchestrator.summary_node(st, SummaryAgent(llm))
+    finally:
+        orchestrator.EMITTER_CTX.reset(token)
+    assert llm.calls == 1
+    assert out.summary == "ER is covered; claim denied."
+    assert [e["data"] for e in events if e["type"] == "token"] == ["ER is ", "covered; ", "claim denied."]
+    assert events[0]["type"] == "agent_start" and events[-1]["type"] == "agent_end"
+    assert out.provenance[-1]["agent"] == "summary"
@@ -0,0 +1,116 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from .. import tracing
+
+
+def test_spans_nest_across_threads_and_export_jsonl(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_SINK", "jsonl")
+    monkeypatch.setattr(tracing, "TRACE_PATH", str(path))
+    monkeypatch.setattr(tracing, "TRACE_PROFILE", "sample")
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", 0)
+
+    assert tracing.current_span() is None
+    with tracing.span("outside"):  # no trace: nothing recorded
+        pass
+
+    def work():
+        assert tracing.REQUEST_ID_CTX.get() == "r-test"
+        with tracing.span("retrieval.search"):
+            time.sleep(0.02)
+        sp = tracing.child_span("llm.generate")
+        sp.set(chunks=3)
+        sp.finish()
+
+    tracing.REQUEST_ID_CTX.set("r-test")
+    with tracing.start_trace("ws_stream", trace_id=tracing.REQUEST_ID_CTX.get()):
+        with tracing.span("node.claim"):
+            with ThreadPoolExecutor(1) as pool:
+                pool.submit(copy_context().run, work).result()
+    tracing.flush()
+
+    spans = {s["name"]: s for s in map(json.loads, path.read_text().splitlines())}
+    assert set(spans) == {"ws_stream", "node.claim", "retrieval.search", "llm.generate"}
+    assert {s["trace_id"] for s in spans.values()} == {"r-test"}
+    assert spans["node.claim"]["parent_id"] == spans["ws_stream"]["span_id"]
+    assert spans["retrieval.search"]["parent_id"] == spans["node.claim"]["span_id"]
+    assert spans["retrieval.search"]["thread"] != spans["node.claim"]["thread"]
+    assert spans["llm.generate"]["attrs"] == {"chunks": 3}
+    root = spans["ws_stream"]["attrs"]
+    assert root["slow"] and "samples every" in root["profile"]
+
+
+def test_sampler_only_profiles_threads_inside_the_trace(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_PATH", str(tmp_path / "traces.jsonl"))
+    monkeypatch.setattr(tracing, "TRACE_PROFILE", "sample")
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", 0)
+    monkeypatch.setattr(tracing, "TRACE_SAMPLE_MS", 2)
+
+    def unrelated_busy_work():
+        end = time.monotonic() + 0.15
+        while time.monotonic() < end:
+            pass
+
+    def traced_work():
+        with tracing.span("rerank"):
+            time.sleep(0.1)
+
+    with ThreadPoolExecutor(2) as pool:
+        other = pool.submit(unrelated_busy_work)
+        with tracing.start_trace("ws_stream") as root:
+            time.sleep(0.02)  # the root's own thread is not inside a span
+            pool.submit(copy_context().run, traced_work).result()
+        other.result()
+    tracing.flush()
+
+    profile = root.attrs["profile"]
+    stacks = profile.splitlines()[1:]
+    assert stacks and all("[rerank]" in line for line in stacks)
+    assert "unrelated_busy_work" not in profile
+
+
+def test_jsonl_sink_rotates_by_size(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACE_SINK", "jsonl")
+    monkeypatch.setattr(tracing, "TRACE_PATH", str(path))
+    monkeypatch.setattr(tracing, "TRACE_MAX_BYTES", 1)
+    monkeypatch.setattr(tracing, "TRACE_BACKUPS", 2)
+    for n in range(4):
+        with tracing.start_trace("ws_stream", trace_id=f"t{n}"):
+            pass
+        tracing.flush()
+
+    ids = lambda p: [json.loads(line)["trace_id"] for line in p.read_text().splitlines()]
+    assert ids(path) == ["t3"]
+    assert ids(tmp_path / "traces.jsonl.1") == ["t2"] and ids(tmp_path / "traces.jsonl.2") == ["t1"]
+    assert not (tmp_path / "traces.jsonl.3").exists()
+
+
+def test_sqlite_sink_prunes_spans_past_retention(tmp_path, monkeypatch):
+    from ..agents import db
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tr.db"))
+    monkeypatch.setattr(tracing, "TRACE_SINK", "sqlite")
+    monkeypatch.setattr(tracing, "TRACE_RETENTION_S", 60)
+    monkeypatch.setattr(tracing, "TRACE_PRUNE_S", 0)
+    with tracing.start_trace("old", trace_id="old") as root:
+        root.start_ts -= 3600
+    tracing.flush()
+    with tracing.start_trace("new", trace_id="new"):
+        pass
+    tracing.flush()
+    assert db.query("SELECT DISTINCT trace_id FROM trace_spans") == [("new",)]
+    db.close_all()
+
+
+def test_full_export_queue_drops_and_counts(monkeypatch):
+    import queue
+    monkeypatch.setattr(tracing, "TRACE_SINK", "jsonl")
+    monkeypatch.setattr(tracing, "_export_q", queue.Queue(maxsize=1))
+    monkeypatch.setattr(tracing, "_exporter", object())  # no consumer: the queue stays full
+    before = tracing.dropped
+    for n in range(3):
+        with tracing.start_trace("ws_stream"):
+            pass
+    assert tracing.dropped - before == 2 and tracing._export_q.qsize() == 1
@@ -0,0 +1,327 @@
+"""Per-request trace spans with a local JSONL/SQLite sink and an opt-in profiler.
+
+A trace is opened per request with ``start_trace`` (its id is the request id)
+and ``span`` nests timed sections under it through context variables, so
+spans follow the request into worker threads that run under a copied
+context. Outside a trace ``span`` costs one ContextVar lookup. Finished
+traces are exported by a background thread when TRACE_SINK is set; the queue
+is bounded and drops (and counts) traces it cannot keep up with. The JSONL
+file rotates at TRACE_MAX_BYTES, and the SQLite sink deletes spans older
+than TRACE_RETENTION_S.
+
+TRACE_PROFILE=cprofile|sample attaches a cProfile summary or aggregated
+stack samples to the root span of requests slower than TRACE_SLOW_MS.
+"""
+import os, io, sys, json, time, uuid, queue, pstats, cProfile, threading, functools, logging, traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from backend.metrics import TRACES_DROPPED
+
+logger = logging.getLogger("backend.tracing")
+
+TRACE_SINK = os.getenv("TRACE_SINK", "off")   # off | jsonl | sqlite
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(os.path.dirname(__file__), "logs", "traces.jsonl"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(64 * 1024 * 1024)))  # rotate traces.jsonl past this size
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "3"))                      # rotated files kept (.1 is newest)
+TRACE_RETENTION_S = float(os.getenv("TRACE_RETENTION_S", str(7 * 24 * 3600)))  # sqlite sink
+TRACE_PRUNE_S = float(os.getenv("TRACE_PRUNE_S", "300"))                  # how often the retention DELETE runs
+TRACE_QUEUE_MAX = int(os.getenv("TRACE_QUEUE_MAX", "1000"))               # finished traces awaiting export
+TRACE_PROFILE = os.getenv("TRACE_PROFILE", "off")   # off | cprofile | sample
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "2000"))
+TRACE_SAMPLE_MS = float(os.getenv("TRACE_SAMPLE_MS", "5"))
+
+REQUEST_ID_CTX: ContextVar[str] = ContextVar("request_id", default="-")
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS trace_spans (
+      trace_id TEXT NOT NULL,
+      span_id TEXT NOT NULL,
+      parent_id TEXT,
+      name TEXT NOT NULL,
+      start_ts REAL NOT NULL,
+      duration_ms REAL NOT NULL,
+      thread TEXT,
+      attrs TEXT,
+      error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_trace_spans_trace ON trace_spans(trace_id)",
+    "CREATE INDEX IF NOT EXISTS idx_trace_spans_start ON trace_spans(start_ts)",
+)
+INSERT_SQL = "INSERT INTO trace_spans(trace_id,span_id,parent_id,name,start_ts,duration_ms,thread,attrs,error) VALUES (?,?,?,?,?,?,?,?,?)"
+PRUNE_SQL = "DELETE FROM trace_spans WHERE start_ts < ?"
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ts", "t0", "duration_ms", "thread", "attrs", "error")
+
+    def __init__(self, trace: "_Trace", name: str, parent_id: Optional[str], attrs: Dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ts = time.time()
+        self.t0 = time.perf_counter()
+        self.duration_ms = 0.0
+        self.thread = threading.current_thread().name
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self.t0) * 1000
+        self.trace.add(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start_ts": self.start_ts, "duration_ms": round(self.duration_ms, 3),
+            "thread": self.thread, "attrs": self.attrs, "error": self.error,
+        }
+
+
+class _Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+        self.profile: Optional[str] = None
+
+    def add(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+
+
+_CURRENT: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+# thread ident -> innermost span open on that thread. Only ``span`` (synchronous
+# sections) registers here, never the async root, so the event-loop thread and
+# idle pool threads are not attributed to any request by the sampler.
+_THREAD_SPANS: Dict[int, Span] = {}
+
+
+def current_span() -> Optional[Span]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a section as a child of the current span (no-op outside a trace)."""
+    parent = _CURRENT.get()
+    if parent is None:
+        yield None
+        return
+    sp = Span(parent.trace, name, parent.span_id, attrs)
+    token = _CURRENT.set(sp)
+    ident = threading.get_ident()
+    outer = _THREAD_SPANS.get(ident)
+    _THREAD_SPANS[ident] = sp
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if outer is None:
+            _THREAD_SPANS.pop(ident, None)
+        else:
+            _THREAD_SPANS[ident] = outer
+        _CURRENT.reset(token)
+        sp.finish()
+
+
+def traced(name: str):
+    """Decorator form of ``span``."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def child_span(name: str, **attrs) -> Optional[Span]:
+    """Start a span that does not become current (for generators); call .finish()."""
+    parent = _CURRENT.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, attrs)
+
+
+# ---------------------------
+# Profiling of slow requests
+# ---------------------------
+class _Sampler(threading.Thread):
+    """Every TRACE_SAMPLE_MS, samples the threads currently inside one of the trace's spans.
+
+    Each stack is tagged with the span it was taken in, so work of other
+    requests sharing the event loop or a pool thread never lands in the profile.
+    """
+
+    def __init__(self, trace: _Trace):
+        super().__init__(name="trace-sampler", daemon=True)
+        self.trace = trace
+        self.stop_evt = threading.Event()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+    def run(self):
+        me = threading.get_ident()
+        while not self.stop_evt.wait(TRACE_SAMPLE_MS / 1000):
+            active = [(ident, sp) for ident, sp in _THREAD_SPANS.copy().items()
+                      if sp.trace is self.trace and ident != me]
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, sp in active:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = traceback.extract_stack(frame, limit=12)
+                where = " <- ".join(f"{f.name}@{os.path.basename(f.filename)}:{f.lineno}" for f in reversed(stack))
+                self.stacks[f"[{sp.name}] {where}"] += 1
+                self.samples += 1
+
+    def report(self, top: int = 15) -> str:
+        lines = [f"{self.samples} samples every {TRACE_SAMPLE_MS:g}ms"]
+        lines += [f"{n:6d}  {stack}" for stack, n in self.stacks.most_common(top)]
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiled():
+    """cProfile this thread for the current trace when TRACE_PROFILE=cprofile."""
+    sp = _CURRENT.get()
+    if TRACE_PROFILE != "cprofile" or sp is None:
+        yield
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(25)
+        sp.trace.profile = out.getvalue()
+
+
+# ---------------------------
+# Traces and export
+# ---------------------------
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, **attrs):
+    """Open a trace with a root span; exported when the block exits."""
+    trace = _Trace(trace_id or uuid.uuid4().hex[:16])
+    root = Span(trace, name, None, attrs)
+    token = _CURRENT.set(root)
+    sampler = None
+    if TRACE_PROFILE == "sample":
+        sampler = _Sampler(trace)
+        sampler.start()
+    try:
+        yield root
+    except BaseException as e:
+        root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _CURRENT.reset(token)
+        if sampler is not None:
+            sampler.stop_evt.set()
+            sampler.join(timeout=1)
+        root.finish()
+        if root.duration_ms >= TRACE_SLOW_MS:
+            root.attrs["slow"] = True
+            if sampler is not None:
+                root.attrs["profile"] = sampler.report()
+            elif trace.profile:
+                root.attrs["profile"] = trace.profile
+        export(trace)
+
+
+_export_q: "queue.Queue" = queue.Queue(maxsize=TRACE_QUEUE_MAX)
+_exporter: Optional[threading.Thread] = None
+_exporter_lock = threading.Lock()
+_schema_ready = set()
+_pruned_at: Dict[str, float] = {}  # DB_PATH -> monotonic time of the last retention DELETE
+dropped = 0  # traces dropped on a full export queue (also traces_dropped_total)
+
+
+def _rotate(path: str):
+    """traces.jsonl -> .1 -> .2 ... keeping TRACE_BACKUPS files."""
+    for n in range(TRACE_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{path}.{n}"):
+            os.replace(f"{path}.{n}", f"{path}.{n + 1}")
+    if TRACE_BACKUPS > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+
+
+def _write(spans: List[Dict]):
+    if TRACE_SINK == "sqlite":
+        from backend.agents import db
+        path = db.DB_PATH
+        if path not in _schema_ready:
+            for stmt in SCHEMA:
+                db.execute(stmt)
+            _schema_ready.add(path)
+        db.executemany(INSERT_SQL, [
+            (s["trace_id"], s["span_id"], s["parent_id"], s["name"], s["start_ts"], s["duration_ms"],
+             s["thread"], json.dumps(s["attrs"], default=str), s["error"])
+            for s in spans
+        ])
+        now = time.monotonic()
+        if now - _pruned_at.get(path, float("-inf")) >= TRACE_PRUNE_S:
+            _pruned_at[path] = now
+            n = db.execute(PRUNE_SQL, (time.time() - TRACE_RETENTION_S,))
+            if n:
+                logger.info("Pruned %d trace spans older than %ss", n, TRACE_RETENTION_S)
+    else:
+        os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+        try:
+            if os.path.getsize(TRACE_PATH) >= TRACE_MAX_BYTES:
+                _rotate(TRACE_PATH)
+        except FileNotFoundError:
+            pass
+        with open(TRACE_PATH, "a") as f:
+            for s in spans:
+                f.write(json.dumps(s, default=str) + "\n")
+
+
+def _export_loop():
+    while True:
+        spans = _export_q.get()
+        try:
+            _write(spans)
+        except Exception as e:
+            logger.warning("Trace export failed (%d spans): %s", len(spans), e)
+        finally:
+            _export_q.task_done()
+
+
+def export(trace: _Trace):
+    global _exporter, dropped
+    if TRACE_SINK == "off":
+        return
+    with trace.lock:
+        spans = [s.to_dict() for s in sorted(trace.spans, key=lambda s: s.start_ts)]
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = threading.Thread(target=_export_loop, name="trace-exporter", daemon=True)
+            _exporter.start()
+    try:
+        _export_q.put_nowait(spans)
+    except queue.Full:
+        # never block a request on the sink; a burst past the queue bound is counted instead
+        with _exporter_lock:
+            dropped += 1
+        TRACES_DROPPED.inc()
+
+
+def flush():
+    """Block until every finished trace has been written."""
+    _export_q.join()